@@ -0,0 +1,271 @@
+# Standard library imports
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import random
+from string import Template
+import threading
+import time
+import urllib.parse as urlparse
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+SEARCH_ID = '123456789'
+PAGE_SIZE = 10
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+POSTCODES = (('Islington', 'N1'), ('Hackney', 'E8'), ('Camden', 'NW1'),
+             ('Brixton', 'SW2'), ('Peckham', 'SE15'), ('Shoreditch', 'E2'))
+ROOM_TYPES = ('double', 'single', 'double', 'ensuite')
+
+
+def _load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as fixture:
+        return Template(fixture.read())
+
+
+def advert_fields(advert_id):
+    """ Get the made up, but stable, details of an advert. """
+
+    area, postcode = POSTCODES[advert_id % len(POSTCODES)]
+    room_type = ROOM_TYPES[advert_id % len(ROOM_TYPES)]
+    weekly = advert_id % 7 == 0
+
+    return {
+        'advert_id': advert_id,
+        'title': '{} room in {}'.format(room_type.capitalize(), area),
+        'area': area,
+        'postcode': postcode,
+        'room_type': room_type,
+        'rent': 150 + advert_id % 10 * 10 if weekly else 500 + advert_id % 16 * 50,
+        'period': 'pw' if weekly else 'pcm',
+        'available': 'Now' if advert_id % 3 else '1 Dec 2030',
+        'bills': 'Yes' if advert_id % 2 == 0 else 'No',
+        'days_ago': advert_id % 30,
+    }
+
+
+class MockSpareroom:
+    """ A local stand-in for spareroom, serving the recorded
+        pages in benchmarks/fixtures.
+
+        It follows the parts of spareroom's behaviour the scraper
+        relies on: search.pl redirects to the first page of a new
+        search_id, pages past the end redirect to the last page,
+        unknown search ids redirect away from the search, and
+        advert pages answer conditional requests with a 304.
+
+        Every response can be delayed, and a share of them can be
+        replaced by an error, to see how the scraper copes.
+    """
+
+    def __init__(self, total_results=200, latency=0.0, error_rate=0.0, error_status=503,
+                 seed=0, host='127.0.0.1', port=0):
+        """ Args:
+                total_results: The number of adverts every search finds.
+                latency: Seconds to wait before answering each request.
+                error_rate: The share of requests answered with error_status.
+                error_status: The status code of the injected errors.
+                seed: Seeds the error injection, for repeatable runs.
+                host: The interface to listen on.
+                port: The port to listen on. 0 picks a free one.
+        """
+
+        self.total_results = total_results
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._page = _load_fixture('search_results.html')
+        self._listing = _load_fixture('listing.html')
+        self._advert = _load_fixture('advert.html')
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """ The domain to hand to Search, with a trailing slash. """
+
+        host, port = self._server.server_address[:2]
+
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def serve_forever(self):
+        """ Serve in the calling thread, until interrupted. """
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def advert_id(self, position):
+        """ The id of the advert at a position of the results, newest first. """
+
+        return 10000000 + self.total_results - position
+
+    def render_page(self, offset):
+        """ Render the page of results starting at offset. """
+
+        last = min(offset + PAGE_SIZE, self.total_results)
+        listings = []
+
+        for position in range(offset, last):
+            fields = advert_fields(self.advert_id(position))
+            fields['search_id'] = SEARCH_ID
+            listings.append(self._listing.substitute(fields))
+
+        return self._page.substitute(location='London', search_id=SEARCH_ID,
+                                     first=offset + 1, last=last, total=self.total_results,
+                                     previous_offset=max(offset - PAGE_SIZE, 0),
+                                     next_offset=offset + PAGE_SIZE,
+                                     listings='\n'.join(listings))
+
+    def render_advert(self, advert_id):
+        """ Render the page of an advert. """
+
+        return self._advert.substitute(advert_fields(advert_id))
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes, don't let
+            # Nagle's algorithm hold the body back
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if mock.latency:
+                    time.sleep(mock.latency)
+
+                url = urlparse.urlparse(self.path)
+                query = urlparse.parse_qs(url.query)
+
+                if mock._should_fail():
+                    mock._count('error')
+                    return self._send(mock.error_status, 'Injected error',
+                                      [('Retry-After', '0')])
+
+                if url.path == '/flatshare/search.pl':
+                    mock._count('search')
+                    return self._redirect('/flatshare/?search_id={}&mode=list'.format(SEARCH_ID))
+
+                if url.path == '/flatshare/':
+                    return self._results_page(query)
+
+                if url.path == '/flatshare/flatshare_detail.pl':
+                    return self._advert_page(query)
+
+                mock._count('not_found')
+                self._send(404, 'Not found')
+
+            def _results_page(self, query):
+                search_id = query.get('search_id', [None])[0]
+
+                if search_id is None:
+                    mock._count('home')
+                    return self._send(200, '<html><body><h1>Rooms for rent</h1></body></html>')
+
+                if search_id != SEARCH_ID:
+                    mock._count('expired')
+                    return self._redirect('/flatshare/')
+
+                offset = int(query.get('offset', ['0'])[0])
+                last_offset = max(mock.total_results - 1, 0) // PAGE_SIZE * PAGE_SIZE
+
+                if offset > last_offset:
+                    mock._count('past_the_end')
+                    return self._redirect(
+                        '/flatshare/?offset={}&search_id={}&sort_by=days_since_placed&mode=list'
+                        .format(last_offset, SEARCH_ID))
+
+                mock._count('page')
+                self._send(200, mock.render_page(offset))
+
+            def _advert_page(self, query):
+                mock._count('advert')
+
+                if self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+                    return self._send(304, '', [('Last-Modified', LAST_MODIFIED)])
+
+                advert_id = int(query['flatshare_id'][0])
+                self._send(200, mock.render_advert(advert_id), [('Last-Modified', LAST_MODIFIED)])
+
+            def _redirect(self, location):
+                self._send(302, '', [('Location', location)])
+
+            def _send(self, status, body, headers=()):
+                content = body.encode('utf-8')
+
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.mock_server',
+        description='Serve the recorded spareroom pages locally. Set domain in '
+                    'scraper_config.ini to the printed url to scrape it.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--results', type=int, default=200,
+                        help='number of adverts every search finds')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before answering each request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of the requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    arguments = parse_arguments()
+    mock = MockSpareroom(total_results=arguments.results, latency=arguments.latency,
+                         error_rate=arguments.error_rate, error_status=arguments.error_status,
+                         port=arguments.port)
+
+    print('Serving spareroom on {}'.format(mock.url))
+
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,339 @@
+# Standard library imports
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Local imports
+from benchmarks.mock_server import MockSpareroom, PAGE_SIZE
+from spareroomScraper.advert import Advert
+from spareroomScraper.advert_details import parse_advert_details
+from spareroomScraper.parsers import PARSER_BACKENDS, get_parser
+from spareroomScraper.politeness import PolitenessScheduler
+from spareroomScraper.ranking import AdvertRanker
+from spareroomScraper.search import ADVERTS_URLS_SELECTOR, Search
+from spareroomScraper.sinks import Sink
+from spareroomScraper.transport import Transport
+
+
+PAYLOAD_CONFIG = 'spareroomScraper/conf/payload_config.ini'
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+DEFAULT_PAGES = 20
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_RECORDS = 1000000
+RANKED_RECORDS = 100000
+PARSE_ROUNDS = 200
+
+
+class CountingSink(Sink):
+    """ A sink that only counts the results, so that
+        the benchmark measures the search and nothing else.
+    """
+
+    def __init__(self):
+        self.results = 0
+
+    def write(self, result):
+        self.results += 1
+
+
+def _unlimited_transport():
+    """ A Transport that never waits for the politeness
+        scheduler and caches nothing, so that the search
+        runs as fast as the mock server allows.
+    """
+
+    return Transport(scheduler=PolitenessScheduler(rate=1e6, burst=1e6))
+
+
+def run_search(mock, pages, filter_adverts=False):
+    """ Run a whole search against the mock server.
+
+        Args:
+            mock: A running MockSpareroom.
+            pages: The number of pages to pull.
+            filter_adverts: Whether every advert page is fetched too.
+
+        Returns:
+            The number of results.
+    """
+
+    sink = CountingSink()
+
+    # The payload prints every item it sends
+    with redirect_stdout(io.StringIO()):
+        search = Search(PAYLOAD_CONFIG, pages, PAGE_SIZE, transport=_unlimited_transport(),
+                        filter_adverts=filter_adverts, domain=mock.url)
+        search.search(sinks=[sink])
+
+    return sink.results
+
+
+def measure_throughput(mock, pages, repeat, filter_adverts=False):
+    """ Get the best number of results per second over a few searches. """
+
+    best = 0.0
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = run_search(mock, pages, filter_adverts)
+        best = max(best, results / (time.perf_counter() - start))
+
+    return best
+
+
+def measure_parse(function, repeat):
+    """ Get the best time in milliseconds a function takes, per call. """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(PARSE_ROUNDS):
+            function()
+        elapsed = (time.perf_counter() - start) / PARSE_ROUNDS * 1000
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def measure_memory(mock, pages):
+    """ Get the peak memory a search allocates, in KiB. """
+
+    tracemalloc.start()
+
+    try:
+        run_search(mock, pages)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / 1024
+
+
+def measure_advert_memory(records):
+    """ Get the memory a city's worth of adverts takes, in bytes
+        per advert, the way dedup and ranking would hold them.
+        Every field is built afresh, like parsing would, so the
+        strings adverts share are only shared if Advert does it.
+    """
+
+    tracemalloc.start()
+
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+
+        adverts = [Advert('conf/{}.ini'.format('london'), 10000000 + number,
+                          'https://www.spareroom.co.uk/flatshare/flatshare_detail.pl'
+                          '?flatshare_id={}'.format(10000000 + number),
+                          rent=str(400 + number % 1200),
+                          available_from='2026-{:02d}-{:02d}'.format(number % 12 + 1,
+                                                                     number % 28 + 1),
+                          bills_included=number % 2 == 0,
+                          room_type='{}le'.format(('doub', 'sing')[number % 2]),
+                          postcode='E{}'.format(number % 20))
+                   for number in range(records)]
+
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return (after - before) / len(adverts)
+
+
+def measure_ranking(repeat):
+    """ Get the best time in milliseconds it takes to rank
+        RANKED_RECORDS historical adverts, and to score them
+        once their fields are in columns.
+    """
+
+    adverts = [Advert('conf/london.ini', number, 'advert {}'.format(number),
+                      rent=None if number % 10 == 0 else 400 + number * 7 % 1200,
+                      available_from=None if number % 7 == 0 else
+                      '2026-{:02d}-{:02d}'.format(number % 12 + 1, number % 28 + 1),
+                      bills_included=(None, True, False)[number % 3],
+                      postcode='E{}'.format(number % 20))
+               for number in range(RANKED_RECORDS)]
+
+    ranker = AdvertRanker(payload={'search': 'E1 6AN', 'max_rent': '1000', 'per': 'pcm'})
+    columns = ranker.columns(adverts)
+
+    rank_ms = score_ms = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ranker.rank(adverts)
+        elapsed = (time.perf_counter() - start) * 1000
+        rank_ms = elapsed if rank_ms is None else min(rank_ms, elapsed)
+
+        start = time.perf_counter()
+        ranker.scores(columns)
+        elapsed = (time.perf_counter() - start) * 1000
+        score_ms = elapsed if score_ms is None else min(score_ms, elapsed)
+
+    return rank_ms, score_ms
+
+
+def run_benchmarks(pages=DEFAULT_PAGES, repeat=DEFAULT_REPEAT, latency=0.0,
+                   records=DEFAULT_RECORDS):
+    """ Run every benchmark.
+
+        Args:
+            pages: The number of pages each search pulls.
+            repeat: How many times each benchmark runs. The best run counts.
+            latency: Seconds the mock server waits before each answer.
+            records: The number of adverts held by the memory benchmark.
+
+        Returns:
+            A dictionary of metric names to {'value', 'higher_is_better'}.
+    """
+
+    results = {}
+
+    with MockSpareroom(total_results=pages * PAGE_SIZE, latency=latency) as mock:
+        results['search_results_per_second'] = {
+            'value': measure_throughput(mock, pages, repeat),
+            'higher_is_better': True}
+        results['filtered_search_results_per_second'] = {
+            'value': measure_throughput(mock, pages, repeat, filter_adverts=True),
+            'higher_is_better': True}
+        results['search_peak_memory_kib'] = {
+            'value': measure_memory(mock, pages),
+            'higher_is_better': False}
+
+        page = mock.render_page(0).encode('utf-8')
+        advert = mock.render_advert(mock.advert_id(0)).encode('utf-8')
+
+    for backend, parser_class in sorted(PARSER_BACKENDS.items()):
+        if parser_class is None:
+            continue
+
+        parser = get_parser(backend)
+        results['parse_page_ms_' + backend] = {
+            'value': measure_parse(lambda: parser.select_links(page, ADVERTS_URLS_SELECTOR),
+                                   repeat),
+            'higher_is_better': False}
+
+    results['parse_advert_ms'] = {
+        'value': measure_parse(lambda: parse_advert_details(advert), repeat),
+        'higher_is_better': False}
+
+    rank_ms, score_ms = measure_ranking(repeat)
+    results['rank_100k_adverts_ms'] = {'value': rank_ms, 'higher_is_better': False}
+    results['score_100k_adverts_ms'] = {'value': score_ms, 'higher_is_better': False}
+
+    if records:
+        results['advert_record_bytes'] = {
+            'value': measure_advert_memory(records),
+            'higher_is_better': False}
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Compare a run against the baseline.
+
+        Args:
+            results: The metrics of this run.
+            baseline: The metrics of the baseline.
+            tolerance: How much worse than the baseline a metric
+                       can get, as a share of it, e.g. 0.2 for 20%.
+
+        Returns:
+            A list of (metric, baseline value, value, change) tuples,
+            one for every metric that regressed.
+    """
+
+    regressions = []
+
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+
+        expected = baseline[name]['value']
+        change = (result['value'] - expected) / expected if expected else 0.0
+
+        if not result['higher_is_better']:
+            change = -change
+
+        if change < -tolerance:
+            regressions.append((name, expected, result['value'], change))
+
+    return regressions
+
+
+def print_results(results, baseline):
+    print('{:40} {:>14} {:>14} {:>9}'.format('metric', 'baseline', 'this run', 'change'))
+
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name, {}).get('value')
+
+        if expected:
+            change = '{:+.1%}'.format((result['value'] - expected) / expected)
+        else:
+            change = ''
+
+        print('{:40} {:>14} {:>14.3f} {:>9}'.format(
+            name, '' if expected is None else '{:.3f}'.format(expected),
+            result['value'], change))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the scraper against a local stand-in for spareroom '
+                    'and compare the results with benchmarks/baseline.json.')
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES,
+                        help='number of pages each search pulls')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of runs of each benchmark, the best one counts')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the mock server waits before each answer')
+    parser.add_argument('--records', type=int, default=DEFAULT_RECORDS,
+                        help='number of adverts held by the memory benchmark, 0 to skip it')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='how much worse than the baseline a metric can get, '
+                             'e.g. 0.2 for 20%%')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='the baseline file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    arguments = parse_arguments()
+
+    results = run_benchmarks(arguments.pages, arguments.repeat, arguments.latency,
+                             arguments.records)
+
+    try:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    except FileNotFoundError:
+        baseline = {}
+
+    print_results(results, baseline)
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('Saved the baseline to {}'.format(arguments.baseline))
+        sys.exit(0)
+
+    regressions = compare(results, baseline, arguments.tolerance)
+
+    for name, expected, value, change in regressions:
+        print('REGRESSION {}: {:.3f} -> {:.3f} ({:.1%} worse)'.format(
+            name, expected, value, -change))
+
+    sys.exit(1 if regressions else 0)
@@ -1,15 +1,329 @@
 # Standard library imports
-import sys
+import argparse
+import signal
+import time
 
 # Local imports
+from spareroomScraper.advert_details import AdvertDetailsCache
+from spareroomScraper.advert_store import AdvertStore
+from spareroomScraper.async_search import AsyncSearchEngine, DEFAULT_CONCURRENCY
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.emailer import MailDispatcher
+from spareroomScraper.metrics import Metrics
+from spareroomScraper.parsers import get_parser
+from spareroomScraper.payload_cache import PayloadCache
+from spareroomScraper.ranking import AdvertRanker
+from spareroomScraper.run_journal import RunJournal
+from spareroomScraper.scheduler import SearchScheduler
 from spareroomScraper.search import Search
+from spareroomScraper.search_id_cache import SearchIdCache
+from spareroomScraper.selector_monitor import SelectorMonitor
+from spareroomScraper.sharding import ShardedSweep
+from spareroomScraper.seen_adverts import SeenAdverts
+from spareroomScraper.sinks import (AdvertStoreSink, CsvSink, EmailDigestSink, FileSink,
+                                    JsonLinesSink, WebhookSink)
+from spareroomScraper.sweep import has_sweep
+from spareroomScraper.transport import Transport
+from spareroomScraper.work_queue import WorkQueue
+
+SCRAPER_CONFIG = 'spareroomScraper/conf/scraper_config.ini'
+EMAILER_CONFIG = 'spareroomScraper/conf/emailer_config.ini'
+NUMBER_OF_PAGES = 1
+OFFSET = 20
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(prog='bin/scrape')
+    parser.add_argument('configs', metavar='config', nargs='*',
+                        help='payload config file(s). More than one, or one with a [sweep] '
+                             'section, runs the searches concurrently')
+    parser.add_argument('--daemon', metavar='DIRECTORY',
+                        help='keep running, searching with every config file in DIRECTORY '
+                             'on its own schedule. Changes to the directory are picked up '
+                             'while running')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='maximum number of requests in flight when running many configs')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='split the configs across this many processes, sharing the '
+                             'request budget, and deliver every advert once')
+    parser.add_argument('--new-only', action='store_true',
+                        help='only report the adverts that previous runs have not reported')
+    parser.add_argument('--filter', action='store_true',
+                        help='fetch every advert and check it against the search criteria')
+    parser.add_argument('--sink', dest='sinks', action='append', metavar='SINK',
+                        help='where to send the results: email (the default), jsonl[:path], '
+                             'csv[:path] or webhook:url. Can be given more than once')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='number of results the jsonl, csv and webhook sinks deliver at once')
+    parser.add_argument('--flush-interval', type=float, default=None,
+                        help='maximum number of seconds the jsonl, csv and webhook sinks '
+                             'hold results back for')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='write the timers and counters of the run to a JSON file')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='write the timers and counters of the run in the Prometheus '
+                             'text format, e.g. for the node exporter textfile collector')
+
+    arguments = parser.parse_args()
+
+    if not arguments.configs and not arguments.daemon:
+        parser.error('give at least one config file, or --daemon')
+
+    return arguments
+
+
+def build_shared_sinks(arguments):
+    """ Create the sinks that all the searches write to. """
+
+    sinks = []
+    thresholds = {}
+
+    if arguments.batch_size is not None:
+        thresholds['batch_size'] = arguments.batch_size
+    if arguments.flush_interval is not None:
+        thresholds['flush_interval'] = arguments.flush_interval
+
+    for spec in arguments.sinks or ['email']:
+        kind, _, target = spec.partition(':')
+
+        if kind == 'email':
+            continue
+        elif kind in ('jsonl', 'csv'):
+            sink_class = JsonLinesSink if kind == 'jsonl' else CsvSink
+            if target:
+                sinks.append(FileSink(sink_class, target, **thresholds))
+            else:
+                sinks.append(sink_class(**thresholds))
+        elif kind == 'webhook' and target:
+            sinks.append(WebhookSink(target, **thresholds))
+        else:
+            raise SystemExit('Unknown sink: ' + spec)
+
+    return sinks
+
+
+def sinks_factory(shared_sinks, dispatcher):
+    """ Get a function that gives every search its sinks.
+        Each search adds its own section to the email digests,
+        if they are wanted.
+    """
+
+    def sinks_for(search):
+        sinks = list(shared_sinks)
+
+        if dispatcher is not None:
+            # The best matches for the search come first
+            ranker = AdvertRanker.from_config(SCRAPER_CONFIG, search.advanced_search_payload)
+            # Coalesced searches share a section, and there is no point
+            # in an empty one when only new adverts are wanted
+            sinks.append(EmailDigestSink(dispatcher, title=', '.join(search.subscribers),
+                                         send_empty=search.seen_adverts is None, ranker=ranker))
+
+        return sinks
+
+    return sinks_for
+
+
+def write_metrics(metrics, arguments):
+    """ Export the metrics to the files asked for, if any. """
+
+    if arguments.metrics_json:
+        with open(arguments.metrics_json, 'w') as metrics_file:
+            metrics_file.write(metrics.to_json())
+
+    if arguments.metrics_prom:
+        with open(arguments.metrics_prom, 'w') as metrics_file:
+            metrics_file.write(metrics.to_prometheus())
+
+
+def print_failures(outcomes):
+    for config_file, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            print('{}: failed with {!r}'.format(config_file, outcome))
+
+
+def run_sharded(arguments, shared_sinks, dispatcher, metrics):
+    """ Run the searches across processes, then deliver their
+        results with every advert found by many searches once.
+    """
+
+    sweep = ShardedSweep(SCRAPER_CONFIG, WorkQueue.from_config(SCRAPER_CONFIG), arguments.shards,
+                         concurrency=arguments.concurrency, filter_adverts=arguments.filter,
+                         new_only=arguments.new_only, metrics=metrics)
+
+    outcomes = sweep.run(arguments.configs, NUMBER_OF_PAGES, OFFSET)
+
+    print_failures(outcomes)
+
+    # Every search gets its own section in the email digests. The payloads
+    # stayed with the shards, so the rents are ranked against each other
+    ranker = AdvertRanker.from_config(SCRAPER_CONFIG)
+    digests = {}
+    if dispatcher is not None:
+        for config_file in arguments.configs:
+            digests[config_file] = EmailDigestSink(dispatcher, title=config_file,
+                                                   send_empty=not arguments.new_only,
+                                                   ranker=ranker)
+
+    delivered = 0
+
+    for result in sweep.results():
+        delivered += 1
+
+        for sink in shared_sinks:
+            sink.write(result)
+
+        # The variants of a sweep get a section each
+        if dispatcher is not None and result.search not in digests:
+            digests[result.search] = EmailDigestSink(dispatcher, title=result.search,
+                                                     send_empty=False, ranker=ranker)
+
+        if result.search in digests:
+            digests[result.search].write(result)
+
+    for sink in shared_sinks + list(digests.values()):
+        sink.flush()
+
+    found = sum(outcome for outcome in outcomes.values() if not isinstance(outcome, Exception))
+    metrics.increment('duplicate_adverts_total', max(found - delivered, 0))
+
+    print('adverts found: {}, delivered once each: {}'.format(found, delivered))
+
+
+def run_daemon(arguments, engine, shared_sinks, dispatcher, sinks_for, metrics):
+    """ Run the searches of a directory of config files on their
+        schedules, until interrupted. Everything created for the
+        run (the transport, caches, parser and sinks) is reused
+        by every search.
+    """
+
+    def run_searches(config_files):
+        try:
+            outcomes = engine.run(config_files, NUMBER_OF_PAGES, OFFSET, sinks_factory=sinks_for)
+        finally:
+            for sink in shared_sinks:
+                sink.flush()
+
+        print_failures(outcomes)
+
+        if dispatcher is not None:
+            # The connection would go stale until the next run
+            with dispatcher:
+                dispatcher.dispatch()
+
+        write_metrics(metrics, arguments)
+
+        return outcomes
+
+    scheduler = SearchScheduler.from_config(SCRAPER_CONFIG, arguments.daemon, run_searches)
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+    print('scheduled runs: {}, failed: {}'.format(scheduler.runs, scheduler.failures))
+
 
 if __name__ == "__main__":
 
-    if len(sys.argv) != 2:
-        print('usage: bin/scrape <config>')
-        sys.exit(0)
+    arguments = parse_arguments()
+    metrics = Metrics()
+    run_started = time.perf_counter()
+    scraper_config = ConfigLoader(SCRAPER_CONFIG)
+    search_id_cache = SearchIdCache.from_config(SCRAPER_CONFIG)
+    seen_adverts = SeenAdverts.from_config(SCRAPER_CONFIG) if arguments.new_only else None
+    parser = get_parser(scraper_config.get_item('parser_backend'))
+    details_cache = AdvertDetailsCache.from_config(SCRAPER_CONFIG)
+    payload_cache = PayloadCache.from_config(SCRAPER_CONFIG)
+    journal = RunJournal.from_config(SCRAPER_CONFIG)
+    selector_monitor = SelectorMonitor.from_config(SCRAPER_CONFIG, metrics=metrics)
+    shared_sinks = build_shared_sinks(arguments)
+    advert_store = AdvertStore.from_config(SCRAPER_CONFIG)
+    if advert_store is not None:
+        shared_sinks.append(AdvertStoreSink(
+            advert_store, batch_size=scraper_config.get_int('advert_store_batch_size')))
+    # One connection and one digest per recipient for the whole run
+    dispatcher = (MailDispatcher.from_config(EMAILER_CONFIG, metrics=metrics)
+                  if 'email' in (arguments.sinks or ['email']) else None)
+    sinks_for = sinks_factory(shared_sinks, dispatcher)
+
+    with Transport.from_config(SCRAPER_CONFIG, metrics=metrics) as transport:
+        if arguments.shards and not arguments.daemon:
+            # The shards have transports of their own
+            run_sharded(arguments, shared_sinks, dispatcher, metrics)
+        elif (len(arguments.configs) == 1 and not arguments.daemon and
+              not has_sweep(arguments.configs[0])):
+            # Perform a new search
+            new_search = Search(arguments.configs[0], NUMBER_OF_PAGES, OFFSET, transport=transport,
+                                prefetch_workers=scraper_config.get_int('prefetch_workers'),
+                                search_id_cache=search_id_cache,
+                                seen_adverts=seen_adverts,
+                                parser=parser,
+                                filter_adverts=arguments.filter,
+                                details_cache=details_cache,
+                                detail_workers=scraper_config.get_int('detail_workers'),
+                                payload_cache=payload_cache,
+                                domain=scraper_config.get_item('domain'),
+                                journal=journal,
+                                stream_pages=scraper_config.get_boolean('stream_pages'),
+                                selector_monitor=selector_monitor)
+            new_search.search(sinks_for(new_search))
+        else:
+            # Perform all the searches concurrently
+            engine = AsyncSearchEngine(transport, concurrency=arguments.concurrency,
+                                       search_id_cache=search_id_cache,
+                                       seen_adverts=seen_adverts,
+                                       parser=parser,
+                                       filter_adverts=arguments.filter,
+                                       details_cache=details_cache,
+                                       payload_cache=payload_cache,
+                                       domain=scraper_config.get_item('domain'),
+                                       journal=journal,
+                                       stream_pages=scraper_config.get_boolean('stream_pages'),
+                                       selector_monitor=selector_monitor,
+                                       max_sweep_variants=scraper_config.get_int(
+                                           'max_sweep_variants'))
+
+            if arguments.daemon:
+                run_daemon(arguments, engine, shared_sinks, dispatcher, sinks_for, metrics)
+            else:
+                outcomes = engine.run(arguments.configs, NUMBER_OF_PAGES, OFFSET,
+                                      sinks_factory=sinks_for)
+
+                print_failures(outcomes)
+
+        stats = transport.stats.as_dict()
+        print('requests: {requests}, new connections: {new_connections}, '
+              'reused connections: {reused_connections}'.format(**stats))
+
+        if transport.cache is not None:
+            print('cache hits: {hits}, revalidated: {revalidations}, '
+                  'misses: {misses}'.format(**transport.cache.as_dict()))
+
+        # The shards count their own, see the metrics
+        if selector_monitor.hit_rates():
+            print(selector_monitor.summary())
+
+    for sink in shared_sinks:
+        sink.close()
+
+    if advert_store is not None:
+        advert_store.close()
+
+    if journal is not None:
+        journal.close()
+
+    if dispatcher is not None:
+        with dispatcher:
+            dispatcher.dispatch()
+
+        print('emails sent: {sent}, retried: {retried}, '
+              'smtp connections: {connections}'.format(**dispatcher.as_dict()))
+
+    metrics.observe('run_seconds', time.perf_counter() - run_started)
+
+    print(metrics.summary())
 
-    # Perform a new search
-    new_search = Search(sys.argv[1], 1, 20)
-    new_search.search()
+    write_metrics(metrics, arguments)
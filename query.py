@@ -0,0 +1,134 @@
+# Standard library imports
+import argparse
+import datetime
+
+# Local imports
+from spareroomScraper.advert_store import AdvertStore
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.parsers import get_parser
+from spareroomScraper.payload import compile_payload
+from spareroomScraper.ranking import AdvertRanker
+from spareroomScraper.selector_monitor import SelectorMonitor
+
+SCRAPER_CONFIG = 'spareroomScraper/conf/scraper_config.ini'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(prog='bin/query',
+                                     description='Query the adverts earlier searches have found')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    recent = commands.add_parser('recent', help='the adverts first seen over the last few days')
+    recent.add_argument('--days', type=float, default=1)
+    recent.add_argument('--limit', type=int, default=50)
+
+    rents = commands.add_parser('rents', help='min, median and max rent per postcode district')
+    rents.add_argument('--days', type=float, default=30)
+    rents.add_argument('--postcode', help='only this postcode district, e.g. N1')
+
+    best = commands.add_parser('best', help='the adverts seen over the last few days that '
+                                            'best match a search, best first')
+    best.add_argument('config', nargs='?', help='the payload config file of the search. '
+                                                'Without it, rents are ranked against each other')
+    best.add_argument('--days', type=float, default=30)
+    best.add_argument('--limit', type=int, default=20)
+
+    advert = commands.add_parser('advert', help='everything we know about an advert')
+    advert.add_argument('advert_id', type=int)
+
+    commands.add_parser('stats', help='the size of the store')
+
+    selectors = commands.add_parser('selectors', help='try the selectors in scraper_config.ini '
+                                                      'on the pages saved when none matched')
+    selectors.add_argument('pages', nargs='*', help='the saved pages. Defaults to all of them')
+
+    return parser.parse_args()
+
+
+def replay_selectors(pages):
+    """ Report which selector, if any, matches each saved page. """
+
+    monitor = SelectorMonitor.from_config(SCRAPER_CONFIG)
+    parser = get_parser(ConfigLoader(SCRAPER_CONFIG).get_item('parser_backend'))
+
+    replayed = 0
+
+    for path, field, selector, links in monitor.replay(parser, pages or None):
+        replayed += 1
+
+        if selector is None:
+            print('{}: none of the {} selectors match'.format(path, field))
+        else:
+            print('{}: {} links with {}'.format(path, links, selector))
+
+    if not replayed:
+        print('No saved pages to replay')
+
+
+def format_time(timestamp):
+    if timestamp is None:
+        return '-'
+
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+if __name__ == "__main__":
+
+    arguments = parse_arguments()
+
+    # The saved pages have nothing to do with the store
+    if arguments.command == 'selectors':
+        replay_selectors(arguments.pages)
+        raise SystemExit(0)
+
+    store = AdvertStore.from_config(SCRAPER_CONFIG)
+
+    if store is None:
+        raise SystemExit('The advert store is disabled in ' + SCRAPER_CONFIG)
+
+    if arguments.command == 'recent':
+        print('{:>10}  {:16}  {:>6}  {:8}  {}'.format('advert', 'first seen', 'rent', 'postcode', 'url'))
+        for advert_id, first_seen, rent, postcode, url in store.recent(arguments.days, arguments.limit):
+            print('{:>10}  {:16}  {:>6}  {:8}  {}'.format(advert_id, format_time(first_seen),
+                                                         rent if rent is not None else '-',
+                                                         postcode or '-', url))
+
+    elif arguments.command == 'rents':
+        print('{:8}  {:>7}  {:>6}  {:>8}  {:>6}'.format('postcode', 'adverts', 'min', 'median', 'max'))
+        for postcode, adverts, minimum, middle, maximum in store.rents_by_postcode(
+                arguments.days, arguments.postcode):
+            print('{:8}  {:>7}  {:>6}  {:>8.0f}  {:>6}'.format(postcode, adverts, minimum,
+                                                             middle, maximum))
+
+    elif arguments.command == 'best':
+        payload = compile_payload(arguments.config).as_dict() if arguments.config else None
+        ranker = AdvertRanker.from_config(SCRAPER_CONFIG, payload)
+
+        print('{:>10}  {:>6}  {:10}  {:5}  {:8}  {}'.format('advert', 'rent', 'available',
+                                                        'bills', 'postcode', 'url'))
+        for advert in ranker.rank(store.adverts(arguments.days))[:arguments.limit]:
+            print('{:>10}  {:>6}  {:10}  {:5}  {:8}  {}'.format(
+                advert.advert_id, advert.rent if advert.rent is not None else '-',
+                advert.available_from or '-',
+                '-' if advert.bills_included is None else 'yes' if advert.bills_included else 'no',
+                advert.postcode or '-', advert.url))
+
+    elif arguments.command == 'advert':
+        advert = store.get(arguments.advert_id)
+
+        if advert is None:
+            raise SystemExit('Advert {} has not been seen'.format(arguments.advert_id))
+
+        for field in ('first_seen', 'last_seen'):
+            advert[field] = format_time(advert[field])
+
+        for field, value in advert.items():
+            print('{:15} {}'.format(field, value))
+
+    elif arguments.command == 'stats':
+        stats = store.stats()
+        print('adverts: {}, first seen: {}, last seen: {}'.format(
+            stats['adverts'], format_time(stats['first_seen']), format_time(stats['last_seen'])))
+
+    store.close()
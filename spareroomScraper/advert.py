@@ -0,0 +1,149 @@
+# Standard library imports
+import json
+import re
+import sys
+import urllib.parse as urlparse
+
+
+# The advert id is the flatshare_id parameter of the advert url,
+# or the trailing number of its path in the newer url format.
+ADVERT_ID_PARAMETER = 'flatshare_id'
+ADVERT_ID_PATH_PATTERN = re.compile(r'/(\d+)/?$')
+
+
+def get_advert_id(url):
+    """ Get the id of an advert from its url.
+
+        Args:
+            url: The url of the advert.
+
+        Returns:
+            The advert id as an integer, or None if it can't be found.
+    """
+
+    parsed_url = urlparse.urlparse(url)
+    url_parameters = urlparse.parse_qs(parsed_url.query)
+
+    advert_id = url_parameters.get(ADVERT_ID_PARAMETER, [None])[0]
+
+    if advert_id is None:
+        match = ADVERT_ID_PATH_PATTERN.search(parsed_url.path)
+        advert_id = match.group(1) if match else None
+
+    if advert_id is None or not advert_id.isdigit():
+        return None
+
+    return int(advert_id)
+
+
+# The fields of an advert, in the order they are exported
+ADVERT_FIELDS = ('search', 'advert_id', 'url', 'rent', 'available_from',
+                 'bills_included', 'room_type', 'postcode')
+# The fields parsed from the advert page, see parse_advert_details
+DETAIL_FIELDS = ADVERT_FIELDS[3:]
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+def _to_int(value):
+    return int(value) if value is not None else None
+
+
+class Advert:
+    """ The record of an advert found by a search, as it goes
+        through the pipeline: from the result page, through the
+        filter, to the store and the sinks.
+
+        A whole city's worth of adverts can be held at once, so
+        it is kept small: no instance dictionary, rents as plain
+        integers and the strings many adverts share (the search,
+        postcode, room type and availability date) interned, so
+        that there is a single copy of each.
+    """
+
+    __slots__ = ADVERT_FIELDS
+
+    def __init__(self, search, advert_id, url, rent=None, available_from=None,
+                 bills_included=None, room_type=None, postcode=None):
+        """ Args:
+                search: The name of the search that found the advert.
+                advert_id: The id of the advert, or None if its url has none.
+                url: The url of the advert.
+                rent: The rent per month, in pounds.
+                available_from: The date it is available from, in ISO format.
+                bills_included: Whether the bills are included in the rent.
+                room_type: The type of the room, e.g. double.
+                postcode: The postcode district, e.g. EC1M.
+        """
+
+        self.search = _intern(search)
+        self.advert_id = _to_int(advert_id)
+        self.url = url
+        self.rent = _to_int(rent)
+        self.available_from = _intern(available_from)
+        self.bills_included = bills_included
+        self.room_type = _intern(room_type)
+        self.postcode = _intern(postcode)
+
+    @classmethod
+    def from_dict(cls, fields):
+        """ Create an Advert from a dictionary, e.g. one read back
+            from JSON. Unknown keys are ignored.
+
+            Args:
+                fields: A dictionary with any of the ADVERT_FIELDS.
+
+            Returns:
+                An Advert object.
+        """
+
+        return cls(*[fields.get(name) for name in ADVERT_FIELDS])
+
+    @property
+    def key(self):
+        """ What tells adverts apart: the advert id, or the url
+            for the odd advert without one.
+        """
+
+        return self.advert_id if self.advert_id is not None else self.url
+
+    def details(self):
+        """ Get the parsed fields, in the order of DETAIL_FIELDS. """
+
+        return tuple(getattr(self, name) for name in DETAIL_FIELDS)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in ADVERT_FIELDS)
+
+    def as_dict(self):
+        """ Get the advert in a dictionary format, e.g. to dump to JSON. """
+
+        return dict(zip(ADVERT_FIELDS, self.as_tuple()))
+
+    def to_json(self):
+        return json.dumps(self.as_tuple())
+
+    @classmethod
+    def from_json(cls, text):
+        fields = json.loads(text)
+
+        # Written as a dictionary before adverts had a record of their own
+        if isinstance(fields, dict):
+            return cls.from_dict(fields)
+
+        return cls(*fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, Advert):
+            return NotImplemented
+
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return 'Advert({})'.format(', '.join(
+            '{}={!r}'.format(name, value) for name, value in self.as_dict().items()))
@@ -0,0 +1,252 @@
+# Standard library imports
+import datetime
+from html.parser import HTMLParser
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+PRICE_CLASS = 'room-list__price'
+ROOM_CLASS = 'room-list__room'
+KEY_FEATURE_CLASS = 'key-features__feature'
+
+PRICE_PATTERN = re.compile(r'£\s*([\d,]+)\s*(pcm|pw)', re.IGNORECASE)
+# The room types a search can ask for. Ensuite says nothing
+# about the size of the room, an 'Ensuite double' is a double
+ROOM_TYPES = ('double', 'single')
+ROOM_TYPE_PATTERN = re.compile(r'\b({})\b'.format('|'.join(ROOM_TYPES)), re.IGNORECASE)
+POSTCODE_PATTERN = re.compile(r'\b([A-Z]{1,2}\d[A-Z\d]?)(?:\s*\d[A-Z]{2})?\b')
+
+# Weekly prices are turned into monthly ones, like spareroom does
+WEEKS_PER_MONTH = 52 / 12
+
+
+class _DetailsExtractor(HTMLParser):
+    """ Collects the bits of an advert page we care about:
+        the room prices and types, the key features and
+        the definition lists (Available, Bills included? etc.)
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+
+        self.prices = []
+        self.rooms = []
+        self.key_features = []
+        self.definitions = {}
+        self._capturing = []
+        self._last_term = None
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+
+        if PRICE_CLASS in classes:
+            self._capturing.append([tag, self.prices, []])
+        elif ROOM_CLASS in classes:
+            self._capturing.append([tag, self.rooms, []])
+        elif KEY_FEATURE_CLASS in classes:
+            self._capturing.append([tag, self.key_features, []])
+        elif tag in ('dt', 'dd'):
+            self._capturing.append([tag, None, []])
+
+    def handle_data(self, data):
+        for capture in self._capturing:
+            capture[2].append(data)
+
+    def handle_endtag(self, tag):
+        if not self._capturing or self._capturing[-1][0] != tag:
+            return
+
+        _, target, parts = self._capturing.pop()
+        text = ' '.join(''.join(parts).split())
+
+        if tag == 'dt' and target is None:
+            self._last_term = text.rstrip(':?').lower()
+        elif tag == 'dd' and target is None:
+            if self._last_term is not None:
+                self.definitions.setdefault(self._last_term, text)
+                self._last_term = None
+        else:
+            target.append(text)
+
+
+def _parse_available_from(text, today=None):
+    """ Turn the 'Available' value of an advert into a date. """
+
+    today = today or datetime.date.today()
+
+    if not text or text.lower().startswith('now'):
+        return today
+
+    for date_format in ('%d %b %Y', '%d %B %Y', '%d/%m/%Y'):
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+
+    return None
+
+
+def parse_advert_details(content, today=None):
+    """ Parse the structured fields out of an advert page.
+
+        Args:
+            content: The HTML of the advert page, as bytes or text.
+            today: The date 'Available: Now' stands for.
+
+        Returns:
+            A dictionary with the rent (per month, in pounds),
+            available_from (an ISO date), bills_included,
+            room_type (double or single) and postcode. Fields
+            that couldn't be found are None.
+    """
+
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+
+    extractor = _DetailsExtractor()
+    extractor.feed(content)
+    extractor.close()
+
+    # The cheapest room decides whether the advert is affordable
+    rents = []
+    for price in extractor.prices + extractor.rooms:
+        match = PRICE_PATTERN.search(price)
+        if match:
+            amount = int(match.group(1).replace(',', ''))
+            if match.group(2).lower() == 'pw':
+                amount = int(round(amount * WEEKS_PER_MONTH))
+            rents.append(amount)
+
+    room_type = None
+    for text in extractor.rooms + extractor.key_features:
+        match = ROOM_TYPE_PATTERN.search(text)
+        if match:
+            room_type = match.group(1).lower()
+            break
+
+    postcode = None
+    for text in extractor.key_features:
+        match = POSTCODE_PATTERN.search(text)
+        if match:
+            postcode = match.group(1)
+            break
+
+    bills = extractor.definitions.get('bills included')
+    available_from = _parse_available_from(extractor.definitions.get('available'), today)
+
+    return {
+        'rent': min(rents) if rents else None,
+        'available_from': available_from.isoformat() if available_from else None,
+        'bills_included': None if bills is None else bills.lower().startswith('yes'),
+        'room_type': room_type,
+        'postcode': postcode,
+    }
+
+
+class AdvertDetailsCache:
+    """ A class that keeps the parsed details of the adverts
+        we have already fetched, in a small SQLite database.
+
+        Entries are keyed by advert id and remember the
+        Last-Modified header of the page, so it can be
+        revalidated with a conditional request instead of
+        being downloaded and parsed again.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """ Open (or create) the cache database.
+
+            Args:
+                path: The path to the SQLite file.
+                max_age: The number of seconds the details of an
+                         advert are trusted for without asking
+                         spareroom whether the page has changed.
+        """
+
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The shards of a sweep share the file, wait for each other's writes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS advert_details ('
+                '    advert_id INTEGER PRIMARY KEY,'
+                '    last_modified TEXT,'
+                '    fetched_at REAL NOT NULL,'
+                '    details TEXT NOT NULL'
+                ')')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create an AdvertDetailsCache from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                An AdvertDetailsCache object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('details_cache'),
+                   max_age=config_loader.get_int('details_max_age'))
+
+    def get(self, advert_id):
+        """ Look up the details of an advert.
+
+            Args:
+                advert_id: The id of the advert.
+
+            Returns:
+                A (details, last_modified, fresh) tuple, where fresh
+                tells whether the entry is recent enough to be used
+                without revalidation, or None if it is unknown.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT details, last_modified, fetched_at FROM advert_details '
+                'WHERE advert_id = ?', (advert_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        details, last_modified, fetched_at = row
+
+        return json.loads(details), last_modified, time.time() - fetched_at <= self.max_age
+
+    def set(self, advert_id, details, last_modified):
+        """ Remember the details of an advert.
+
+            Args:
+                advert_id: The id of the advert.
+                details: The dictionary returned by parse_advert_details.
+                last_modified: The Last-Modified header of the page, if any.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO advert_details '
+                '(advert_id, last_modified, fetched_at, details) VALUES (?, ?, ?, ?)',
+                (advert_id, last_modified, time.time(), json.dumps(details)))
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,80 @@
+# Standard library imports
+import datetime
+
+# Local imports
+from spareroomScraper.advert_details import ROOM_TYPES, WEEKS_PER_MONTH
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdvertFilter:
+    """ A class that applies the search criteria of a payload
+        to the parsed details of an advert.
+
+        Spareroom filters are not very accurate, so we check
+        the rent, the bills, the room type and the availability
+        again on our side. A field the advert page didn't give
+        us never rules an advert out.
+    """
+
+    def __init__(self, payload):
+        """ Set up the predicates from the search criteria.
+
+            Args:
+                payload: The advanced search payload in a dictionary format.
+        """
+
+        self.predicates = []
+
+        rent_factor = WEEKS_PER_MONTH if payload.get('per') == 'pw' else 1
+        min_rent = _to_int(payload.get('min_rent'))
+        max_rent = _to_int(payload.get('max_rent'))
+
+        if min_rent is not None:
+            self._add('rent', lambda rent: rent >= min_rent * rent_factor)
+
+        if max_rent is not None:
+            self._add('rent', lambda rent: rent <= max_rent * rent_factor)
+
+        if payload.get('bills_inc') == 'Yes':
+            self._add('bills_included', lambda bills_included: bills_included)
+
+        # Only rule out the other room type, details cached before
+        # ensuite stopped being one can still say 'ensuite'
+        room_types = payload.get('room_types')
+        if room_types:
+            self._add('room_type',
+                      lambda room_type: room_type == room_types or room_type not in ROOM_TYPES)
+
+        if payload.get('available_search') == 'Y':
+            wanted_by = datetime.date(int(payload['year_avail']),
+                                      int(payload['month_avail']),
+                                      int(payload['day_avail']))
+            self._add('available_from',
+                      lambda available_from: datetime.date(*map(int, available_from.split('-'))) <= wanted_by)
+
+    def _add(self, field, predicate):
+        self.predicates.append((field, predicate))
+
+    def matches(self, advert):
+        """ Check the details of an advert against the search criteria.
+
+            Args:
+                advert: An Advert, with the details of its page.
+
+            Returns:
+                True if the advert should be kept.
+        """
+
+        for field, predicate in self.predicates:
+            value = getattr(advert, field)
+
+            if value is not None and not predicate(value):
+                return False
+
+        return True
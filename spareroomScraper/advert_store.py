@@ -0,0 +1,238 @@
+# Standard library imports
+from itertools import groupby
+import os
+import sqlite3
+from statistics import median
+import threading
+import time
+
+# Local imports
+from spareroomScraper.advert import Advert, DETAIL_FIELDS
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DAY = 24 * 60 * 60
+
+
+class AdvertStore:
+    """ A class that keeps a record of every advert our searches
+        have found, in a SQLite database, so that the results
+        can be queried later without scraping again.
+
+        Every advert is stored once, with the first and last
+        time it was seen and the latest details we parsed for
+        it. Adverts are added in batches, one transaction each.
+    """
+
+    def __init__(self, path):
+        """ Open (or create) the database.
+
+            Args:
+                path: The path to the SQLite file.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+        # Readers (bin/query) don't block the scrape, and
+        # a batch costs one fsync at most
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS adverts ('
+                '    advert_id INTEGER PRIMARY KEY,'
+                '    url TEXT NOT NULL,'
+                '    search TEXT,'
+                '    first_seen REAL NOT NULL,'
+                '    last_seen REAL NOT NULL,'
+                '    times_seen INTEGER NOT NULL DEFAULT 1,'
+                '    rent INTEGER,'
+                '    available_from TEXT,'
+                '    bills_included INTEGER,'
+                '    room_type TEXT,'
+                '    postcode TEXT'
+                ')')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS adverts_first_seen ON adverts (first_seen)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS adverts_last_seen ON adverts (last_seen)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS adverts_rent ON adverts (rent)')
+            # Covers rents_by_postcode, so it never touches the table
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS adverts_postcode ON adverts (postcode, rent, last_seen)')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create an AdvertStore from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                An AdvertStore object, or None if the store is disabled.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        path = config_loader.get_item('advert_store')
+
+        if not path:
+            return None
+
+        return cls(path)
+
+    def add(self, results, seen_at=None):
+        """ Record a batch of search results.
+
+            Adverts we already know about get their last_seen
+            time bumped, and their details updated with any
+            field this batch has parsed.
+
+            Args:
+                results: An iterable of Advert objects, as produced
+                         by Search.results(). Adverts without an
+                         advert id are skipped.
+                seen_at: The time the results were found. Defaults to now.
+
+            Returns:
+                The number of results recorded.
+        """
+
+        seen_at = seen_at if seen_at is not None else time.time()
+
+        rows = [(result.advert_id, result.url, result.search, seen_at) + result.details()
+                for result in results if result.advert_id is not None]
+
+        if not rows:
+            return 0
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO adverts '
+                '(advert_id, url, search, first_seen, last_seen, times_seen, ' +
+                ', '.join(DETAIL_FIELDS) + ') '
+                'VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)',
+                [row[:4] + row[3:] for row in rows])
+            self._connection.executemany(
+                'UPDATE adverts SET url = ?, search = ?, last_seen = ?, '
+                'times_seen = times_seen + 1, ' +
+                ', '.join('{0} = COALESCE(?, {0})'.format(field) for field in DETAIL_FIELDS) +
+                ' WHERE advert_id = ?',
+                [row[1:] + row[:1] for row in rows])
+
+        return len(rows)
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def get(self, advert_id):
+        """ Look up an advert.
+
+            Args:
+                advert_id: The id of the advert.
+
+            Returns:
+                A dictionary with everything we know about
+                the advert, or None if we have never seen it.
+        """
+
+        with self._lock:
+            cursor = self._connection.execute(
+                'SELECT * FROM adverts WHERE advert_id = ?', (advert_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+
+        return dict(zip(columns, row)) if row is not None else None
+
+    def recent(self, days=1, limit=50):
+        """ Get the adverts first seen over the last few days, newest first.
+
+            Args:
+                days: How many days to look back.
+                limit: The maximum number of adverts.
+
+            Returns:
+                A list of (advert_id, first_seen, rent, postcode, url) tuples.
+        """
+
+        return self._query(
+            'SELECT advert_id, first_seen, rent, postcode, url FROM adverts '
+            'WHERE first_seen >= ? ORDER BY first_seen DESC LIMIT ?',
+            (time.time() - days * DAY, limit))
+
+    def adverts(self, days=30):
+        """ Get the adverts seen over the last few days.
+
+            Args:
+                days: How many days to look back.
+
+            Returns:
+                A list of Advert objects, most recently seen first.
+        """
+
+        rows = self._query(
+            'SELECT search, advert_id, url, ' + ', '.join(DETAIL_FIELDS) + ' FROM adverts '
+            'WHERE last_seen >= ? ORDER BY last_seen DESC', (time.time() - days * DAY,))
+
+        return [Advert(search, advert_id, url, rent, available_from,
+                       None if bills_included is None else bool(bills_included),
+                       room_type, postcode)
+                for search, advert_id, url, rent, available_from, bills_included, room_type, postcode
+                in rows]
+
+    def rents_by_postcode(self, days=30, postcode=None):
+        """ Get the rents of the adverts seen over the last few days,
+            per postcode district.
+
+            Args:
+                days: How many days to look back.
+                postcode: Only report this postcode district.
+
+            Returns:
+                A list of (postcode, adverts, min, median, max) tuples,
+                ordered by postcode. Rents are per month, in pounds.
+        """
+
+        sql = ('SELECT postcode, rent FROM adverts '
+               'WHERE last_seen >= ? AND rent IS NOT NULL AND postcode IS NOT NULL')
+        parameters = [time.time() - days * DAY]
+
+        if postcode is not None:
+            sql += ' AND postcode = ?'
+            parameters.append(postcode.upper())
+
+        # The postcode index hands the rents over sorted
+        rows = self._query(sql + ' ORDER BY postcode, rent', parameters)
+
+        summary = []
+        for postcode, group in groupby(rows, key=lambda row: row[0]):
+            rents = [rent for _, rent in group]
+            summary.append((postcode, len(rents), rents[0], median(rents), rents[-1]))
+
+        return summary
+
+    def stats(self):
+        """ Get the size and time span of the store.
+
+            Returns:
+                A dictionary with the number of adverts and
+                the first and last time anything was seen.
+        """
+
+        adverts, first_seen, last_seen = self._query(
+            'SELECT COUNT(*), MIN(first_seen), MAX(last_seen) FROM adverts')[0]
+
+        return {'adverts': adverts, 'first_seen': first_seen, 'last_seen': last_seen}
+
+    def close(self):
+        self._connection.close()
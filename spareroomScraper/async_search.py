@@ -0,0 +1,634 @@
+# Standard library imports
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Local imports
+from spareroomScraper.advert import Advert
+from spareroomScraper.coalescer import AdvertDeduplicator, SearchGroup, plan_searches
+from spareroomScraper.payload import payload_key
+from spareroomScraper.politeness import PolitenessScheduler
+from spareroomScraper.search import DOMAIN, Search
+from spareroomScraper.sweep import DEFAULT_MAX_VARIANTS, PayloadSweep, has_sweep
+from spareroomScraper.transport import Transport
+
+
+DEFAULT_CONCURRENCY = 8
+
+
+class AsyncSearch(Search):
+    """ An asyncio counterpart of the Search class.
+
+        The search id is resolved and the result pages are
+        fetched from within an event loop, so that many searches
+        can run side by side. The blocking requests are handed
+        to a thread pool, while waiting for the politeness
+        scheduler happens in the event loop.
+
+        Instances are normally created and driven by an
+        AsyncSearchEngine, which owns the shared executor
+        and the global concurrency cap.
+    """
+
+    def __init__(self, config_file, number_of_pages, offset, transport, executor, semaphore,
+                 **kwargs):
+        """ Initialise the payload. The search_id is resolved
+            later on, by awaiting resolve().
+
+            Args:
+                config_file: The path to the config file.
+                number_of_pages: The number of pages to scrape.
+                offset: The number of results per page.
+                transport: The Transport object to send the requests with.
+                executor: The executor that runs the blocking requests.
+                semaphore: An asyncio.Semaphore capping the requests in flight.
+                kwargs: Any of the other Search options.
+        """
+
+        self.executor = executor
+        self.semaphore = semaphore
+
+        super().__init__(config_file, number_of_pages, offset, transport=transport, **kwargs)
+
+    def _get_initial_search_id(self):
+        if self.checkpoint is not None:
+            return self._resumed_search_id()
+
+        # The search id is resolved in the event loop
+        return None
+
+    async def _fetch(self, url, payload=None, stream=False):
+        """ Make a request to a specific endpoint without
+            blocking the event loop.
+
+            Args:
+                url: The endpoint url
+                payload: The payload in a dict format
+                stream: Whether the body is left to be read later.
+
+            Returns:
+                response: A requests.Response object.
+
+            Raises:
+                Raises stored HTTPError, if one occurred.
+        """
+
+        loop = asyncio.get_event_loop()
+
+        with self.metrics.timer('stage_seconds', stage='request'):
+            response = self.transport.cached(url, payload)
+
+            if response is not None:
+                return response
+
+            async with self.semaphore:
+                # Wait for our turn in the shared politeness budget. Only
+                # once the request is about to be sent, so that a request
+                # that is queued and then cancelled spends nothing.
+                delay = self.transport.scheduler.reserve(PolitenessScheduler.host_of(url))
+                self.metrics.observe('politeness_wait_seconds', delay)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                response = await loop.run_in_executor(self.executor, self.transport.send,
+                                                      url, payload, None, stream)
+
+        # Raise any HTTP status errors
+        if not response.ok:
+            response.close()
+        response.raise_for_status()
+
+        return response
+
+    async def _fetch_page(self, offset):
+        """ Request a page of results without blocking the event loop.
+            A streamed page is read in the thread pool.
+
+            Args:
+                offset: The offset of the first result of the page.
+
+            Returns:
+                response: A requests.Response object, or a PageStream
+                          if the pages are streamed.
+        """
+
+        response = await self._fetch(self.search_endpoint, self._page_payload(offset),
+                                     stream=self.stream_pages)
+
+        if not self.stream_pages:
+            return response
+
+        loop = asyncio.get_event_loop()
+
+        return await loop.run_in_executor(self.executor, self._stream_page(response).read)
+
+    def _get_page_adverts_urls(self, response):
+        # This runs in the thread pool, so is every page read
+        adverts_urls = super()._get_page_adverts_urls(response)
+
+        return list(adverts_urls) if adverts_urls is not None else None
+
+    async def resolve(self):
+        """ Get the search id for this specific search.
+
+            The search id cache is checked first, if there is one.
+        """
+
+        with self.metrics.timer('stage_seconds', stage='search_id'):
+            search_id = self._get_cached_search_id()
+
+            if search_id is None:
+                response = await self._fetch(self.advanced_search_endpoint,
+                                             self.advanced_search_payload)
+                search_id = self._cache_search_id(self._parse_search_id(response))
+                self.metrics.increment('search_ids_total', source='spareroom')
+            else:
+                self.metrics.increment('search_ids_total', source='cache')
+
+        self.search_id = search_id
+
+    async def _pull_pages_async(self):
+        """ Pull a number of pages from the results of the search.
+
+            The first page is fetched on its own. It tells us how
+            many results there are, so the rest of the pages that
+            exist are then fetched all at once. They are still
+            yielded in order and we stop as soon as a page repeats
+            the previous one.
+
+            When only new adverts are wanted, the pages are fetched
+            one by one, since we expect to stop after a page or two.
+            So are they when the first page doesn't say how many
+            results there are.
+
+            Yields:
+                response: A requests.Response object
+        """
+
+        offsets = list(self._page_offsets())
+
+        if not offsets:
+            return
+
+        first_page = await self._fetch_page(offsets[0])
+
+        if self._drop_stale_search_id(first_page):
+            await self.resolve()
+            first_page = await self._fetch_page(offsets[0])
+
+        previous_url = first_page.url
+
+        yield first_page
+
+        remaining_offsets = self._remaining_offsets(first_page)
+
+        if remaining_offsets is None:
+            # We don't know where the results end. Pull the
+            # pages one after another until they start repeating.
+            async for response in self._pull_pages_serially_async(offsets[1:], previous_url):
+                yield response
+            return
+
+        if self.seen_adverts is not None:
+            async for response in self._pull_pages_serially_async(remaining_offsets,
+                                                                  previous_url):
+                yield response
+            return
+
+        tasks = [asyncio.ensure_future(self._fetch_page(i)) for i in remaining_offsets]
+
+        try:
+            for task in tasks:
+                response = await task
+
+                # If response.url is the same as the url of the
+                # previous request, then there are no more pages.
+                if previous_url == response.url:
+                    break
+                else:
+                    previous_url = response.url
+
+                yield response
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _pull_pages_serially_async(self, offsets, previous_url=''):
+        """ Pull pages one after another.
+
+            Args:
+                offsets: The offsets of the pages to pull.
+                previous_url: The url of the page pulled before these.
+
+            Yields:
+                response: A requests.Response object
+        """
+
+        for i in offsets:
+            response = await self._fetch_page(i)
+
+            # If response.url is the same as the url of the
+            # previous request, then there are no more pages.
+            if previous_url == response.url:
+                break
+            else:
+                previous_url = response.url
+
+            yield response
+
+    async def results(self):
+        """ Perform the search.
+
+            Yields:
+                result: An Advert for every advert that matches
+                        the search criteria, as soon as it arrives.
+        """
+
+        loop = asyncio.get_event_loop()
+
+        if self.search_id is None:
+            await self.resolve()
+
+        for result in self._resumed_results():
+            if not self._is_duplicate(result):
+                self.metrics.increment('results_total')
+                yield result
+
+        page_number = 0
+
+        async for response in self._pull_pages_async():
+            page_number += 1
+            self.page_advert_ids = []
+
+            # Parsing is CPU bound, keep it out of the event loop
+            adverts_urls = await loop.run_in_executor(
+                self.executor, self._get_page_adverts_urls, response)
+
+            # Nothing new from here on
+            if adverts_urls is None:
+                break
+
+            # Advert pages are fetched in the thread pool too
+            with self.metrics.timer('stage_seconds', stage='filter_adverts'):
+                matches = await asyncio.gather(
+                    *[loop.run_in_executor(self.executor, self._filter_advert, advert_url)
+                      for advert_url in adverts_urls])
+
+            page_results = []
+
+            for advert_url, match in zip(adverts_urls, matches):
+                if match:
+                    result = self._make_result(advert_url)
+                    page_results.append(result)
+
+                    if not self._is_duplicate(result):
+                        self.metrics.increment('results_total')
+                        yield result
+
+            # The rest of the pages can't be read either
+            if self.markup_changed:
+                break
+
+            await loop.run_in_executor(
+                self.executor, self._save_checkpoint,
+                self.start_offset + page_number*self.offset, page_results, self.page_advert_ids)
+
+        # Every page has been handled, a rerun only has to deliver the
+        # results. A resume that pulled nothing leaves the checkpoint
+        # as it was, so that it still expires.
+        if page_number:
+            await loop.run_in_executor(self.executor, self._save_checkpoint,
+                                       self.number_of_pages*self.offset, [], [])
+
+
+class _VariantSearch:
+    """ Stands in for the search of a sweep variant until its turn
+        comes, with only what plan_searches needs to know about it.
+    """
+
+    __slots__ = ('config_file', 'variant', 'name', 'advanced_search_payload', 'search_key')
+
+    def __init__(self, config_file, variant):
+        self.config_file = config_file
+        self.variant = variant
+        self.name = '{} [{}]'.format(config_file, variant.label)
+        self.advanced_search_payload = variant.compiled.as_dict()
+        self.search_key = payload_key(self.advanced_search_payload)
+
+
+class AsyncSearchEngine:
+    """ A class that runs many searches concurrently in one
+        event loop, one for each payload config file.
+
+        All the searches share one Transport (and with it the
+        connection pool and the politeness budget) and a global
+        cap on the number of requests in flight.
+
+        Overlapping searches are coalesced. Config files with
+        identical payloads are searched once. When the advert
+        pages are read, a search whose payload is subsumed by a
+        broader one is skipped if the broader search pulled every
+        one of its results, and gets the ones that match its own
+        criteria instead. Every advert is delivered once per run,
+        by the first search that finds it, and again to the
+        searches it stood in for.
+    """
+
+    def __init__(self, transport=None, concurrency=DEFAULT_CONCURRENCY, search_id_cache=None,
+                 seen_adverts=None, parser=None, filter_adverts=False, details_cache=None,
+                 payload_cache=None, domain=DOMAIN, journal=None, coalesce=True,
+                 stream_pages=False, selector_monitor=None,
+                 max_sweep_variants=DEFAULT_MAX_VARIANTS):
+        """ Args:
+                transport: The Transport object to send the requests with.
+                           A new one is created if not provided.
+                concurrency: The maximum number of requests in flight.
+                search_id_cache: A SearchIdCache shared by all the searches.
+                seen_adverts: A SeenAdverts store. If provided, every
+                              search only reports its new adverts.
+                parser: The HTML parser backend shared by the searches.
+                filter_adverts: If True, every advert page is fetched and
+                                checked against the search criteria.
+                details_cache: An AdvertDetailsCache shared by the searches.
+                payload_cache: A PayloadCache shared by the searches.
+                domain: The site to search. See Search.
+                journal: A RunJournal shared by the searches. The
+                         checkpoints of a run are only removed once
+                         every search in it has succeeded, so running
+                         the same configs again after a failure only
+                         repeats the work that was not done.
+                coalesce: Whether overlapping searches are coalesced
+                          and the adverts deduplicated across the run.
+                stream_pages: Whether the result pages are streamed.
+                              See Search.
+                selector_monitor: A SelectorMonitor shared by the searches.
+                max_sweep_variants: The most variants a config file can
+                                    sweep through, see PayloadSweep.
+        """
+
+        self.transport = transport if transport is not None else Transport()
+        self.concurrency = concurrency
+        self.search_id_cache = search_id_cache
+        self.seen_adverts = seen_adverts
+        self.parser = parser
+        self.filter_adverts = filter_adverts
+        self.details_cache = details_cache
+        self.payload_cache = payload_cache
+        self.domain = domain
+        self.journal = journal
+        self.coalesce = coalesce
+        self.stream_pages = stream_pages
+        self.selector_monitor = selector_monitor
+        self.max_sweep_variants = max_sweep_variants
+
+    def _create_searches(self, config_file, number_of_pages, offset, executor, semaphore,
+                         deduplicator):
+        """ Create the searches of a config file: one for each of
+            its variants if it describes a sweep, or a single one.
+
+            The searches of the variants are only created when
+            their turn comes (see _run_group), so a big sweep
+            doesn't hold all of them at once.
+
+            Returns:
+                A list of AsyncSearch objects, or of _VariantSearch
+                objects for a sweep.
+        """
+
+        if not has_sweep(config_file):
+            return [self._create_search(config_file, number_of_pages, offset, executor,
+                                        semaphore, deduplicator)]
+
+        sweep = PayloadSweep(config_file, max_variants=self.max_sweep_variants)
+        searches = [_VariantSearch(config_file, variant) for variant in sweep.variants()]
+
+        print('{}: {} of {} variants to search with'.format(config_file, len(searches),
+                                                            len(sweep)))
+
+        return searches
+
+    def _create_search(self, config_file, number_of_pages, offset, executor, semaphore,
+                       deduplicator, variant=None):
+        return AsyncSearch(config_file, number_of_pages, offset,
+                           self.transport, executor, semaphore,
+                           search_id_cache=self.search_id_cache,
+                           seen_adverts=self.seen_adverts,
+                           parser=self.parser,
+                           filter_adverts=self.filter_adverts,
+                           details_cache=self.details_cache,
+                           payload_cache=self.payload_cache,
+                           domain=self.domain,
+                           journal=self.journal,
+                           deduplicator=deduplicator,
+                           variant=variant,
+                           stream_pages=self.stream_pages,
+                           selector_monitor=self.selector_monitor)
+
+    async def _run_group(self, group, finished, executor, sinks_factory, create_search):
+        """ Run the leader of a group of coalesced searches, unless
+            its parent turned out to cover it.
+
+            Returns:
+                The number of results the group delivered.
+        """
+
+        metrics = self.transport.metrics
+
+        try:
+            group.searches = [create_search(search.config_file, search.variant)
+                              if isinstance(search, _VariantSearch) else search
+                              for search in group.searches]
+            group.leader.subscribers = group.names
+
+            if group.parent is not None:
+                await finished[group.parent].wait()
+
+                if group.parent.covered:
+                    print('{} is covered by {}'.format(', '.join(group.names),
+                                                       group.parent.leader.name))
+                    metrics.increment('coalesced_searches_total', len(group.searches),
+                                      reason='subsumed')
+                    results_count = await self._deliver_from_parent(group, executor,
+                                                                    sinks_factory)
+                    await self._complete_runs(group, executor)
+                    return results_count
+
+            if len(group.searches) > 1:
+                metrics.increment('coalesced_searches_total', len(group.searches) - 1,
+                                  reason='identical')
+
+            # The children pick their results out of these
+            kept = group.results if group.children else None
+
+            results_count = await self._run_search(group.leader, executor, sinks_factory, kept)
+            group.covered = group.leader.covers_all_results()
+
+            # The results of the group have reached its sinks, whatever
+            # happens to the other searches of the run
+            await self._complete_runs(group, executor)
+
+            return results_count
+        finally:
+            finished[group].set()
+
+    async def _deliver_from_parent(self, group, executor, sinks_factory):
+        """ Deliver the results of the parent of a group that
+            match the group's own criteria, as if it had been run.
+
+            Returns:
+                The number of results delivered.
+        """
+
+        loop = asyncio.get_event_loop()
+        search = group.leader
+
+        # Delivered on behalf of this search
+        results = [Advert.from_dict(dict(result.as_dict(), search=search.name))
+                   for result in group.parent.results
+                   if search.advert_filter is None or search.advert_filter.matches(result)]
+
+        sinks = sinks_factory(search) if sinks_factory is not None else []
+
+        try:
+            for result in results:
+                await loop.run_in_executor(executor, _write_to_sinks, sinks, result,
+                                           search.metrics)
+        finally:
+            await loop.run_in_executor(executor, _flush_sinks, sinks, search.metrics)
+
+        return len(results)
+
+    async def _complete_runs(self, group, executor):
+        loop = asyncio.get_event_loop()
+
+        for search in group.searches:
+            await loop.run_in_executor(executor, search._complete_run)
+
+    async def _run_search(self, search, executor, sinks_factory, kept=None):
+        loop = asyncio.get_event_loop()
+
+        sinks = sinks_factory(search) if sinks_factory is not None else []
+        results_count = 0
+
+        try:
+            async for result in search.results():
+                results_count += 1
+
+                if kept is not None:
+                    kept.append(result)
+
+                # Sinks may block while delivering a batch
+                await loop.run_in_executor(executor, _write_to_sinks, sinks, result,
+                                           search.metrics)
+        finally:
+            await loop.run_in_executor(executor, _flush_sinks, sinks, search.metrics)
+
+        # Only once the results have been delivered
+        search._mark_adverts_seen()
+
+        return results_count
+
+    async def run_async(self, config_files, number_of_pages, offset, sinks_factory=None):
+        """ Run a search for every config file concurrently.
+
+            Args:
+                config_files: The paths to the payload config files.
+                number_of_pages: The number of pages to scrape per search.
+                offset: The number of results per page.
+                sinks_factory: Called with each AsyncSearch before it
+                               starts. Returns the list of Sink objects
+                               its results are streamed to. The sinks
+                               are flushed when the search is done.
+
+            Returns:
+                A dictionary mapping each config file to either its
+                number of results, or the exception that stopped it.
+                The results of the variants of a sweep are added up,
+                and the first exception of any of them is reported.
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        deduplicator = AdvertDeduplicator() if self.coalesce else None
+        searches = []
+        outcomes = dict((config_file, 0) for config_file in config_files)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for config_file in config_files:
+                try:
+                    searches.extend(self._create_searches(config_file, number_of_pages, offset,
+                                                          executor, semaphore, deduplicator))
+                except Exception as error:
+                    outcomes[config_file] = error
+
+            if self.coalesce:
+                # With only new adverts wanted, a broader search says
+                # nothing about what is new to a narrower one. And the
+                # narrower one can only pick its results out of the
+                # broader one's once the advert pages have been read.
+                groups = plan_searches(searches, allow_subsumption=(
+                    self.seen_adverts is None and self.filter_adverts))
+            else:
+                groups = [SearchGroup([search]) for search in searches]
+
+            finished = dict((group, asyncio.Event()) for group in groups)
+
+            def create_search(config_file, variant):
+                return self._create_search(config_file, number_of_pages, offset, executor,
+                                           semaphore, deduplicator, variant)
+
+            # Only as many groups as requests in flight run at once.
+            # The parents go first, so that a group waiting for its
+            # parent never holds the parent up.
+            queue = deque(sorted(groups, key=lambda group: group.parent is not None))
+            group_outcomes = {}
+
+            async def run_groups():
+                while queue:
+                    group = queue.popleft()
+
+                    try:
+                        group_outcomes[group] = await self._run_group(
+                            group, finished, executor, sinks_factory, create_search)
+                    except Exception as error:
+                        group_outcomes[group] = error
+
+            await asyncio.gather(*[run_groups() for _ in range(self.concurrency)])
+
+        for group in groups:
+            outcome = group_outcomes[group]
+
+            # The configs of a group share its results, the variants
+            # of a sweep coalesced together get them once
+            for config_file in set(search.config_file for search in group.searches):
+                if isinstance(outcomes[config_file], Exception):
+                    continue
+
+                if isinstance(outcome, Exception):
+                    outcomes[config_file] = outcome
+                else:
+                    outcomes[config_file] += outcome
+
+        return dict((config_file, outcomes[config_file]) for config_file in config_files)
+
+    def run(self, config_files, number_of_pages, offset, sinks_factory=None):
+        """ Blocking wrapper around run_async. See run_async for the arguments. """
+
+        loop = asyncio.new_event_loop()
+
+        try:
+            return loop.run_until_complete(
+                self.run_async(config_files, number_of_pages, offset, sinks_factory))
+        finally:
+            loop.close()
+
+
+def _write_to_sinks(sinks, result, metrics):
+    with metrics.timer('stage_seconds', stage='sinks'):
+        for sink in sinks:
+            sink.write(result)
+
+
+def _flush_sinks(sinks, metrics):
+    with metrics.timer('stage_seconds', stage='sinks'):
+        for sink in sinks:
+            sink.flush()
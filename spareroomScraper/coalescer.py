@@ -0,0 +1,184 @@
+# Standard library imports
+from collections import OrderedDict
+import threading
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _at_least(broad, narrow):
+    """ A lower bound that lets through everything the narrow one does. """
+
+    broad, narrow = _to_int(broad), _to_int(narrow)
+
+    return broad is None or (narrow is not None and narrow >= broad)
+
+
+def _at_most(broad, narrow):
+    """ An upper bound that lets through everything the narrow one does. """
+
+    broad, narrow = _to_int(broad), _to_int(narrow)
+
+    return broad is None or (narrow is not None and narrow <= broad)
+
+
+def _any_or_same(broad, narrow):
+    """ A criterion that is either not set or set to the same value. """
+
+    return broad in ('', None) or broad == narrow
+
+
+# The items a payload can narrow down, and how to tell that
+# the broader payload lets through everything it does. Only
+# the ones AdvertFilter checks again on our side, so that the
+# narrower search can pick its results out of the broader ones.
+NARROWING_ITEMS = {
+    'min_rent': _at_least,
+    'max_rent': _at_most,
+    'bills_inc': _any_or_same,
+    'room_types': _any_or_same,
+}
+
+
+def subsumes(broad, narrow):
+    """ Check whether every advert a payload can find is also
+        found by another one. Both have to search the same area
+        the same way, only with looser criteria (rent, bills,
+        room type) on the broad side.
+
+        Args:
+            broad: The broader payload, in a dictionary format.
+            narrow: The narrower payload, in a dictionary format.
+
+        Returns:
+            True if broad finds everything narrow does.
+    """
+
+    if set(broad) != set(narrow):
+        return False
+
+    for name, value in narrow.items():
+        check = NARROWING_ITEMS.get(name)
+
+        if check is None:
+            if broad[name] != value:
+                return False
+        elif not check(broad[name], value):
+            return False
+
+    return True
+
+
+class SearchGroup:
+    """ The searches of a run that share one payload. Only the
+        leader is run, its results stand for the whole group.
+    """
+
+    def __init__(self, searches):
+        self.searches = searches
+        self.parent = None
+        # The groups this one's payload subsumes
+        self.children = []
+        # Whether the leader pulled every one of its results
+        self.covered = False
+        # The results of the leader, kept for the children
+        self.results = []
+
+    @property
+    def leader(self):
+        return self.searches[0]
+
+    @property
+    def names(self):
+        return [search.name for search in self.searches]
+
+
+def plan_searches(searches, allow_subsumption=True):
+    """ Work out which searches of a run actually have to be run.
+
+        Searches with identical payloads are grouped, so that
+        only one of them is run. A group whose payload is
+        subsumed by a broader one gets the broader group as its
+        parent: if the parent turns out to have pulled every
+        one of its results, the group doesn't need running, and
+        gets the results of the parent that match its own
+        criteria instead (see AdvertFilter). Those are only
+        known once the advert pages have been read, so only
+        allow subsumption when they are.
+
+        Args:
+            searches: The Search objects of the run.
+            allow_subsumption: Whether parents are assigned at all.
+
+        Returns:
+            A list of SearchGroup objects, in the order of their leaders.
+    """
+
+    groups = OrderedDict()
+
+    for search in searches:
+        groups.setdefault(search.search_key, []).append(search)
+
+    groups = [SearchGroup(grouped) for grouped in groups.values()]
+
+    if not allow_subsumption:
+        return groups
+
+    def strictly_subsumes(broad, narrow):
+        return (subsumes(broad.leader.advanced_search_payload,
+                         narrow.leader.advanced_search_payload) and
+                not subsumes(narrow.leader.advanced_search_payload,
+                             broad.leader.advanced_search_payload))
+
+    # Broadest first. A root is subsumed by no one, and since
+    # subsumption is transitive, every other group has a root
+    # that subsumes it.
+    roots = [group for group in groups
+             if not any(strictly_subsumes(other, group) for other in groups)]
+
+    for group in groups:
+        if group in roots:
+            continue
+
+        group.parent = next(root for root in roots if strictly_subsumes(root, group))
+        group.parent.children.append(group)
+
+    return groups
+
+
+class AdvertDeduplicator:
+    """ A class that keeps track of the adverts delivered during
+        a run, so that an advert found by many searches is only
+        delivered by the first one. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._claimed = set()
+        self._lock = threading.Lock()
+
+    def claim(self, result):
+        """ Claim the delivery of an advert.
+
+            Args:
+                result: An Advert.
+
+            Returns:
+                True if no other search has delivered the advert yet.
+        """
+
+        key = result.key
+
+        with self._lock:
+            if key in self._claimed:
+                return False
+
+            self._claimed.add(key)
+
+        return True
+
+    def __len__(self):
+        return len(self._claimed)
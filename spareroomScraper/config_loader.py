@@ -56,4 +56,52 @@ class ConfigLoader:
             # Strip spaces in case of multiline values.
             config_item = [item.strip() for item in config_item]
 
-        return config_item
\ No newline at end of file
+        return config_item
+
+    def get_items(self):
+        """ Get the values of all the items in the config file at once.
+            Values are split on commas, like get_item does.
+
+            Returns:
+                A dictionary mapping the lowercased item names to their values.
+        """
+
+        return dict((config_item, self.get_item(config_item))
+                    for config_item in self.config.options('parameters'))
+
+    def get_int(self, config_item):
+        """ Get the value of an item from the config file as an integer.
+
+            Args:
+                config_item: Name of the item to look up.
+
+            Returns:
+                The integer value of the requested item.
+        """
+
+        return self.config.getint('parameters', config_item)
+
+    def get_float(self, config_item):
+        """ Get the value of an item from the config file as a float.
+
+            Args:
+                config_item: Name of the item to look up.
+
+            Returns:
+                The float value of the requested item.
+        """
+
+        return self.config.getfloat('parameters', config_item)
+
+    def get_boolean(self, config_item):
+        """ Get the value of an item from the config file as a boolean.
+            Accepts yes/no, true/false, on/off and 1/0.
+
+            Args:
+                config_item: Name of the item to look up.
+
+            Returns:
+                The boolean value of the requested item.
+        """
+
+        return self.config.getboolean('parameters', config_item)
@@ -1,5 +1,39 @@
 class BadSelector(Exception):
-   ''' Raised when the url selector returns no results.
+   ''' Raised when none of the selectors of a field match
+       a page, if the SelectorMonitor is strict.
    '''
 
-   pass
\ No newline at end of file
+   pass
+
+
+class InvalidPayload(Exception):
+   ''' Raised when a payload config file has values that can't be used.
+       All of them are listed in the errors attribute.
+   '''
+
+   def __init__(self, config_file, errors):
+      self.config_file = config_file
+      self.errors = errors
+
+      super().__init__('{}:\n    {}'.format(config_file, '\n    '.join(errors)))
+
+
+class ShardFailed(Exception):
+   ''' Stands for the failure of a search run by a shard of a
+       sweep, in another process. Only the description of the
+       original error makes it back.
+   '''
+
+   pass
+
+
+class CircuitOpen(Exception):
+   ''' Raised instead of sending a request to a host that
+       keeps failing, until its circuit is reset.
+   '''
+
+   def __init__(self, host, retry_in):
+      self.host = host
+      self.retry_in = retry_in
+
+      super().__init__('{} keeps failing, not trying it again for {:.0f}s'.format(host, retry_in))
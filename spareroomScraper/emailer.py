@@ -1,10 +1,246 @@
 # Standard library imports
+from collections import OrderedDict
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+import threading
+import time
 
 # Local imports
 from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.metrics import Metrics
+
+
+SUBJECT = 'Spareroom search results'
+
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 1
+DEFAULT_TIMEOUT = 30
+
+# Errors worth another try, on a fresh connection
+TRANSIENT_SMTP_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                         ConnectionError, TimeoutError)
+
+
+def _is_transient(error):
+    """ Check whether an SMTP error is worth retrying.
+        4xx replies are temporary failures, 5xx ones are not.
+    """
+
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+
+    return isinstance(error, TRANSIENT_SMTP_ERRORS)
+
+
+class MailDispatcher:
+    """ A class that delivers email digests over one
+        authenticated SMTP connection.
+
+        Content is queued per recipient and dispatch() sends
+        every recipient a single digest with all of it. The
+        connection is opened on the first message and kept
+        open until close(), so a whole batch of searches
+        costs one handshake and one login.
+
+        Transient errors (dropped connections, 4xx replies)
+        are retried on a new connection, waiting longer
+        after each attempt.
+    """
+
+    def __init__(self, server, port, user, password, receivers, security='ssl',
+                 retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY, subject=SUBJECT,
+                 metrics=None, timeout=DEFAULT_TIMEOUT):
+        """ Args:
+                server: The host name of the SMTP server.
+                port: The port of the SMTP server.
+                user: The account to log in with and send from.
+                      No login is attempted if user or password is empty.
+                password: The password of the account.
+                receivers: The recipients of the digests, unless
+                           others are given when queueing.
+                security: ssl, starttls or none. none is only meant
+                          for a local stand-in server.
+                retries: How many times a message is retried.
+                retry_delay: Seconds to wait before the first retry.
+                             Doubles after every attempt.
+                subject: The subject of the digests.
+                metrics: The Metrics to record the deliveries in.
+                timeout: Seconds to wait for the SMTP server, to connect
+                         and then on every command. A server that stops
+                         answering counts as a dropped connection.
+        """
+
+        self.server = server
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.receivers = [receivers] if isinstance(receivers, str) else list(receivers)
+        self.security = security
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.subject = subject
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.sent = 0
+        self.retried = 0
+        self.connections = 0
+        self._digests = OrderedDict()
+        self._connection = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, config_file, metrics=None):
+        """ Create a MailDispatcher from the emailer configuration file.
+
+            Args:
+                config_file: The path to the config file.
+                metrics: See __init__.
+
+            Returns:
+                A MailDispatcher object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('gmail_server'),
+                   config_loader.get_item('gmail_port'),
+                   config_loader.get_item('gmail_user'),
+                   config_loader.get_item('gmail_password'),
+                   config_loader.get_item('gmail_receiver'),
+                   security=config_loader.get_item('smtp_security'),
+                   retries=config_loader.get_int('smtp_retries'),
+                   retry_delay=config_loader.get_float('smtp_retry_delay'),
+                   metrics=metrics,
+                   timeout=config_loader.get_float('smtp_timeout'))
+
+    def queue(self, content, receivers=None):
+        """ Add some content to the next digest of each recipient.
+
+            Args:
+                content: A piece of HTML.
+                receivers: The recipients. Defaults to the receivers
+                           the dispatcher was created with.
+        """
+
+        if receivers is None:
+            receivers = self.receivers
+        elif isinstance(receivers, str):
+            receivers = [receivers]
+
+        with self._lock:
+            for receiver in receivers:
+                self._digests.setdefault(receiver, []).append(content)
+
+    def dispatch(self):
+        """ Send every recipient their digest.
+
+            Returns:
+                The number of digests sent.
+
+            Raises:
+                SMTPException, if a digest could not be sent.
+                The digests that were not sent stay queued.
+        """
+
+        with self._lock:
+            sent = 0
+
+            while self._digests:
+                receiver, parts = next(iter(self._digests.items()))
+
+                self.send(''.join(parts), receiver)
+
+                del self._digests[receiver]
+                sent += 1
+
+            return sent
+
+    def send(self, content, receiver):
+        """ Send a single email right away, over the shared connection.
+
+            Args:
+                content: The HTML body of the email.
+                receiver: The recipient.
+
+            Raises:
+                SMTPException, if the email could not be sent.
+        """
+
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.user
+        msg['To'] = receiver
+        msg['Subject'] = self.subject
+        msg.attach(MIMEText(content, 'html'))
+
+        with self._lock, self.metrics.timer('stage_seconds', stage='email'):
+            for attempt in range(self.retries + 1):
+                try:
+                    self._connect().sendmail(self.user, receiver, msg.as_string())
+                    self.sent += 1
+                    self.metrics.increment('emails_sent_total')
+                    return
+                except (smtplib.SMTPException, OSError) as error:
+                    if not _is_transient(error) or attempt == self.retries:
+                        raise
+
+                    self.retried += 1
+                    self.metrics.increment('retries_total', reason='smtp')
+                    self._disconnect()
+                    time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _connect(self):
+        if self._connection is not None:
+            return self._connection
+
+        if self.security == 'ssl':
+            connection = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            connection = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+
+        try:
+            connection.ehlo()
+
+            if self.security == 'starttls':
+                connection.starttls()
+                connection.ehlo()
+
+            if self.user and self.password:
+                connection.login(self.user, self.password)
+        except Exception:
+            connection.close()
+            raise
+
+        self.connections += 1
+        self._connection = connection
+
+        return connection
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self._connection.close()
+
+        self._connection = None
+
+    def as_dict(self):
+        """ Get the delivery counters of the dispatcher. """
+
+        return {'sent': self.sent, 'retried': self.retried, 'connections': self.connections}
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 class Emailer:
@@ -13,6 +249,7 @@ class Emailer:
     def __init__(self, config_file):
         # Create a new instance of the ConfigLoader class
         self.config_loader = ConfigLoader(config_file)
+        self.config_file = config_file
 
     def _get_item(self, config_item):
         """ Get the value of an item from the config file.
@@ -32,32 +269,14 @@ class Emailer:
     def send_gmail(self, content):
         """ Send an email notification through gmail.
 
-            Reads the configuration from emailer_config.ini
+            Reads the configuration from emailer_config.ini.
+            Use a MailDispatcher to send many emails over
+            one connection.
 
             Raises:
                 SMTPException, if one occured.
         """
 
-        gmail_server = self._get_item('gmail_server')
-        gmail_port = self._get_item('gmail_port')
-        gmail_user = self._get_item('gmail_user')
-        gmail_password = self._get_item('gmail_password')
-        gmail_receiver = self._get_item('gmail_receiver')
-        gmail_subject = 'Spareroom search results'
-
-        msg = MIMEMultipart('alternative')
-        msg['From'] = gmail_user
-        msg['To'] = gmail_receiver
-        msg['Subject'] = gmail_subject
-
-        html_part = MIMEText(content, 'html')
-        msg.attach(html_part)
-
-        try:
-            server = smtplib.SMTP_SSL(gmail_server, gmail_port)
-            server.ehlo()
-            server.login(gmail_user, gmail_password)
-            server.sendmail(gmail_user, gmail_receiver, msg.as_string())
-            server.close()
-        except:  
-            raise
\ No newline at end of file
+        with MailDispatcher.from_config(self.config_file) as dispatcher:
+            dispatcher.queue(content)
+            dispatcher.dispatch()
@@ -0,0 +1,330 @@
+# Standard library imports
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+# Third party imports
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# Each endpoint gets its own max staleness. The first pattern
+# matching the path of a url decides which endpoint it belongs to.
+ENDPOINT_PATTERNS = (
+    ('advert', re.compile(r'flatshare_detail\.pl|/flatshare/.*/\d+/?$')),
+    ('search', re.compile(r'/flatshare/(search\.pl)?$')),
+)
+
+# Headers worth keeping with a cached body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Date')
+
+
+class CacheEntry:
+    """ The metadata of a cached response. """
+
+    def __init__(self, key, url, headers, stored_at):
+        self.key = key
+        self.url = url
+        self.headers = headers
+        self.stored_at = stored_at
+
+    def conditional_headers(self):
+        """ Get the headers that turn a request into a conditional one. """
+
+        headers = {}
+
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+
+        return headers
+
+
+class HttpCache:
+    """ A class that keeps the responses of GET requests on disk.
+
+        Bodies are stored zlib compressed, one file each, next
+        to a SQLite index. When the cache grows over max_bytes
+        the least recently used responses are evicted.
+
+        A cached response is served as it is while it is younger
+        than the max staleness of its endpoint. After that it is
+        revalidated with its ETag/Last-Modified, so an unchanged
+        page costs a 304 instead of a full download.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_staleness=None):
+        """ Open (or create) the cache.
+
+            Args:
+                path: The directory to keep the cache in.
+                max_bytes: The maximum total size of the compressed bodies.
+                max_staleness: A dictionary mapping an endpoint name
+                               (see ENDPOINT_PATTERNS) to the number of
+                               seconds its responses are served without
+                               revalidation. Endpoints not listed are
+                               always revalidated.
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_staleness = max_staleness or {}
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+
+        # The shards of a sweep share the index, wait for each other's writes
+        self._connection = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout=30,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                '    key TEXT PRIMARY KEY,'
+                '    url TEXT NOT NULL,'
+                '    headers TEXT NOT NULL,'
+                '    size INTEGER NOT NULL,'
+                '    stored_at REAL NOT NULL,'
+                '    last_access REAL NOT NULL'
+                ')')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create an HttpCache from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                An HttpCache object, or None if the cache is disabled.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        path = config_loader.get_item('http_cache')
+
+        if not path:
+            return None
+
+        return cls(path,
+                   max_bytes=config_loader.get_int('http_cache_max_bytes'),
+                   max_staleness={
+                       'search': config_loader.get_int('http_cache_max_stale_search'),
+                       'advert': config_loader.get_int('http_cache_max_stale_advert'),
+                   })
+
+    @staticmethod
+    def _key(url, params):
+        prepared_url = requests.Request('GET', url, params=params).prepare().url
+
+        return hashlib.sha256(prepared_url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.path, key + '.z')
+
+    def _max_staleness_of(self, url):
+        path = requests.utils.urlparse(url).path
+
+        for endpoint, pattern in ENDPOINT_PATTERNS:
+            if pattern.search(path):
+                return self.max_staleness.get(endpoint, 0)
+
+        return 0
+
+    def entry(self, url, params=None):
+        """ Look up the metadata of a cached response.
+
+            Args:
+                url: The url of the request.
+                params: The query parameters in a dict format.
+
+            Returns:
+                A CacheEntry, or None if the response is not cached.
+        """
+
+        key = self._key(url, params)
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT url, headers, stored_at FROM responses WHERE key = ?',
+                (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        return CacheEntry(key, row[0], json.loads(row[1]), row[2])
+
+    def fresh(self, url, params=None):
+        """ Get a cached response that can be used without revalidation.
+
+            Args:
+                url: The url of the request.
+                params: The query parameters in a dict format.
+
+            Returns:
+                A requests.Response object, or None.
+        """
+
+        entry = self.entry(url, params)
+
+        if entry is None or time.time() - entry.stored_at > self._max_staleness_of(url):
+            return None
+
+        response = self._load(entry)
+
+        if response is not None:
+            with self._lock:
+                self.hits += 1
+
+        return response
+
+    def update(self, url, params, response, entry=None):
+        """ Bring the cache up to date with a response from the server.
+
+            Args:
+                url: The url of the request.
+                params: The query parameters in a dict format.
+                response: The requests.Response object we got back.
+                entry: The CacheEntry the request was revalidating, if any.
+
+            Returns:
+                The response to hand to the caller. A 304 is
+                turned into the cached response it confirmed.
+                If that response can't be read any more, the
+                entry is forgotten and the 304 is handed back,
+                for the caller to ask for the whole response.
+        """
+
+        if response.status_code == 304 and entry is not None:
+            cached_response = self._load(entry, touch_stored_at=True)
+
+            if cached_response is not None:
+                with self._lock:
+                    self.revalidations += 1
+                return cached_response
+
+            # The body is missing or corrupt
+            self.forget(entry)
+
+        with self._lock:
+            self.misses += 1
+
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            self._store(self._key(url, params), response)
+
+        return response
+
+    def forget(self, entry):
+        """ Drop a cached response, index entry and body. """
+
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (entry.key,))
+
+        try:
+            os.remove(self._body_path(entry.key))
+        except OSError:
+            pass
+
+    def _load(self, entry, touch_stored_at=False):
+        try:
+            with open(self._body_path(entry.key), 'rb') as body_file:
+                content = zlib.decompress(body_file.read())
+        except (OSError, zlib.error):
+            return None
+
+        now = time.time()
+
+        with self._lock, self._connection:
+            if touch_stored_at:
+                self._connection.execute(
+                    'UPDATE responses SET last_access = ?, stored_at = ? WHERE key = ?',
+                    (now, now, entry.key))
+            else:
+                self._connection.execute(
+                    'UPDATE responses SET last_access = ? WHERE key = ?', (now, entry.key))
+
+        response = requests.models.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = entry.url
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response.from_cache = True
+
+        return response
+
+    def _store(self, key, response):
+        body = zlib.compress(response.content)
+        headers = dict((name, response.headers[name]) for name in STORED_HEADERS
+                       if name in response.headers)
+
+        with open(self._body_path(key), 'wb') as body_file:
+            body_file.write(body)
+
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, url, headers, size, stored_at, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, response.url, json.dumps(headers), len(body), now, now))
+
+        self._evict()
+
+    def _evict(self):
+        """ Drop the least recently used responses until
+            the cache fits in max_bytes again.
+        """
+
+        with self._lock, self._connection:
+            total_size = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+            if total_size <= self.max_bytes:
+                return
+
+            evicted = []
+            for key, size in self._connection.execute(
+                    'SELECT key, size FROM responses ORDER BY last_access'):
+                if total_size <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total_size -= size
+
+            self._connection.executemany('DELETE FROM responses WHERE key = ?',
+                                         [(key,) for key in evicted])
+
+        for key in evicted:
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def as_dict(self):
+        """ Get the hit counters of the cache. """
+
+        with self._lock:
+            return {'hits': self.hits, 'revalidations': self.revalidations, 'misses': self.misses}
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,243 @@
+# Standard library imports
+from contextlib import contextmanager
+import itertools
+import json
+import threading
+import time
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(name, _escape_label(value))
+                          for name, value in labels) + '}'
+
+
+class _TimerStats:
+    """ The running totals of one timer. """
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """ A thread safe collection of timers and counters,
+        shared by everything that takes part in a run.
+
+        Every timer and counter has a name and optional
+        labels, e.g. a timer 'stage_seconds' with a 'stage'
+        label for each step of the search pipeline. They can
+        be exported as JSON, in the Prometheus text format
+        or as a summary table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        """ Add to a counter.
+
+            Args:
+                name: The name of the counter.
+                value: The amount to add.
+                labels: The labels of the counter.
+        """
+
+        key = self._key(name, labels)
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """ Record a duration.
+
+            Args:
+                name: The name of the timer.
+                seconds: The duration.
+                labels: The labels of the timer.
+        """
+
+        key = self._key(name, labels)
+
+        with self._lock:
+            timer = self._timers.get(key)
+
+            if timer is None:
+                timer = self._timers[key] = _TimerStats()
+
+            timer.add(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ Time a block of code, e.g.
+
+                with metrics.timer('stage_seconds', stage='parse'):
+                    ...
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, iterable, name, **labels):
+        """ Time how long an iterable takes to produce each of its items,
+            leaving out the time the consumer spends on them.
+
+            Args:
+                iterable: The iterable (e.g. a generator) to time.
+                name: The name of the timer.
+                labels: The labels of the timer.
+
+            Yields:
+                The items of the iterable.
+        """
+
+        iterator = iter(iterable)
+        elapsed = 0.0
+
+        try:
+            while True:
+                start = time.perf_counter()
+
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    def merge(self, snapshot):
+        """ Add the timers and counters of another Metrics, e.g.
+            the ones a shard of a sweep sent back from its process.
+
+            Args:
+                snapshot: The dictionary returned by its as_dict().
+        """
+
+        with self._lock:
+            for entry in snapshot['timers']:
+                key = self._key(entry['name'], entry['labels'])
+                timer = self._timers.get(key)
+
+                if timer is None:
+                    timer = self._timers[key] = _TimerStats()
+
+                timer.count += entry['count']
+                timer.total += entry['total']
+                timer.max = max(timer.max, entry['max'])
+
+            for entry in snapshot['counters']:
+                key = self._key(entry['name'], entry['labels'])
+                self._counters[key] = self._counters.get(key, 0) + entry['value']
+
+    def as_dict(self):
+        """ Get every timer and counter in a format that can be dumped to JSON. """
+
+        with self._lock:
+            timers = [{'name': name, 'labels': dict(labels), 'count': timer.count,
+                       'total': timer.total, 'max': timer.max}
+                      for (name, labels), timer in sorted(self._timers.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+
+        return {'timers': timers, 'counters': counters}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2)
+
+    def to_prometheus(self, prefix='spareroom_'):
+        """ Export the metrics in the Prometheus text exposition format.
+            Timers become summaries (with _count and _sum) plus a
+            _max gauge, counters stay counters.
+
+            Args:
+                prefix: Added to the name of every metric.
+
+            Returns:
+                The metrics as a string.
+        """
+
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        declared = set()
+
+        # Each family has its samples right after its TYPE line
+        for name, family in itertools.groupby(timers, key=lambda item: item[0][0]):
+            metric = prefix + name
+            family = [(_format_labels(labels), timer) for (_, labels), timer in family]
+            declared.add(metric)
+
+            lines.append('# TYPE {} summary'.format(metric))
+            for labels, timer in family:
+                lines.append('{}_count{} {}'.format(metric, labels, timer.count))
+                lines.append('{}_sum{} {!r}'.format(metric, labels, timer.total))
+
+            lines.append('# TYPE {}_max gauge'.format(metric))
+            for labels, timer in family:
+                lines.append('{}_max{} {!r}'.format(metric, labels, timer.max))
+
+        for (name, labels), value in counters:
+            metric = prefix + name
+
+            if metric not in declared:
+                declared.add(metric)
+                lines.append('# TYPE {} counter'.format(metric))
+
+            lines.append('{}{} {}'.format(metric, _format_labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """ Get the metrics as a table, for the end of a run. """
+
+        metrics = self.as_dict()
+
+        def describe(entry):
+            labels = ','.join('{}={}'.format(name, value) for name, value in entry['labels'].items())
+            return entry['name'] + ('{' + labels + '}' if labels else '')
+
+        lines = ['{:50} {:>8} {:>10} {:>10} {:>10}'.format(
+            'timer', 'count', 'total s', 'mean ms', 'max ms')]
+
+        for timer in metrics['timers']:
+            mean = timer['total'] / timer['count'] if timer['count'] else 0
+            lines.append('{:50} {:>8} {:>10.3f} {:>10.1f} {:>10.1f}'.format(
+                describe(timer), timer['count'], timer['total'], mean * 1000, timer['max'] * 1000))
+
+        lines.append('')
+        lines.append('{:50} {:>8}'.format('counter', 'value'))
+
+        for counter in metrics['counters']:
+            lines.append('{:50} {:>8}'.format(describe(counter), counter['value']))
+
+        return '\n'.join(lines)
@@ -0,0 +1,144 @@
+# Standard library imports
+import codecs
+import time
+
+# Local imports
+from spareroomScraper.parsers import LinkExtractor, compile_simple_selector
+
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+
+class PageStream:
+    """ A class that reads a page of results from the network
+        a chunk at a time, picking the links out as it goes.
+
+        Only the part of the page before the results is kept
+        (the results header with their number is there), and
+        reading stops as soon as the element holding the results
+        has closed, so the footer is never downloaded or parsed.
+        Stopping early closes the connection instead of returning
+        it to the pool.
+
+        A page without a single link is read and kept whole, so
+        that other selectors can be tried on it.
+
+        It stands in for the response of the page: url and
+        status_code are those of the response, and text is the
+        part of the page before the results (all of it, for a
+        page without links).
+    """
+
+    def __init__(self, response, selector, container, metrics=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        """ Args:
+                response: A requests.Response, sent with stream=True.
+                selector: The CSS selector of the links.
+                container: The CSS selector of the element holding them.
+                           Both are SimpleSelectors (see parsers).
+                metrics: The Metrics to record the parsing and the bytes read in.
+                chunk_size: The number of bytes read at a time.
+
+            Raises:
+                ValueError: If a selector is not supported.
+        """
+
+        self.response = response
+        self.selector = selector
+        self.url = response.url
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.metrics = metrics
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.complete = False
+        self._head = []
+        # The rest of the page, until a link turns up
+        self._rest = []
+        self._extractor = LinkExtractor(compile_simple_selector(selector),
+                                        compile_simple_selector(container))
+
+    @property
+    def text(self):
+        """ The part of the page read before the results,
+            or the whole page if it has no links.
+        """
+
+        return ''.join(self._head + self._rest)
+
+    def links(self):
+        """ Read the page, until the results end.
+
+            Yields:
+                The href of every matching element, as soon as it is read.
+        """
+
+        if self.complete:
+            yield from self._extractor.links
+            return
+
+        extractor = self._extractor
+        decoder = codecs.getincrementaldecoder(self.response.encoding or 'utf-8')(errors='replace')
+        parse_seconds = 0.0
+        emitted = 0
+
+        try:
+            for chunk in self.response.iter_content(self.chunk_size):
+                self.bytes_read += len(chunk)
+                text = decoder.decode(chunk)
+
+                if not extractor.in_container:
+                    self._head.append(text)
+                elif not extractor.links:
+                    self._rest.append(text)
+
+                if not extractor.finished:
+                    started = time.perf_counter()
+                    extractor.feed(text)
+                    parse_seconds += time.perf_counter() - started
+
+                if extractor.links:
+                    self._rest = []
+
+                while emitted < len(extractor.links):
+                    emitted += 1
+                    yield extractor.links[emitted - 1]
+
+                # Without links, the page is kept for other selectors
+                if extractor.finished and extractor.links:
+                    break
+            else:
+                extractor.feed(decoder.decode(b'', final=True))
+                extractor.close()
+
+            yield from extractor.links[emitted:]
+
+            self.complete = True
+        finally:
+            self.close()
+
+            if self.metrics is not None:
+                self.metrics.observe('stage_seconds', parse_seconds, stage='parse_page')
+
+                # A cached page was counted when it was first downloaded
+                if not getattr(self.response, 'from_cache', False):
+                    self.metrics.increment('http_response_bytes_total', self.bytes_read)
+
+                self.metrics.increment('streamed_pages_total',
+                                       result='stopped_early' if extractor.finished
+                                       else 'read_whole')
+
+    def read(self):
+        """ Read the page now, rather than as the links are asked for.
+
+            Returns:
+                This PageStream.
+        """
+
+        for _ in self.links():
+            pass
+
+        return self
+
+    def close(self):
+        self.response.close()
@@ -0,0 +1,341 @@
+# Standard library imports
+from functools import lru_cache
+from html.parser import HTMLParser
+import re
+
+# Third party imports
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxHTMLParser
+except ImportError:
+    SelectolaxHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    CSSSelector = None
+
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                           'link', 'meta', 'param', 'source', 'track', 'wbr'])
+# Elements whose closing tag can be left out before a sibling of the same kind
+AUTO_CLOSING_ELEMENTS = frozenset(['dd', 'dt', 'li', 'option', 'p', 'td', 'th', 'tr'])
+
+COMPOUND_SELECTOR_PATTERN = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<rest>(?:[.#][\w-]+)*)$')
+
+
+def _decode(content):
+    if isinstance(content, bytes):
+        return content.decode('utf-8', errors='replace')
+
+    return content
+
+
+class _CompoundSelector:
+    """ A compound CSS selector such as a.foo.bar#baz """
+
+    def __init__(self, tag, classes, element_id):
+        self.tag = tag
+        self.classes = classes
+        self.element_id = element_id
+
+    def matches(self, element):
+        tag, classes, element_id = element
+
+        return ((self.tag is None or self.tag == tag) and
+                self.classes <= classes and
+                (self.element_id is None or self.element_id == element_id))
+
+
+class SimpleSelector:
+    """ A small subset of CSS selectors that can be matched
+        while the document is still being read.
+
+        Supports tag names, classes and ids, combined with the
+        child (>) and descendant (space) combinators, which
+        covers the selectors we use on spareroom's pages.
+    """
+
+    def __init__(self, selector):
+        """ Args:
+                selector: The CSS selector.
+
+            Raises:
+                ValueError: If the selector is not supported.
+        """
+
+        self.selector = selector
+
+        # Turn 'a > b c' into ['a', '>', 'b', ' ', 'c']
+        tokens = re.sub(r'\s*>\s*', ' > ', selector.strip()).split()
+
+        self.compounds = []
+        self.combinators = []
+
+        expect_compound = True
+        for token in tokens:
+            if token == '>':
+                if expect_compound:
+                    raise ValueError('Unsupported selector: ' + selector)
+                self.combinators.append('>')
+                expect_compound = True
+                continue
+
+            if not expect_compound:
+                self.combinators.append(' ')
+
+            self.compounds.append(self._parse_compound(token, selector))
+            expect_compound = False
+
+        if not self.compounds or expect_compound:
+            raise ValueError('Unsupported selector: ' + selector)
+
+    @staticmethod
+    def _parse_compound(token, selector):
+        match = COMPOUND_SELECTOR_PATTERN.match(token)
+
+        if match is None or not token:
+            raise ValueError('Unsupported selector: ' + selector)
+
+        tag = match.group('tag')
+        parts = re.findall(r'[.#][\w-]+', match.group('rest'))
+        classes = frozenset(part[1:] for part in parts if part[0] == '.')
+        ids = [part[1:] for part in parts if part[0] == '#']
+
+        return _CompoundSelector(None if tag in (None, '*') else tag.lower(),
+                                 classes, ids[0] if ids else None)
+
+    @property
+    def target_tag(self):
+        """ The tag name of the elements this selector picks, if fixed. """
+
+        return self.compounds[-1].tag
+
+    def matches(self, stack):
+        """ Check whether the last element of the stack matches.
+
+            Args:
+                stack: The open elements, as (tag, classes, id) tuples,
+                       from the root down to the element to check.
+
+            Returns:
+                True if the element is selected.
+        """
+
+        return self._matches(len(self.compounds) - 1, stack, len(stack) - 1)
+
+    def _matches(self, compound_index, stack, element_index):
+        if element_index < 0 or not self.compounds[compound_index].matches(stack[element_index]):
+            return False
+
+        if compound_index == 0:
+            return True
+
+        if self.combinators[compound_index - 1] == '>':
+            return self._matches(compound_index - 1, stack, element_index - 1)
+
+        # Descendant combinator, any ancestor will do
+        for ancestor_index in range(element_index - 1, -1, -1):
+            if self._matches(compound_index - 1, stack, ancestor_index):
+                return True
+
+        return False
+
+
+class LinkExtractor(HTMLParser):
+    """ An incremental parser that picks out the href of the
+        elements matching a SimpleSelector, without building
+        a document tree.
+
+        The document can be fed in chunks. The links found so
+        far are available in the links attribute.
+
+        Given the selector of the element that holds the links,
+        the extractor is finished as soon as that element closes,
+        so the rest of the document doesn't have to be read.
+    """
+
+    def __init__(self, selector, container=None):
+        """ Args:
+                selector: The SimpleSelector of the links.
+                container: The SimpleSelector of the element holding them, if any.
+        """
+
+        super().__init__(convert_charrefs=True)
+
+        self.selector = selector
+        self.container = container
+        self.links = []
+        self.in_container = False
+        self.finished = False
+        self._stack = []
+        self._container_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.finished:
+            return
+
+        attributes = dict(attrs)
+
+        if tag in AUTO_CLOSING_ELEMENTS and self._stack and self._stack[-1][0] == tag:
+            self._stack.pop()
+
+        element = (tag, frozenset((attributes.get('class') or '').split()), attributes.get('id'))
+        self._stack.append(element)
+
+        if (self.container is not None and self._container_depth is None and
+                self.container.matches(self._stack)):
+            self._container_depth = len(self._stack)
+            self.in_container = True
+
+        if self.selector.matches(self._stack) and attributes.get('href') is not None:
+            self.links.append(attributes['href'])
+
+        if tag in VOID_ELEMENTS:
+            self._stack.pop()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+        if tag not in VOID_ELEMENTS and not self.finished:
+            self._stack.pop()
+
+    def handle_endtag(self, tag):
+        if self.finished:
+            return
+
+        # Close everything up to the matching open element, if there is one
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                del self._stack[index:]
+                break
+
+        if self._container_depth is not None and len(self._stack) < self._container_depth:
+            self.finished = True
+
+
+@lru_cache(maxsize=None)
+def compile_simple_selector(selector):
+    """ Compile a selector for the LinkExtractor, once per process. """
+
+    return SimpleSelector(selector)
+
+
+class BeautifulSoupParser:
+    """ Finds links by building a full BeautifulSoup tree.
+        Slow, but it understands every CSS selector.
+    """
+
+    name = 'bs4'
+
+    def select_links(self, content, selector):
+        """ Get the href of every element matching a selector.
+
+            Args:
+                content: The HTML document, as bytes or text.
+                selector: The CSS selector.
+
+            Returns:
+                A list of hrefs, in document order.
+        """
+
+        page = BeautifulSoup(content, 'html.parser')
+
+        return [element['href'] for element in page.select(selector) if element.has_attr('href')]
+
+
+class LxmlParser:
+    """ Finds links with lxml and compiled cssselect selectors. """
+
+    name = 'lxml'
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _compile(selector):
+        return CSSSelector(selector)
+
+    def select_links(self, content, selector):
+        document = lxml.html.fromstring(content)
+
+        return [element.get('href') for element in self._compile(selector)(document)
+                if element.get('href') is not None]
+
+
+class SelectolaxParser:
+    """ Finds links with selectolax, the fastest of the backends. """
+
+    name = 'selectolax'
+
+    def select_links(self, content, selector):
+        document = SelectolaxHTMLParser(_decode(content))
+
+        return [node.attributes['href'] for node in document.css(selector)
+                if node.attributes.get('href') is not None]
+
+
+class LinksOnlyParser:
+    """ Streams through the document and keeps only the matching
+        links, without building any tree. It falls back to
+        BeautifulSoup for selectors it doesn't understand.
+    """
+
+    name = 'links'
+
+    def select_links(self, content, selector):
+        try:
+            simple_selector = compile_simple_selector(selector)
+        except ValueError:
+            return BeautifulSoupParser().select_links(content, selector)
+
+        extractor = LinkExtractor(simple_selector)
+        extractor.feed(_decode(content))
+        extractor.close()
+
+        return extractor.links
+
+
+PARSER_BACKENDS = {
+    'selectolax': SelectolaxParser if SelectolaxHTMLParser is not None else None,
+    'lxml': LxmlParser if CSSSelector is not None else None,
+    'links': LinksOnlyParser,
+    'bs4': BeautifulSoupParser,
+}
+
+# The order in which backends are tried by 'auto'
+AUTO_BACKENDS = ('selectolax', 'lxml', 'bs4')
+
+
+def get_parser(backend='auto'):
+    """ Get an HTML parser backend by name.
+
+        Args:
+            backend: One of auto, selectolax, lxml, links or bs4.
+                     auto picks the fastest one that is installed.
+                     If the requested one isn't installed,
+                     BeautifulSoup is used instead.
+
+        Returns:
+            A parser object with a select_links(content, selector) method.
+
+        Raises:
+            ValueError: If the backend is unknown.
+    """
+
+    if backend == 'auto':
+        for name in AUTO_BACKENDS:
+            if PARSER_BACKENDS[name] is not None:
+                return PARSER_BACKENDS[name]()
+
+    if backend not in PARSER_BACKENDS:
+        raise ValueError('Unknown parser backend: ' + backend)
+
+    parser_class = PARSER_BACKENDS[backend]
+
+    if parser_class is None:
+        print('The {} parser backend is not installed, using bs4'.format(backend))
+        parser_class = BeautifulSoupParser
+
+    return parser_class()
@@ -1,500 +1,354 @@
 # Standard library imports
 from calendar import monthrange
 import datetime
-import time
+import hashlib
+import json
 
 # Local imports
 from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.custom_exceptions import InvalidPayload
 
 
-class Payload:
-    """ A class that sets up the payload in the form
-        of a dictionary, on initialization.
+def payload_key(payload):
+    """ Get a canonical hash of a payload dictionary.
 
-        The dictionary can be accessed by instantiating
-        the class and calling the public function:
-        get_advanced_search_payload
+        The same search criteria always give the same key,
+        whatever the order of the items in the dictionary.
+
+        Args:
+            payload: The payload in a dictionary format.
+
+        Returns:
+            A hex digest identifying the payload.
     """
 
-    def __init__(self, config_file):
-        """ Load the configuration file and initialise the payload.
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
 
-            Initialisation has been split in several 'private' functions.
-            Each one is setting up a specific category of the search
-            attributes. The private functions also perform validation
-            of the config items and set up default values.
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
 
-            Args:
-                config_file: The path to the config file.
-        """
 
-        # Create a new instance of the ConfigLoader class
-        self.config_loader = ConfigLoader(config_file)
+# The fields every advanced search sends, whatever the criteria
+ADDITIONAL_DETAILS = (
+    ('searchtype', 'advanced'),
+    ('action', 'search'),
+    ('show_results', ''),
+    ('max_per_page', ''),
+    ('keyword', ''),
+    ('editing', ''),
+    ('mode', ''),
+    ('nmsq_mode', ''),
+    ('templateoveride', ''),
+    ('submit', ''),
+)
 
-        # Set up the payload values by category
-        self._set_search_and_location_details()
-        self._set_property_preferences()
-        self._set_sharing_preferences()
-        self._set_other_search_options()
-        self._set_additional_details()
 
-    def _get_item(self, config_item):
-        """ Get the value of an item from the config file.
-            Calls get_item of ConfigLoader class.
+def _freeze(value):
+    """ Turn the lists of a config value into tuples. """
 
-            Args:
-                config_item: Name of the item to look up.
+    return tuple(value) if isinstance(value, list) else value
 
-            Returns:
-                A list of one or more values for the requested item.
-        """
 
-        config_item = self.config_loader.get_item(config_item)
+class CompiledPayload:
+    """ The validated payload of a config file, with every
+        default resolved. It can't be changed once compiled.
+    """
 
-        return config_item
+    __slots__ = ('_items', 'warnings')
 
-    def _set_search_and_location_details(self):
-        """ Initialise the payload attributes for the
-            "Search and Location details" section.
+    def __init__(self, items, warnings=()):
+        """ Args:
+                items: The (name, value) pairs of the payload, in order.
+                warnings: The problems found in the config file that
+                          were resolved by falling back to a default.
         """
 
-        flatshare_type = self._get_item('flatshare_type')
-        flatshare_type_options = self._get_item('flatshare_type_options')
-        flatshare_type_default = self._get_item('flatshare_type')
+        object.__setattr__(self, '_items', tuple((name, _freeze(value)) for name, value in items))
+        object.__setattr__(self, 'warnings', tuple(warnings))
 
-        search = self._get_item('search')
+    def __setattr__(self, name, value):
+        raise AttributeError('A compiled payload cannot be changed')
 
-        location_type = self._get_item('location_type')
-        location_type_options = self._get_item('location_type_options')
-        location_type_default = self._get_item('location_type_default')
+    @property
+    def items(self):
+        return self._items
 
-        min_zone = self._get_item('min_zone')
-        min_zone_options = self._get_item('min_zone_options')
-        min_zone_default = self._get_item('min_zone_default')
-        max_zone = self._get_item('max_zone')
-        max_zone_options = self._get_item('max_zone_options')
-        max_zone_default = self._get_item('max_zone_default')
+    def as_dict(self):
+        """ Get the payload in a dictionary format. """
 
-        tube_line = self._get_item('tube_line')
-        tube_line_options = self._get_item('tube_line_options')
-        tube_line_default = self._get_item('tube_line_default')
+        return dict(self._items)
 
-        max_commute_time = self._get_item('max_commute_time')
-        max_commute_time_options = self._get_item('max_commute_time_options')
-        max_commute_time_default = self._get_item('max_commute_time_default')
+    def to_json(self):
+        return json.dumps({'items': self._items, 'warnings': self.warnings})
 
-        station_id = self._get_item('station_id')
-        station_id_options = self._get_item('station_id_options')
-        station_id_default = self._get_item('station_id_default')
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
 
-        miles_from_max = self._get_item('miles_from_max')
-        miles_from_max_options = self._get_item('miles_from_max_options')
-        miles_from_max_default = self._get_item('miles_from_max_default')
+        return cls(data['items'], data['warnings'])
 
-        showme_rooms = self._get_item('showme_rooms')
-        showme_rooms_options = self._get_item('showme_rooms_options')
-        showme_rooms_default = self._get_item('showme_rooms_default')
 
-        showme_1beds = self._get_item('showme_1beds')
-        showme_1beds_options = self._get_item('showme_1beds_options')
-        showme_1beds_default = self._get_item('showme_1beds_default')
+class PayloadCompiler:
+    """ A class that turns a payload config file into a
+        CompiledPayload.
 
-        showme_buddyup_properties = self._get_item('showme_buddyup_properties')
-        showme_buddyup_properties_options = self._get_item('showme_buddyup_properties_options')
-        showme_buddyup_properties_default = self._get_item('showme_buddyup_properties_default')
-
-        # Validate and set up the values. Some values can only be
-        # present on specific circumstances.
-        if flatshare_type in flatshare_type_options:
-            self.flatshare_type = flatshare_type
-        else:
-            self.flatshare_type = flatshare_type_default
-
-        if self.flatshare_type == 'offered':
-            if location_type in location_type_options:
-                self.location_type = location_type
-            else:
-                self.location_type = location_type_default
-
-            if self.location_type == 'zone':
-                if min_zone in min_zone_options:
-                    self.min_zone = min_zone
-                else:
-                    self.min_zone = min_zone_default
-
-                if max_zone in max_zone_options:
-                    self.max_zone = max_zone
-                else:
-                    self.max_zone = max_zone_default
-
-            elif self.location_type == 'tube':
-                if tube_line in tube_line_options:
-                    self.tube_line = tube_line
-                else:
-                    self.tube_line = tube_line_default
-
-            elif self.location_type == 'commuter':
-                if max_commute_time in max_commute_time_options:
-                    self.max_commute_time = max_commute_time
-                else:
-                    self.max_commute_time = max_commute_default
-
-                if station_id in station_id_options:
-                    self.station_id = station_id
-                else:
-                    self.station_id = station_id_default
-
-            elif self.location_type == 'area':
-                if miles_from_max in miles_from_max_options:
-                    self.miles_from_max = miles_from_max
-                else:
-                    self.miles_from_max = miles_from_max_default
-
-                if search:
-                    self.search = search
-                else:
-                    print('Please provide a postcode (SEARCH variable)')
-
-            if showme_rooms in showme_rooms_options:
-                self.showme_rooms = showme_rooms
-            else:
-                self.showme_rooms = showme_rooms_default
-
-            if showme_1beds in showme_1beds_options:
-                self.showme_1beds = showme_1beds
-            else:
-                self.showme_1beds = showme_1beds_default
-
-            if showme_buddyup_properties in showme_buddyup_properties_options:
-                self.showme_buddyup_properties = showme_buddyup_properties
-            else:
-                self.showme_buddyup_properties = showme_buddyup_properties_default
-
-        else:
-            if search:
-                self.search = search
-            else:
-                print('Please provide a postcode (SEARCH variable)')
+        The config file is read once. The options of every item
+        are held as sets and the values are validated against
+        them, falling back to the defaults of the config file.
+        Values that can't be used at all are collected and
+        reported together, rather than one at a time.
+    """
 
-    def _set_property_preferences(self):
-        """ Initialise the payload attributes for the
-            "Property Preferences" section.
+    def __init__(self, config_file, today=None, items=None):
+        """ Args:
+                config_file: The path to the config file.
+                today: The date the availability defaults stand for.
+                items: The items of the config file, if they have
+                       already been read (see ConfigLoader.get_items).
         """
 
-        min_rent = self._get_item('min_rent')
-        min_rent_default = self._get_item('min_rent_default')
+        self.config_file = config_file
+        self.today = today or datetime.date.today()
+        self.items = items if items is not None else ConfigLoader(config_file).get_items()
+        self.payload = []
+        self.errors = []
+        self.warnings = []
 
-        max_rent = self._get_item('max_rent')
-        max_rent_default = self._get_item('max_rent_default')
+    def compile(self):
+        """ Validate the config file and set up the payload.
 
-        per = self._get_item('per')
-        per_options = self._get_item('per_options')
-        per_default = self._get_item('per_default')
-
-        bills_inc = self._get_item('bills_inc')
-        bills_inc_options = self._get_item('bills_inc_options')
-        bills_inc_default = self._get_item('bills_inc_default')
+            Returns:
+                A CompiledPayload object.
 
-        rooms_for = self._get_item('rooms_for')
-        rooms_for_options = self._get_item('rooms_for_options')
-        rooms_for_default = self._get_item('rooms_for_default')
+            Raises:
+                InvalidPayload: If any value in the config file
+                                can't be used. All of them are listed.
+        """
 
-        room_types = self._get_item('room_types')
-        room_types_options = self._get_item('room_types_options')
-        room_types_default = self._get_item('room_types_default')
+        self._set_search_and_location_details()
+        self._set_property_preferences()
+        self._set_sharing_preferences()
+        self._set_other_search_options()
+        self.payload.extend(ADDITIONAL_DETAILS)
 
-        ensuite = self._get_item('ensuite')
-        ensuite_options = self._get_item('ensuite_options')
-        ensuite_default = self._get_item('ensuite_default')
+        if self.errors:
+            raise InvalidPayload(self.config_file, self.errors)
 
-        living_room = self._get_item('living_room')
-        living_room_options = self._get_item('living_room_options')
-        living_room_default = self._get_item('living_room_default')
+        return CompiledPayload(self.payload, self.warnings)
 
-        smoking = self._get_item('smoking')
-        smoking_options = self._get_item('smoking_options')
-        smoking_default = self._get_item('smoking_default')
+    def _get_item(self, config_item, default=None):
+        """ Get the value of an item from the config file. """
 
-        min_term = self._get_item('min_term')
-        min_term_options = self._get_item('min_term_options')
-        min_term_default = self._get_item('min_term_default')
+        value = self.items.get(config_item.lower())
 
-        max_term = self._get_item('max_term')
-        max_term_options = self._get_item('max_term_options')
-        max_term_default = self._get_item('max_term_default')
+        if value is None:
+            if default is None:
+                self.errors.append('{} is missing'.format(config_item))
+                return ''
+            return default
 
-        available_search = self._get_item('available_search')
-        available_search_options = self._get_item('available_search_options')
-        available_search_default = self._get_item('available_search_default')
+        return value
 
-        now = datetime.datetime.now()
-        year_avail = int(self._get_item('year_avail'))
-        year_avail_default = now.year
+    def _set(self, name, value):
+        self.payload.append((name, value))
 
-        month_avail = int(self._get_item('month_avail'))
-        month_avail_default = now.month
+        return value
 
-        day_avail = int(self._get_item('day_avail'))
-        day_avail_default = now.day
+    def _is_option(self, name, value):
+        options = self._get_item(name + '_options')
+        options = frozenset(_freeze(options) if isinstance(options, list) else (options,))
 
-        # Validate and set up the values. Some values can only be
-        # present on specific circumstances.
-        if int(min_rent) in range(1, 10000):
-            self.min_rent = min_rent
-        else:
-            self.min_rent = min_rent_default
+        return _freeze(value) in options
 
-        if int(max_rent) in range(1, 10000):
-            self.max_rent = max_rent
-        else:
-            self.max_rent = max_rent_default
+    def _choose(self, name):
+        """ Set an item to its value if it is one of its
+            options, or to its default otherwise.
+        """
 
-        if per in per_options:
-            self.per = per
-        else:
-            self.per = per_default
+        value = self._get_item(name)
+        default = self._get_item(name + '_default')
 
-        if bills_inc in bills_inc_options:
-            self.bills_inc = bills_inc
-        else:
-            self.bills_inc = bills_inc_default
+        if self._is_option(name, value):
+            return self._set(name, value)
 
-        if rooms_for in rooms_for_options:
-            self.rooms_for = rooms_for
-        else:
-            self.rooms_for = rooms_for_default
+        if value:
+            self.warnings.append('{} = {} is not one of the options, using {!r}'.format(
+                name, value, default))
 
-        if room_types in room_types_options:
-            self.room_types = room_types
-        else:
-            self.room_types = room_types_default        
+        return self._set(name, default)
 
-        if ensuite in ensuite_options:
-            self.ensuite = ensuite
-        else:
-            self.ensuite = ensuite_default  
+    def _number(self, name, valid, default=None):
+        """ Set an item to its value if it is a number in the
+            valid range, or to its default otherwise.
+        """
 
-        if living_room in living_room_options:
-            self.living_room = living_room
-        else:
-            self.living_room = living_room_default
+        value = self._get_item(name)
 
-        if smoking in smoking_options:
-            self.smoking = smoking
-        else:
-            self.smoking = smoking_default  
+        if default is None:
+            default = self._get_item(name + '_default')
 
-        if min_term in min_term_options:
-            self.min_term = min_term
-        else:
-            self.min_term = min_term_default    
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            self.errors.append('{} = {!r} is not a number'.format(name, value))
+            return None
 
-        if max_term in max_term_options:
-            self.max_term = max_term
-        else:
-            self.max_term = max_term_default    
+        if number in valid:
+            return value
 
-        if available_search in available_search_options:
-            self.available_search = available_search
+        self.warnings.append('{} = {} is out of range, using {!r}'.format(name, value, default))
 
-            if year_avail in range(now.year, 2200):
-                self.year_avail = year_avail
-            else:
-                self.year_avail = year_avail_default
+        return default
 
-            if month_avail in range(1, 13):
-                self.month_avail = month_avail
-            else:
-                self.month_avail = month_avail_default
+    def _require(self, name, message):
+        value = self._get_item(name)
 
-            if day_avail in range(1, monthrange(self.year_avail, self.month_avail)[1]):
-                self.day_avail = day_avail
-            else:
-                self.day_avail = day_avail_default
+        if value:
+            self._set(name, value)
         else:
-            self.available_search = available_search_default
+            self.errors.append(message)
 
-    def _set_sharing_preferences(self):
-        """ Initialise the payload attributes for the
-            "Sharing Preferences" section.
+    def _set_search_and_location_details(self):
+        """ Set up the payload items for the
+            "Search and Location details" section.
         """
 
-        share_type = self._get_item('share_type')
-        share_type_options = self._get_item('share_type_options')
-        share_type_default = self._get_item('share_type_default')
+        flatshare_type = self._choose('flatshare_type')
 
-        genderfilter = self._get_item('genderfilter')
-        genderfilter_options = self._get_item('genderfilter_options')
-        genderfilter_default = self._get_item('genderfilter_default')
+        if flatshare_type != 'offered':
+            self._require('search', 'Please provide a postcode (SEARCH variable)')
+            return
 
-        min_age_req = self._get_item('min_age_req')
-        min_age_req_default = self._get_item('min_age_req_default')
+        location_type = self._choose('location_type')
 
-        max_age_req = self._get_item('max_age_req')
-        max_age_req_default = self._get_item('max_age_req_default')
+        if location_type == 'zone':
+            self._choose('min_zone')
+            self._choose('max_zone')
+        elif location_type == 'tube':
+            self._choose('tube_line')
+        elif location_type == 'commuter':
+            self._choose('max_commute_time')
+            self._choose('station_id')
+        elif location_type == 'area':
+            self._choose('miles_from_max')
+            self._require('search', 'Please provide a postcode (SEARCH variable)')
 
-        min_beds = self._get_item('min_beds')
-        min_beds_options = self._get_item('min_beds_options')
-        min_beds_default = self._get_item('min_beds_default')
+        self._choose('showme_rooms')
+        self._choose('showme_1beds')
+        self._choose('showme_buddyup_properties')
 
-        max_beds = self._get_item('max_beds')
-        max_beds_options = self._get_item('max_beds_options')
-        max_beds_default = self._get_item('max_beds_default')
+    def _set_property_preferences(self):
+        """ Set up the payload items for the
+            "Property Preferences" section.
+        """
 
-        landlord = self._get_item('landlord')
-        landlord_options = self._get_item('landlord_options')
-        landlord_default = self._get_item('landlord_default')
+        self._set('min_rent', self._number('min_rent', range(1, 10000)))
+        self._set('max_rent', self._number('max_rent', range(1, 10000)))
 
-        lgbtShare = self._get_item('lgbtShare')
-        lgbtShare_options = self._get_item('lgbtShare_options')
-        lgbtShare_default = self._get_item('lgbtShare_default')
+        for name in ('per', 'bills_inc', 'rooms_for', 'room_types', 'ensuite',
+                     'living_room', 'smoking', 'min_term', 'max_term'):
+            self._choose(name)
 
-        # Validate and set up the values. Some values can only be
-        # present on specific circumstances.
-        if share_type in share_type_options:
-            self.share_type = share_type
-        else:
-            self.share_type = share_type_default
+        self._choose('available_search')
 
-        if genderfilter in genderfilter_options:
-            self.genderfilter = genderfilter
-        else:
-            self.genderfilter = genderfilter_default
+        if not self._is_option('available_search', self._get_item('available_search')):
+            return
 
-        if int(min_age_req) in range(1,999):
-            self.min_age_req = min_age_req
-        else:
-            self.min_age_req = min_age_req_default
+        # The date is only sent along when available_search is valid
+        year_avail = self._number('year_avail', range(self.today.year, 2200), self.today.year)
+        month_avail = self._number('month_avail', range(1, 13), self.today.month)
 
-        if int(max_age_req) in range(1,999):
-            self.max_age_req = max_age_req
-        else:
-            self.max_age_req = max_age_req_default
+        if year_avail is None or month_avail is None:
+            return
 
-        if min_beds in min_beds_options:
-            self.min_beds = min_beds
-        else:
-            self.min_beds = min_beds_default
+        year_avail, month_avail = int(year_avail), int(month_avail)
+        days_in_month = monthrange(year_avail, month_avail)[1]
+        day_avail = self._number('day_avail', range(1, days_in_month + 1), self.today.day)
 
-        if max_beds in max_beds_options:
-            self.max_beds = max_beds
-        else:
-            self.max_beds = max_beds_default
+        if day_avail is None:
+            return
 
-        if landlord in landlord_options:
-            self.landlord = landlord
-        else:
-            self.landlord = landlord_default
+        self._set('year_avail', year_avail)
+        self._set('month_avail', month_avail)
+        self._set('day_avail', int(day_avail))
 
-        if lgbtShare in lgbtShare_options:
-            self.lgbtShare = lgbtShare
-        else:
-            self.lgbtShare = lgbtShare_default
+    def _set_sharing_preferences(self):
+        """ Set up the payload items for the
+            "Sharing Preferences" section.
+        """
+
+        self._choose('share_type')
+        self._choose('genderfilter')
+        self._set('min_age_req', self._number('min_age_req', range(1, 999)))
+        self._set('max_age_req', self._number('max_age_req', range(1, 999)))
 
+        for name in ('min_beds', 'max_beds', 'landlord', 'lgbtShare'):
+            self._choose(name)
 
     def _set_other_search_options(self):
-        """ Initialise the payload attributes for the
+        """ Set up the payload items for the
             "Other Search Options" section.
         """
 
-        pets_req = self._get_item('pets_req')
-        pets_req_options = self._get_item('pets_req_options')
-        pets_req_default = self._get_item('pets_req_default')
+        for name in ('pets_req', 'parking', 'photoadsonly', 'vegetarians',
+                     'short_lets_considered', 'dss', 'disabled_access',
+                     'days_of_wk_available', 'posted_by'):
+            self._choose(name)
 
-        parking = self._get_item('parking')
-        parking_options = self._get_item('parking_options')
-        parking_default = self._get_item('parking_default')
 
-        photoadsonly = self._get_item('photoadsonly')
-        photoadsonly_options = self._get_item('photoadsonly_options')
-        photoadsonly_default = self._get_item('photoadsonly_default')
+def compile_payload(config_file, today=None):
+    """ Compile a payload config file. See PayloadCompiler.
 
-        vegetarians = self._get_item('vegetarians')
-        vegetarians_options = self._get_item('vegetarians_options')
-        vegetarians_default = self._get_item('vegetarians_default')
+        Args:
+            config_file: The path to the config file.
+            today: The date the availability defaults stand for.
 
-        short_lets_considered = self._get_item('short_lets_considered')
-        short_lets_considered_options = self._get_item('short_lets_considered_options')
-        short_lets_considered_default = self._get_item('short_lets_considered_default')
+        Returns:
+            A CompiledPayload object.
 
-        dss = self._get_item('dss')
-        dss_options = self._get_item('dss_options')
-        dss_default = self._get_item('dss_default')
+        Raises:
+            InvalidPayload: If any value in the config file can't be used.
+    """
 
-        disabled_access = self._get_item('disabled_access')
-        disabled_access_options = self._get_item('disabled_access_options')
-        disabled_access_default = self._get_item('disabled_access_default')
+    return PayloadCompiler(config_file, today).compile()
 
-        days_of_wk_available = self._get_item('days_of_wk_available')
-        days_of_wk_available_options = self._get_item('days_of_wk_available_options')
-        days_of_wk_available_default = self._get_item('days_of_wk_available_default')
 
-        posted_by = self._get_item('posted_by')
-        posted_by_options = self._get_item('posted_by_options')
-        posted_by_default = self._get_item('posted_by_default')
+class Payload:
+    """ A class that sets up the payload in the form
+        of a dictionary, on initialization.
 
-        # Validate and set up the values. Some values can only be
-        # present on specific circumstances.
-        if pets_req in pets_req_options:
-            self.pets_req = pets_req
-        else:
-            self.pets_req = pets_req_default
+        The dictionary can be accessed by instantiating
+        the class and calling the public function:
+        get_advanced_search_payload
+    """
 
-        if parking in parking_options:
-            self.parking = parking
-        else:
-            self.parking = parking_default
+    def __init__(self, config_file, cache=None):
+        """ Compile the configuration file, or load it from the cache.
 
-        if photoadsonly in photoadsonly_options:
-            self.photoadsonly = photoadsonly
-        else:
-            self.photoadsonly = photoadsonly_default
+            Args:
+                config_file: The path to the config file.
+                cache: A PayloadCache. If provided, a config file
+                       that hasn't changed since it was last
+                       compiled is not parsed again.
 
-        if vegetarians in vegetarians_options:
-            self.vegetarians = vegetarians
-        else:
-            self.vegetarians = vegetarians_default
+            Raises:
+                InvalidPayload: If any value in the config file can't be used.
+        """
 
-        if short_lets_considered in short_lets_considered_options:
-            self.short_lets_considered = short_lets_considered
-        else:
-            self.short_lets_considered = short_lets_considered_default
+        self.config_file = config_file
 
-        if dss in dss_options:
-            self.dss = dss
-        else:
-            self.dss = dss_default
+        compiled = cache.get(config_file) if cache is not None else None
 
-        if disabled_access in disabled_access_options:
-            self.disabled_access = disabled_access
-        else:
-            self.disabled_access = disabled_access_default
+        if compiled is None:
+            compiled = compile_payload(config_file)
 
-        if days_of_wk_available in days_of_wk_available_options:
-            self.days_of_wk_available = days_of_wk_available
-        else:
-            self.days_of_wk_available = days_of_wk_available_default
+            # Report everything we had to fix in one go
+            if compiled.warnings:
+                print('{}:\n    {}'.format(config_file, '\n    '.join(compiled.warnings)))
 
-        if posted_by in posted_by_options:
-            self.posted_by = posted_by
-        else:
-            self.posted_by = posted_by_default
-
-    def _set_additional_details(self):
-        """ Initialise a few additional payload attributes. """
-
-        self.searchtype = 'advanced'
-        self.action = 'search'
-        self.show_results = ''
-        self.max_per_page = ''
-        self.keyword = ''
-        self.editing = ''
-        self.mode = ''
-        self.nmsq_mode = ''
-        self.templateoveride = ''
-        self.show_results = ''
-        self.max_per_page = ''
-        self.submit = ''
+            if cache is not None:
+                cache.set(config_file, compiled)
+
+        self.compiled = compiled
 
     def get_advanced_search_payload(self):
         """ Get the payload for a specific search.
@@ -503,10 +357,7 @@ class Payload:
                 payload: The payload in the form of a dictionary. 
         """
 
-        payload = self.__dict__
-
-        # We don't need config_loader attribute in the actual payload
-        payload.pop('config_loader')
+        payload = self.compiled.as_dict()
 
         for p in payload:
             print('{} : {}'.format(p, payload[p]))
@@ -0,0 +1,126 @@
+# Standard library imports
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.payload import CompiledPayload
+
+
+# Bump whenever the way payloads are compiled changes,
+# so that payloads compiled the old way are thrown away.
+PAYLOAD_FORMAT = 1
+
+
+class PayloadCache:
+    """ A class that keeps compiled payloads on disk, one
+        small JSON file per payload config file.
+
+        An entry is used as long as the config file has the
+        same modification time and size it had when it was
+        compiled. If those changed, the contents are hashed,
+        so a config file that was touched but not edited is
+        not compiled again.
+
+        The availability defaults depend on the current date,
+        so entries only last until the end of the day.
+    """
+
+    def __init__(self, path):
+        """ Args:
+                path: The directory to keep the compiled payloads in.
+        """
+
+        self.path = path
+
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a PayloadCache from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A PayloadCache object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('payload_cache'))
+
+    def _entry_path(self, config_file):
+        key = hashlib.sha256(os.path.abspath(config_file).encode('utf-8')).hexdigest()
+
+        return os.path.join(self.path, key + '.json')
+
+    @staticmethod
+    def _content_hash(config_file):
+        with open(config_file, 'rb') as config:
+            return hashlib.sha256(config.read()).hexdigest()
+
+    def get(self, config_file):
+        """ Look up the compiled payload of a config file.
+
+            Args:
+                config_file: The path to the payload config file.
+
+            Returns:
+                A CompiledPayload, or None if the config file
+                has to be compiled (again).
+        """
+
+        try:
+            stat = os.stat(config_file)
+            with open(self._entry_path(config_file)) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+        if (entry.get('format') != PAYLOAD_FORMAT or
+                entry.get('compiled_on') != datetime.date.today().isoformat()):
+            return None
+
+        if (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            if entry['sha256'] != self._content_hash(config_file):
+                return None
+
+            # Same contents, just remember the new modification time
+            self._write(config_file, entry['payload'], entry['sha256'], stat)
+
+        return CompiledPayload.from_json(entry['payload'])
+
+    def set(self, config_file, compiled):
+        """ Remember the compiled payload of a config file.
+
+            Args:
+                config_file: The path to the payload config file.
+                compiled: The CompiledPayload object.
+        """
+
+        self._write(config_file, compiled.to_json(), self._content_hash(config_file),
+                    os.stat(config_file))
+
+    def _write(self, config_file, payload, sha256, stat):
+        entry = {
+            'format': PAYLOAD_FORMAT,
+            'config_file': os.path.abspath(config_file),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': sha256,
+            'compiled_on': datetime.date.today().isoformat(),
+            'payload': payload,
+        }
+
+        # Write to a temporary file first, so that a concurrent
+        # run never reads half of an entry
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+
+        with os.fdopen(descriptor, 'w') as entry_file:
+            json.dump(entry, entry_file)
+
+        os.replace(temporary_path, self._entry_path(config_file))
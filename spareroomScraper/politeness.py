@@ -0,0 +1,383 @@
+# Standard library imports
+import email.utils
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse as urlparse
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DEFAULT_RATE = 0.5
+DEFAULT_BURST = 2
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_RECOVERY_STEP = 0.05
+
+# Status codes that mean we are going too fast
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    """ Parse the value of a Retry-After header.
+
+        Args:
+            value: Either a number of seconds or an HTTP date.
+            now: The current unix time. Defaults to time.time().
+
+        Returns:
+            The number of seconds to wait, or None if it can't be parsed.
+    """
+
+    if not value:
+        return None
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    if retry_at is None:
+        return None
+
+    now = time.time() if now is None else now
+
+    return max(retry_at.timestamp() - now, 0.0)
+
+
+class TokenBucket:
+    """ A token bucket that refills at a fixed rate up to
+        a maximum burst size.
+
+        Reserving a token never blocks. If the bucket is empty
+        the token is borrowed from the future and the caller is
+        told how long to wait before using it. This lets threads
+        and asyncio tasks share the same bucket.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """ Args:
+                rate: Tokens added per second.
+                burst: The maximum number of tokens held.
+                clock: A function returning the current time in seconds.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._last = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self._last, 0.0)
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+        self._last = now
+
+    def reserve(self):
+        """ Take a token out of the bucket.
+
+            Returns:
+                The number of seconds to wait before sending the request.
+        """
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+            return max(delay, self._blocked_until - now)
+
+    def block_for(self, seconds):
+        """ Refuse to hand out tokens for the next few seconds. """
+
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    def set_rate(self, rate):
+        """ Change the refill rate, keeping the tokens earned so far. """
+
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = rate
+
+
+class PolitenessScheduler:
+    """ A class that decides when each request may be sent.
+
+        It keeps one token bucket per host, so requests only
+        wait when the budget for that host is used up. The rate
+        is halved whenever the server answers with a 429 or a 503
+        (honouring any Retry-After header) and then slowly recovers
+        back to the configured rate while the responses are good.
+
+        A single instance can be shared by many Search instances
+        (through their Transport) and by many threads.
+
+        Any object providing reserve(host), acquire(host) and
+        feedback(host, response) can be used in its place.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 min_rate=DEFAULT_MIN_RATE, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 recovery_step=DEFAULT_RECOVERY_STEP, clock=time.monotonic):
+        """ Args:
+                rate: The highest number of requests per second to a host.
+                burst: How many requests can be sent back to back.
+                min_rate: The rate never drops below this when backing off.
+                backoff_factor: The rate is multiplied by this on a 429/503.
+                recovery_step: The rate grows by this on every good response.
+                clock: A function returning the current time in seconds.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff_factor = backoff_factor
+        self.recovery_step = recovery_step
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a PolitenessScheduler from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A PolitenessScheduler object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(rate=config_loader.get_float('rate'),
+                   burst=config_loader.get_int('burst'),
+                   min_rate=config_loader.get_float('min_rate'),
+                   backoff_factor=config_loader.get_float('backoff_factor'),
+                   recovery_step=config_loader.get_float('recovery_step'))
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, clock=self._clock)
+                self._buckets[host] = bucket
+
+            return bucket
+
+    def reserve(self, host):
+        """ Reserve a request slot for a host without blocking.
+
+            Args:
+                host: The host name the request is for.
+
+            Returns:
+                The number of seconds to wait before sending the request.
+        """
+
+        return self._bucket(host).reserve()
+
+    def acquire(self, host):
+        """ Block until a request to the host is allowed.
+
+            Args:
+                host: The host name the request is for.
+        """
+
+        delay = self.reserve(host)
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def feedback(self, host, response):
+        """ Adapt the rate for a host to the response we got back.
+
+            Args:
+                host: The host name the request was for.
+                response: A requests.Response object.
+        """
+
+        bucket = self._bucket(host)
+
+        if response.status_code in THROTTLE_STATUS_CODES:
+            bucket.set_rate(max(self.min_rate, bucket.rate * self.backoff_factor))
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            bucket.block_for(retry_after if retry_after is not None else 1.0 / bucket.rate)
+
+        elif bucket.rate < self.rate:
+            bucket.set_rate(min(self.rate, bucket.rate + self.recovery_step))
+
+    @staticmethod
+    def host_of(url):
+        """ Get the host name a url points to. """
+
+        return urlparse.urlparse(url).hostname
+
+
+class SharedPolitenessScheduler(PolitenessScheduler):
+    """ A PolitenessScheduler whose token buckets live in a
+        SQLite database, so that many processes (e.g. the shards
+        of a sweep) share a single budget per host.
+
+        Every reservation is one short write transaction. The
+        buckets use the wall clock, the one clock all the
+        processes agree on.
+    """
+
+    def __init__(self, path, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 min_rate=DEFAULT_MIN_RATE, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 recovery_step=DEFAULT_RECOVERY_STEP, clock=time.time):
+        """ Open (or create) the database.
+
+            Args:
+                path: The path to the SQLite file.
+                See PolitenessScheduler for the rest.
+        """
+
+        super().__init__(rate=rate, burst=burst, min_rate=min_rate,
+                         backoff_factor=backoff_factor, recovery_step=recovery_step,
+                         clock=clock)
+
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Transactions are started by hand, see _bucket_state
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                           check_same_thread=False)
+
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS host_buckets ('
+            '    host TEXT PRIMARY KEY,'
+            '    tokens REAL NOT NULL,'
+            '    rate REAL NOT NULL,'
+            '    updated_at REAL NOT NULL,'
+            '    blocked_until REAL NOT NULL'
+            ')')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a SharedPolitenessScheduler from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A SharedPolitenessScheduler object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('shared_politeness'),
+                   rate=config_loader.get_float('rate'),
+                   burst=config_loader.get_int('burst'),
+                   min_rate=config_loader.get_float('min_rate'),
+                   backoff_factor=config_loader.get_float('backoff_factor'),
+                   recovery_step=config_loader.get_float('recovery_step'))
+
+    def _update(self, host, change):
+        """ Read the bucket of a host, refilled up to now, let change
+            update it and write it back, all in one transaction.
+
+            Args:
+                host: The host name.
+                change: Called with a dictionary of the tokens, rate and
+                        blocked_until of the bucket and the current time.
+                        Updates the dictionary and returns a value.
+
+            Returns:
+                Whatever change returned.
+        """
+
+        with self._lock:
+            # Take the write lock straight away, so that no other
+            # process reads the bucket before we have updated it
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                row = self._connection.execute(
+                    'SELECT tokens, rate, updated_at, blocked_until FROM host_buckets '
+                    'WHERE host = ?', (host,)).fetchone()
+
+                now = self._clock()
+
+                if row is None:
+                    bucket = {'tokens': float(self.burst), 'rate': self.rate, 'blocked_until': 0.0}
+                else:
+                    tokens, rate, updated_at, blocked_until = row
+                    bucket = {'tokens': min(float(self.burst),
+                                            tokens + max(now - updated_at, 0.0) * rate),
+                              'rate': rate, 'blocked_until': blocked_until}
+
+                value = change(bucket, now)
+
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO host_buckets '
+                    '(host, tokens, rate, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?)',
+                    (host, bucket['tokens'], bucket['rate'], now, bucket['blocked_until']))
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+        return value
+
+    def reserve(self, host):
+        """ Reserve a request slot for a host without blocking.
+
+            Args:
+                host: The host name the request is for.
+
+            Returns:
+                The number of seconds to wait before sending the request.
+        """
+
+        def take_token(bucket, now):
+            bucket['tokens'] -= 1
+
+            delay = 0.0 if bucket['tokens'] >= 0 else -bucket['tokens'] / bucket['rate']
+
+            return max(delay, bucket['blocked_until'] - now)
+
+        return self._update(host, take_token)
+
+    def feedback(self, host, response):
+        """ Adapt the rate for a host to the response we got back.
+
+            Args:
+                host: The host name the request was for.
+                response: A requests.Response object.
+        """
+
+        throttled = response.status_code in THROTTLE_STATUS_CODES
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if throttled else None
+
+        def adapt(bucket, now):
+            if throttled:
+                bucket['rate'] = max(self.min_rate, bucket['rate'] * self.backoff_factor)
+                block = retry_after if retry_after is not None else 1.0 / bucket['rate']
+                bucket['blocked_until'] = max(bucket['blocked_until'], now + block)
+            elif bucket['rate'] < self.rate:
+                bucket['rate'] = min(self.rate, bucket['rate'] + self.recovery_step)
+
+        self._update(host, adapt)
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,243 @@
+# Standard library imports
+import datetime
+from operator import itemgetter
+import re
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from spareroomScraper.advert_details import WEEKS_PER_MONTH
+from spareroomScraper.config_loader import ConfigLoader
+
+
+# The columns adverts are scored on, best is 1 and worst 0
+COLUMNS = ('rent', 'distance', 'availability', 'bills')
+
+# The columns the fields of an advert are turned into, see AdvertRanker.columns
+COLUMN_TYPES = np.dtype([('rent', float), ('available_from', float),
+                         ('bills_included', float), ('distance', float)])
+
+DEFAULT_WEIGHTS = {'rent': 3.0, 'distance': 2.0, 'availability': 1.0, 'bills': 1.0}
+# Adverts available this many days after the wanted date (or today) score nothing
+DEFAULT_AVAILABILITY_HORIZON = 60
+# The score of a field an advert page didn't give us
+NEUTRAL = 0.5
+
+# The area (letters) and district of a postcode, e.g. EC and EC1M for EC1M 6HJ
+POSTCODE_PATTERN = re.compile(r'^\s*(([A-Z]{1,2})\d[A-Z\d]?)\s*(?:\d[A-Z]{2})?\s*$', re.IGNORECASE)
+
+
+def _postcode_district(postcode):
+    """ Get the (area, district) of a postcode, or (None, None). """
+
+    match = POSTCODE_PATTERN.match(postcode or '')
+
+    if match is None:
+        return None, None
+
+    return match.group(2).upper(), match.group(1).upper()
+
+
+def _epoch_day(date):
+    """ Get the number of days from the epoch to an ISO date, or NaN. """
+
+    if date is None:
+        return np.nan
+
+    try:
+        return float(np.datetime64(date, 'D').astype(np.int64))
+    except ValueError:
+        return np.nan
+
+
+class _Memo(dict):
+    """ A dictionary filling itself in with a function of the keys. """
+
+    def __init__(self, function):
+        super().__init__()
+        self.function = function
+
+    def __missing__(self, key):
+        value = self[key] = self.function(key)
+        return value
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdvertRanker:
+    """ A class that ranks adverts on our side, rather than in
+        the order spareroom lists them.
+
+        Every advert is scored on a few columns, each between
+        0 and 1:
+
+            rent          cheaper is better, against max_rent if the
+                          search has one, in its per (pcm or pw) unit
+            distance      same postcode district as the search, then
+                          same postcode area (the advert pages give
+                          no distances, only the postcode district)
+            availability  available by the wanted date (or today),
+                          then less and less up to the horizon
+            bills         bills included
+
+        and the columns are combined with the weights. The fields
+        are read off the adverts once, into columns, and the
+        scores are computed for all the adverts at once with NumPy,
+        so scoring a hundred thousand adverts takes milliseconds.
+        Fields the advert page didn't give us score NEUTRAL.
+        Adverts with the same score keep their order.
+    """
+
+    def __init__(self, weights=None, payload=None, horizon=DEFAULT_AVAILABILITY_HORIZON,
+                 today=None):
+        """ Args:
+                weights: A dictionary of the weight of each column. The
+                         columns left out use DEFAULT_WEIGHTS.
+                payload: The payload of the search, in a dictionary format.
+                         Sets what cheap, close and soon mean.
+                horizon: Days after the wanted date an advert stops
+                         scoring on availability.
+                today: The date availability is counted from.
+        """
+
+        payload = payload or {}
+        today = today or datetime.date.today()
+
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or {})
+        self.horizon = max(horizon, 1)
+        self.per_factor = WEEKS_PER_MONTH if payload.get('per') == 'pw' else 1
+        self.max_rent = _to_int(payload.get('max_rent'))
+        self.area, self.district = _postcode_district(payload.get('search'))
+
+        if payload.get('available_search') == 'Y':
+            try:
+                today = datetime.date(int(payload['year_avail']), int(payload['month_avail']),
+                                      int(payload['day_avail']))
+            except (KeyError, ValueError):
+                pass
+
+        self.wanted_by = _epoch_day(today.isoformat())
+
+    @classmethod
+    def from_config(cls, config_file, payload=None):
+        """ Create an AdvertRanker from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+                payload: See __init__.
+
+            Returns:
+                An AdvertRanker object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        weights = dict((column, config_loader.get_float('rank_weight_' + column))
+                       for column in COLUMNS)
+
+        return cls(weights, payload, horizon=config_loader.get_int('rank_availability_horizon'))
+
+    def columns(self, adverts):
+        """ Turn the fields of the adverts into columns, in a single
+            pass. Missing fields are NaN.
+
+            Args:
+                adverts: A sequence of Advert objects.
+
+            Returns:
+                A NumPy structured array of COLUMN_TYPES, a row per advert:
+                rent per month, the day it is available from (in days
+                from the epoch), bills included (1 or 0) and the
+                distance score of its postcode district.
+        """
+
+        # Few districts and dates come up, so each is worked out once
+        distances = _Memo(self._distance)
+        days = _Memo(_epoch_day)
+
+        return np.fromiter(((advert.rent, days[advert.available_from], advert.bills_included,
+                             distances[advert.postcode]) for advert in adverts),
+                           dtype=COLUMN_TYPES, count=len(adverts))
+
+    def _distance(self, district):
+        """ Score a postcode district against the one searched. """
+
+        if self.district is None:
+            return np.nan
+
+        area, district = _postcode_district(district)
+
+        if district is None:
+            return np.nan
+        if district == self.district:
+            return 1.0
+        if area == self.area:
+            return 0.5
+
+        return 0.0
+
+    def scores(self, columns):
+        """ Score adverts on their columns.
+
+            Args:
+                columns: The columns of the adverts, see columns.
+
+            Returns:
+                An array with the score of every advert, between 0 and 1.
+        """
+
+        # The rents are parsed per month, the search may be per week
+        rents = columns['rent'] / self.per_factor
+        known = rents[~np.isnan(rents)]
+
+        if self.max_rent:
+            rent = 1 - rents / self.max_rent
+        elif known.size and known.max() > known.min():
+            # Against the cheapest and the dearest of the adverts
+            rent = (known.max() - rents) / (known.max() - known.min())
+        else:
+            rent = np.full(len(columns), NEUTRAL)
+
+        late_by = columns['available_from'] - self.wanted_by
+        availability = 1 - np.clip(late_by, 0, self.horizon) / self.horizon
+
+        scores = {'rent': rent, 'distance': columns['distance'],
+                  'availability': availability, 'bills': columns['bills_included']}
+
+        total = np.zeros(len(columns))
+        total_weight = sum(self.weights[column] for column in COLUMNS)
+
+        if not total_weight:
+            return total
+
+        for column in COLUMNS:
+            score = np.where(np.isnan(scores[column]), NEUTRAL, np.clip(scores[column], 0, 1))
+            total += self.weights[column] * score
+
+        return total / total_weight
+
+    def rank(self, adverts):
+        """ Sort adverts best first.
+
+            Args:
+                adverts: An iterable of Advert objects.
+
+            Returns:
+                A new list of the adverts, best first.
+        """
+
+        adverts = list(adverts)
+
+        if len(adverts) < 2:
+            return adverts
+
+        order = np.argsort(-self.scores(self.columns(adverts)), kind='stable')
+
+        return list(itemgetter(*order.tolist())(adverts))
@@ -0,0 +1,203 @@
+# Standard library imports
+import random
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.custom_exceptions import CircuitOpen
+
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60.0
+
+# Responses worth another try. 429 means we are going too fast,
+# the rest that the server is having a bad moment.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Responses that count as the host failing
+FAILURE_STATUS_CODES = (500, 502, 503, 504)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class RetryPolicy:
+    """ A class that decides how many times a request is tried
+        again and how long to wait before each attempt.
+
+        The waits grow exponentially up to a cap, with full
+        jitter (a random wait between zero and the exponential
+        one), so that requests that failed together don't come
+        back together.
+
+        Only GET requests are ever sent, and they are safe to
+        send again.
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF, seed=None):
+        """ Args:
+                retries: How many times a request is tried again.
+                backoff: The longest wait before the first retry, in seconds.
+                         Doubles after every attempt.
+                max_backoff: The longest wait before any retry.
+                seed: Seeds the jitter, for repeatable waits.
+        """
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a RetryPolicy from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A RetryPolicy object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(retries=config_loader.get_int('retries'),
+                   backoff=config_loader.get_float('retry_backoff'),
+                   max_backoff=config_loader.get_float('retry_max_backoff'))
+
+    def delay(self, attempt):
+        """ Get the wait before a retry.
+
+            Args:
+                attempt: The number of attempts made so far, from 1.
+
+            Returns:
+                The number of seconds to wait.
+        """
+
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+        with self._lock:
+            return self._random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """ A class that stops us from sending requests to a host
+        that keeps failing.
+
+        After failure_threshold failures in a row the circuit of
+        the host opens, and every request to it fails straight
+        away with CircuitOpen. After reset_timeout seconds a single
+        request is let through: if it succeeds the circuit closes
+        again, if not (a 429 or an exception included) it stays
+        open for another reset_timeout. The sender must settle that
+        request one way or the other, see before_request.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, clock=time.monotonic):
+        """ Args:
+                failure_threshold: The failures in a row that open the circuit.
+                reset_timeout: Seconds the circuit stays open for.
+                clock: A function returning the current time in seconds.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trips = 0
+        self._clock = clock
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a CircuitBreaker from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A CircuitBreaker object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(failure_threshold=config_loader.get_int('circuit_failure_threshold'),
+                   reset_timeout=config_loader.get_float('circuit_reset_timeout'))
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+
+        if state is None:
+            state = self._hosts[host] = {'state': CLOSED, 'failures': 0, 'opened_at': 0.0}
+
+        return state
+
+    def before_request(self, host):
+        """ Check that a request to a host may be sent.
+
+            Args:
+                host: The host name the request is for.
+
+            Returns:
+                True if the request is the single one let through a
+                half open circuit. Its outcome must then be recorded
+                with record_success or record_failure, or the circuit
+                stays half open.
+
+            Raises:
+                CircuitOpen: If the host has been failing.
+        """
+
+        with self._lock:
+            state = self._host(host)
+
+            if state['state'] == CLOSED:
+                return False
+
+            retry_in = state['opened_at'] + self.reset_timeout - self._clock()
+
+            # Let a single request through once the timeout is over
+            if state['state'] == OPEN and retry_in <= 0:
+                state['state'] = HALF_OPEN
+                return True
+
+            raise CircuitOpen(host, max(retry_in, 0))
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._host(host)
+            state['state'] = CLOSED
+            state['failures'] = 0
+
+    def record_failure(self, host):
+        """ Count a failed request to a host.
+
+            Returns:
+                True if the failure opened the circuit.
+        """
+
+        with self._lock:
+            state = self._host(host)
+            state['failures'] += 1
+
+            if state['state'] == HALF_OPEN or (state['state'] == CLOSED and
+                                               state['failures'] >= self.failure_threshold):
+                state['state'] = OPEN
+                state['opened_at'] = self._clock()
+                self.trips += 1
+                return True
+
+            return False
+
+    def state(self, host):
+        """ Get the state of the circuit of a host: closed, open or half_open. """
+
+        with self._lock:
+            return self._host(host)['state']
@@ -0,0 +1,177 @@
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+
+# Local imports
+from spareroomScraper.advert import Advert
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DEFAULT_MAX_AGE = 6 * 60 * 60
+
+
+class RunJournal:
+    """ A class that keeps checkpoints of the searches in
+        progress, in a small SQLite database, so that a run
+        that was interrupted resumes where it stopped.
+
+        A checkpoint holds the search id, the offset of the
+        next page to pull, the results found so far and the
+        adverts seen on the pages already pulled. It is
+        updated once every page has been handled and removed
+        once the results have been delivered.
+
+        Checkpoints older than max_age are ignored, since
+        spareroom will have forgotten the search id by then
+        and the results will be out of date.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """ Open (or create) the database.
+
+            Args:
+                path: The path to the SQLite file.
+                max_age: Seconds a checkpoint can be resumed for.
+        """
+
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The shards of a sweep share the file, wait for each other's writes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                '    run_key TEXT PRIMARY KEY,'
+                '    config_file TEXT NOT NULL,'
+                '    search_id TEXT NOT NULL,'
+                '    next_offset INTEGER NOT NULL,'
+                '    updated_at REAL NOT NULL'
+                ')')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoint_results ('
+                '    run_key TEXT NOT NULL,'
+                '    result TEXT NOT NULL'
+                ')')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS checkpoint_results_run_key '
+                'ON checkpoint_results (run_key)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoint_seen ('
+                '    run_key TEXT NOT NULL,'
+                '    advert_id INTEGER NOT NULL,'
+                '    PRIMARY KEY (run_key, advert_id)'
+                ') WITHOUT ROWID')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a RunJournal from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A RunJournal object, or None if checkpoints are disabled.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        path = config_loader.get_item('run_journal')
+
+        if not path:
+            return None
+
+        return cls(path, max_age=config_loader.get_int('run_journal_max_age'))
+
+    def load(self, run_key):
+        """ Look up the checkpoint of a search.
+
+            Args:
+                run_key: The key of the search (see Search._run_key).
+
+            Returns:
+                A dictionary with the search_id, the next_offset, the
+                results found so far and the seen_advert_ids, or None
+                if there is no checkpoint to resume from.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT search_id, next_offset, updated_at FROM checkpoints '
+                'WHERE run_key = ?', (run_key,)).fetchone()
+
+            if row is None:
+                return None
+
+            search_id, next_offset, updated_at = row
+
+            if time.time() - updated_at > self.max_age:
+                with self._connection:
+                    self._delete(run_key)
+                return None
+
+            results = self._connection.execute(
+                'SELECT result FROM checkpoint_results WHERE run_key = ? ORDER BY rowid',
+                (run_key,)).fetchall()
+            seen = self._connection.execute(
+                'SELECT advert_id FROM checkpoint_seen WHERE run_key = ?',
+                (run_key,)).fetchall()
+
+        return {'search_id': search_id,
+                'next_offset': next_offset,
+                'results': [Advert.from_json(result) for result, in results],
+                'seen_advert_ids': set(advert_id for advert_id, in seen)}
+
+    def save(self, run_key, config_file, search_id, next_offset, results=(),
+             seen_advert_ids=()):
+        """ Record the progress of a search, once a page has been handled.
+
+            Args:
+                run_key: The key of the search.
+                config_file: The payload config file of the search.
+                search_id: The search id the pages were pulled with.
+                next_offset: The offset of the next page to pull.
+                results: The results found on the page.
+                seen_advert_ids: The ids of the adverts on the page.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO checkpoints '
+                '(run_key, config_file, search_id, next_offset, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (run_key, config_file, search_id, next_offset, time.time()))
+            self._connection.executemany(
+                'INSERT INTO checkpoint_results (run_key, result) VALUES (?, ?)',
+                [(run_key, result.to_json()) for result in results])
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO checkpoint_seen (run_key, advert_id) VALUES (?, ?)',
+                [(run_key, advert_id) for advert_id in seen_advert_ids
+                 if advert_id is not None])
+
+    def complete(self, run_key):
+        """ Forget the checkpoint of a search whose results have been delivered.
+
+            Args:
+                run_key: The key of the search.
+        """
+
+        with self._lock, self._connection:
+            self._delete(run_key)
+
+    def _delete(self, run_key):
+        for table in ('checkpoints', 'checkpoint_results', 'checkpoint_seen'):
+            self._connection.execute(
+                'DELETE FROM {} WHERE run_key = ?'.format(table), (run_key,))
+
+    def close(self):
+        self._connection.close()
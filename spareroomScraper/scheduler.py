@@ -0,0 +1,231 @@
+# Standard library imports
+import configparser
+import glob
+import os
+import random
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+
+
+DEFAULT_INTERVAL = 15 * 60
+DEFAULT_JITTER = 0.1
+DEFAULT_RESCAN_INTERVAL = 30
+
+# The optional section of a payload config file with its own schedule
+SCHEDULE_SECTION = 'schedule'
+
+
+class ScheduledConfig:
+    """ A payload config file the scheduler is running, and when. """
+
+    __slots__ = ('config_file', 'signature', 'interval', 'next_run')
+
+    def __init__(self, config_file, signature, interval, next_run):
+        self.config_file = config_file
+        self.signature = signature
+        self.interval = interval
+        self.next_run = next_run
+
+
+class SearchScheduler:
+    """ A class that keeps searching with every payload config
+        file in a directory, each one on its own interval.
+
+        It replaces starting a new process per search from cron:
+        the searches run inside one long lived process, so the
+        connections, caches and parser stay warm between runs.
+
+        The directory is scanned every rescan_interval seconds.
+        New config files are picked up, removed ones dropped and
+        edited ones searched again right away. Every run is moved
+        by a random jitter, so that the searches drift apart
+        instead of hitting spareroom all at once.
+
+        A config file can set its own interval (in seconds) with:
+
+            [schedule]
+            interval = 600
+    """
+
+    def __init__(self, directory, run_searches, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 rescan_interval=DEFAULT_RESCAN_INTERVAL, clock=time.monotonic, seed=None):
+        """ Args:
+                directory: The directory of the payload config files (*.ini).
+                run_searches: Called with a list of config files that are
+                              due. Runs their searches and returns a
+                              dictionary mapping each config file to its
+                              number of results, or the exception that
+                              stopped it (see AsyncSearchEngine.run).
+                interval: Seconds between two runs of a config file,
+                          unless the file sets its own.
+                jitter: How much each wait can be moved by, as a share
+                        of the interval, e.g. 0.1 for up to 10% either way.
+                rescan_interval: Seconds between two scans of the directory.
+                clock: A function returning the current time in seconds.
+                seed: Seeds the jitter, for repeatable schedules.
+        """
+
+        self.directory = directory
+        self.run_searches = run_searches
+        self.interval = interval
+        self.jitter = jitter
+        self.rescan_interval = rescan_interval
+        self.runs = 0
+        self.failures = 0
+        self._clock = clock
+        self._random = random.Random(seed)
+        self._configs = {}
+        self._next_scan = None
+        self._stopping = threading.Event()
+
+    @classmethod
+    def from_config(cls, config_file, directory, run_searches):
+        """ Create a SearchScheduler from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+                directory: See __init__.
+                run_searches: See __init__.
+
+            Returns:
+                A SearchScheduler object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(directory, run_searches,
+                   interval=config_loader.get_float('schedule_interval'),
+                   jitter=config_loader.get_float('schedule_jitter'),
+                   rescan_interval=config_loader.get_float('schedule_rescan_interval'))
+
+    @property
+    def config_files(self):
+        return sorted(self._configs)
+
+    def _read_interval(self, config_file):
+        """ Get the interval a config file asks for.
+
+            Args:
+                config_file: The path to the payload config file.
+
+            Returns:
+                The interval in seconds.
+        """
+
+        config = configparser.ConfigParser()
+        config.read(config_file)
+
+        try:
+            interval = config.getfloat(SCHEDULE_SECTION, 'interval', fallback=self.interval)
+        except ValueError:
+            print('{}: the schedule interval is not a number, using {}'.format(
+                config_file, self.interval))
+            return self.interval
+
+        return max(interval, 0)
+
+    def _wait_for(self, interval):
+        """ Get an interval moved by a random jitter. """
+
+        return interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def scan(self):
+        """ Pick up the config files that were added, removed or edited. """
+
+        now = self._clock()
+        config_files = set(glob.glob(os.path.join(self.directory, '*.ini')))
+
+        for config_file in set(self._configs) - config_files:
+            print('No longer searching with {}'.format(config_file))
+            del self._configs[config_file]
+
+        for config_file in sorted(config_files):
+            try:
+                stat = os.stat(config_file)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                scheduled = self._configs.get(config_file)
+
+                if scheduled is not None and scheduled.signature == signature:
+                    continue
+
+                interval = self._read_interval(config_file)
+            except (OSError, configparser.Error) as error:
+                # Probably caught halfway through being written
+                print('Skipping {} for now: {}'.format(config_file, error))
+                continue
+
+            if scheduled is None:
+                print('Searching with {} every {:g}s'.format(config_file, interval))
+                # Spread the first runs over the jitter window
+                first_run = now + self._random.uniform(0, interval * self.jitter)
+                self._configs[config_file] = ScheduledConfig(config_file, signature, interval,
+                                                             first_run)
+            else:
+                print('{} has changed, searching with it again'.format(config_file))
+                scheduled.signature = signature
+                scheduled.interval = interval
+                scheduled.next_run = now
+
+        self._next_scan = now + self.rescan_interval
+
+    def run_pending(self):
+        """ Run the searches that are due, all at once.
+
+            Returns:
+                The outcomes of the searches (see run_searches).
+        """
+
+        now = self._clock()
+        due = [scheduled for scheduled in self._configs.values() if scheduled.next_run <= now]
+
+        if not due:
+            return {}
+
+        config_files = [scheduled.config_file for scheduled in due]
+
+        try:
+            outcomes = self.run_searches(config_files)
+        except Exception as error:
+            print('The searches failed with {!r}'.format(error))
+            outcomes = dict((config_file, error) for config_file in config_files)
+
+        finished = self._clock()
+
+        for scheduled in due:
+            self.runs += 1
+            if isinstance(outcomes.get(scheduled.config_file), Exception):
+                self.failures += 1
+
+            scheduled.next_run = finished + self._wait_for(scheduled.interval)
+
+        return outcomes
+
+    def _seconds_to_next_event(self):
+        wake_up = [self._next_scan] + [scheduled.next_run for scheduled in self._configs.values()]
+
+        return max(min(wake_up) - self._clock(), 0)
+
+    def run_forever(self):
+        """ Keep scanning the directory and running the searches
+            that are due, until stop() is called.
+        """
+
+        self._stopping.clear()
+
+        while not self._stopping.is_set():
+            if self._next_scan is None or self._clock() >= self._next_scan:
+                self.scan()
+
+            self.run_pending()
+
+            self._stopping.wait(self._seconds_to_next_event())
+
+    def stop(self):
+        """ Stop run_forever, once the searches in progress are done.
+            Safe to call from a signal handler or another thread.
+        """
+
+        self._stopping.set()
@@ -1,22 +1,41 @@
 # Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
 import sys
-import time
 import urllib.parse as urlparse
 
-# Third party imports
-from bs4 import BeautifulSoup
-import requests
-
 # Local imports
-from spareroomScraper.custom_exceptions import BadSelector
-from spareroomScraper.emailer import Emailer
-from spareroomScraper.payload import Payload
+from spareroomScraper.advert import Advert, get_advert_id
+from spareroomScraper.advert_details import parse_advert_details
+from spareroomScraper.advert_filter import AdvertFilter
+from spareroomScraper.emailer import MailDispatcher
+from spareroomScraper.page_stream import PageStream
+from spareroomScraper.parsers import get_parser
+from spareroomScraper.payload import Payload, payload_key
+from spareroomScraper.ranking import AdvertRanker
+from spareroomScraper.selector_monitor import ADVERT_URLS, DEFAULT_SELECTORS, SelectorMonitor
+from spareroomScraper.sinks import EmailDigestSink
+from spareroomScraper.transport import Transport
 
 
 DOMAIN = 'https://www.spareroom.co.uk/'
-SEARCH_ENDPOINT = 'https://www.spareroom.co.uk/flatshare/'
-ADVANCED_SEARCH_ENDPOINT = 'https://www.spareroom.co.uk/flatshare/search.pl'
-ADVERTS_URLS_SELECTOR = '.listing-results-content.desktop > a'
+SEARCH_PATH = 'flatshare/'
+ADVANCED_SEARCH_PATH = 'flatshare/search.pl'
+SEARCH_ENDPOINT = DOMAIN + SEARCH_PATH
+ADVANCED_SEARCH_ENDPOINT = DOMAIN + ADVANCED_SEARCH_PATH
+ADVERTS_URLS_SELECTOR = DEFAULT_SELECTORS[ADVERT_URLS][0]
+# The element holding the results. Streamed pages stop being read once it closes
+RESULTS_CONTAINER_SELECTOR = 'ul.listing-results'
+# Matches the total in the results header, e.g. "1-10 of <strong>1,234</strong> results"
+RESULTS_COUNT_PATTERN = re.compile(r'of\s*(?:<[^>]*>\s*)*([\d,]+)\+?\s*(?:<[^>]*>\s*)*results')
+SCRAPER_CONFIG = 'spareroomScraper/conf/scraper_config.ini'
+EMAILER_CONFIG = 'spareroomScraper/conf/emailer_config.ini'
+
+DEFAULT_PREFETCH_WORKERS = 4
+DEFAULT_DETAIL_WORKERS = 4
 
 class Search:
     """ A class that scrapes Spareroom for adverts,
@@ -27,7 +46,12 @@ class Search:
         Payload class.
     """
 
-    def __init__(self, config_file, number_of_pages, offset):
+    def __init__(self, config_file, number_of_pages, offset, transport=None,
+                 prefetch_workers=DEFAULT_PREFETCH_WORKERS, search_id_cache=None,
+                 seen_adverts=None, parser=None, filter_adverts=False, details_cache=None,
+                 detail_workers=DEFAULT_DETAIL_WORKERS, payload_cache=None, domain=DOMAIN,
+                 journal=None, deduplicator=None, variant=None, stream_pages=False,
+                 selector_monitor=None):
         """ Initialise the payload and get the search_id for
             the search criteria specified in the config file.
 
@@ -35,13 +59,187 @@ class Search:
                 config_file: The path to the config file.
                 number_of_pages: The number of pages to scrape.
                                  Each page contains 10 results.
+                transport: A Transport object to send the requests with.
+                           Share one between searches to reuse connections.
+                           A new one is created if not provided.
+                prefetch_workers: The number of result pages fetched in
+                                  parallel, once the first page tells us
+                                  how many results there are.
+                search_id_cache: A SearchIdCache to look the search_id
+                                 up in, before asking spareroom for it.
+                seen_adverts: A SeenAdverts store. If provided, only the
+                              adverts this search hasn't reported before
+                              are returned, and paging stops at the first
+                              page without any new ones.
+                parser: The HTML parser backend used on the result pages
+                        (see parsers.get_parser). The fastest one
+                        installed is used if not provided.
+                filter_adverts: If True, every advert page is fetched and
+                                checked against the search criteria.
+                details_cache: An AdvertDetailsCache, so that unchanged
+                               advert pages are not fetched again.
+                detail_workers: The number of advert pages fetched in parallel.
+                payload_cache: A PayloadCache, so that the config file is
+                               only compiled again when it changes.
+                domain: The site to search, e.g. a local stand-in
+                        for benchmarks. Must end with a slash.
+                journal: A RunJournal. If provided, the progress of the
+                         search is checkpointed after every page, and a
+                         search that was interrupted resumes from its
+                         checkpoint instead of starting over.
+                deduplicator: An AdvertDeduplicator shared by the searches
+                              of a run. Adverts another search has already
+                              delivered are left out of the results.
+                variant: A SweepVariant of the config file (see
+                         PayloadSweep) to search with, instead of
+                         the payload of the config file itself.
+                stream_pages: If True, the result pages are read from the
+                              network a chunk at a time and their links
+                              used as soon as they are read. Reading
+                              stops at the end of the results, and the
+                              rest of the page is never downloaded.
+                selector_monitor: A SelectorMonitor with the selectors of the
+                                  advert links, tried in order. A page none
+                                  of them matches stops the search with a
+                                  warning. One with the default selectors
+                                  is created if not provided.
         """
 
         self.config_file = config_file
+        self.variant = variant
+        # The config file, and which of its variants this is
+        self.name = (config_file if variant is None
+                     else '{} [{}]'.format(config_file, variant.label))
+        self.domain = domain
+        self.search_endpoint = domain + SEARCH_PATH
+        self.advanced_search_endpoint = domain + ADVANCED_SEARCH_PATH
         self.number_of_pages = number_of_pages
         self.offset = offset
+        self.transport = transport if transport is not None else Transport()
+        self.metrics = self.transport.metrics
+        self.prefetch_workers = prefetch_workers
+        self.search_id_cache = search_id_cache
+        self.search_id_from_cache = False
+        self.seen_adverts = seen_adverts
+        self.seen_advert_ids = set()
+        self.page_advert_ids = []
+        self.parser = parser if parser is not None else get_parser()
+        self.details_cache = details_cache
+        self.detail_workers = detail_workers
+        # The adverts that have been through the filter, until they are delivered
+        self.adverts = {}
+        self.payload_cache = payload_cache
+        self.deduplicator = deduplicator
+        self.selector_monitor = (selector_monitor if selector_monitor is not None
+                                 else SelectorMonitor(metrics=self.metrics))
+        # Pages can only be streamed with a selector the LinkExtractor supports
+        self.stream_pages = (stream_pages and
+                             self.selector_monitor.chain(ADVERT_URLS).streamable is not None)
+        # Set when a page had no advert links we could find, see _report_missing_adverts
+        self.markup_changed = False
+        # The config files whose results this search delivers,
+        # when identical searches are coalesced into it
+        self.subscribers = [self.name]
+        self.results_count = None
         self.advanced_search_payload = self._get_advanced_search_payload()
-        self.search_id = self._get_search_id()
+        self.search_key = payload_key(self.advanced_search_payload)
+        self.advert_filter = AdvertFilter(self.advanced_search_payload) if filter_adverts else None
+        self.journal = journal
+        self.run_key = self._run_key()
+        self.checkpoint = self._load_checkpoint()
+        self.start_offset = self.checkpoint['next_offset'] if self.checkpoint else 0
+        self.search_id = self._get_initial_search_id()
+
+    def _get_initial_search_id(self):
+        """ Get the search id when the search is created.
+
+            Returns:
+                search_id: The id of the search.
+        """
+
+        if self.checkpoint is not None:
+            return self._resumed_search_id()
+
+        return self._get_search_id()
+
+    def _run_key(self):
+        """ Get the key of the checkpoints of this search. A search
+            is only resumed by a search for the same config file
+            and payload, pulling the same pages the same way.
+
+            Returns:
+                A hex digest.
+        """
+
+        key = json.dumps([os.path.abspath(self.config_file), self.search_key,
+                          self.number_of_pages, self.offset,
+                          self.advert_filter is not None, self.seen_adverts is not None])
+
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _load_checkpoint(self):
+        """ Look up the checkpoint of an interrupted run of this search.
+
+            Returns:
+                The checkpoint (see RunJournal.load), or None.
+        """
+
+        if self.journal is None:
+            return None
+
+        checkpoint = self.journal.load(self.run_key)
+
+        if checkpoint is not None:
+            print('Resuming {} from offset {} with {} results'.format(
+                self.name, checkpoint['next_offset'], len(checkpoint['results'])))
+            self.metrics.increment('resumed_searches_total')
+            self.seen_advert_ids.update(checkpoint['seen_advert_ids'])
+
+        return checkpoint
+
+    def _resumed_search_id(self):
+        """ Get the search id of the interrupted run. It may have
+            expired since, so it is checked like a cached one.
+
+            Returns:
+                search_id: The id of the search.
+        """
+
+        self.search_id_from_cache = True
+
+        return self.checkpoint['search_id']
+
+    def _save_checkpoint(self, next_offset, results, seen_advert_ids):
+        """ Record that a page has been handled.
+
+            Args:
+                next_offset: The offset of the page after it.
+                results: The results found on the page.
+                seen_advert_ids: The ids of the adverts on the page.
+        """
+
+        if self.journal is not None:
+            self.journal.save(self.run_key, self.config_file, self.search_id, next_offset,
+                              results, seen_advert_ids)
+
+    def _resumed_results(self):
+        """ Get the results the interrupted run had found,
+            so that they are delivered along with the rest.
+
+            Returns:
+                A list of Advert objects.
+        """
+
+        if self.checkpoint is None:
+            return []
+
+        return self.checkpoint['results']
+
+    def _complete_run(self):
+        """ Forget the checkpoint, once the results have been delivered. """
+
+        if self.journal is not None:
+            self.journal.complete(self.run_key)
 
     def _get_advanced_search_payload(self):
         """ Generate the payload for this search.
@@ -50,18 +248,128 @@ class Search:
                 The payload in a dictionary format.
         """
 
-        payload = Payload(self.config_file)
+        # Already compiled along with the rest of the sweep
+        if self.variant is not None:
+            return self.variant.compiled.as_dict()
+
+        payload = Payload(self.config_file, cache=self.payload_cache)
 
         return payload.get_advanced_search_payload()
 
     def _get_search_id(self):
         """ Get the search id for this specific search.
 
+            The search id cache is checked first, if there is one.
+
+            Returns:
+                search_id: The id of the search.
+        """
+
+        with self.metrics.timer('stage_seconds', stage='search_id'):
+            search_id = self._get_cached_search_id()
+
+            if search_id is not None:
+                self.metrics.increment('search_ids_total', source='cache')
+                return search_id
+
+            response = self._make_request(self.advanced_search_endpoint,
+                                          self.advanced_search_payload)
+            self.metrics.increment('search_ids_total', source='spareroom')
+
+            return self._cache_search_id(self._parse_search_id(response))
+
+    def _get_cached_search_id(self):
+        """ Look up the search id of this search in the cache.
+
             Returns:
+                search_id: The id of the search, or None.
+        """
+
+        if self.search_id_cache is None:
+            return None
+
+        search_id = self.search_id_cache.get(self.advanced_search_payload)
+
+        self.search_id_from_cache = search_id is not None
+
+        return search_id
+
+    def _cache_search_id(self, search_id):
+        """ Store the search id of this search in the cache.
+
+            Args:
                 search_id: The id of the search.
+
+            Returns:
+                search_id: The same id, for convenience.
+        """
+
+        self.search_id_from_cache = False
+
+        if self.search_id_cache is not None:
+            self.search_id_cache.set(self.advanced_search_payload, search_id)
+
+        return search_id
+
+    def _search_id_is_stale(self, response):
+        """ Check whether a page request was turned down because
+            spareroom no longer knows the search id we got from the cache.
+
+            Args:
+                response: A requests.Response object of a results page.
+
+            Returns:
+                True if the cached search id has to be resolved again.
+        """
+
+        if not self.search_id_from_cache:
+            return False
+
+        url_parameters = urlparse.parse_qs(urlparse.urlparse(response.url).query)
+
+        # An expired search redirects away from our search_id
+        return url_parameters.get('search_id', [None])[0] != self.search_id
+
+    def _drop_stale_search_id(self, first_page):
+        """ Check the first page of results for a stale search id.
+            If spareroom turned it down, the page is closed and the
+            search id is dropped, along with its cache entry.
+
+            Both engines then resolve a new search id and request
+            the page again, each in their own way.
+
+            Args:
+                first_page: A requests.Response object of the first page.
+
+            Returns:
+                True if the search id was dropped.
         """
 
-        response = self._make_request(ADVANCED_SEARCH_ENDPOINT, self.advanced_search_payload)
+        if not self._search_id_is_stale(first_page):
+            return False
+
+        first_page.close()
+
+        print('The cached search id {} has expired'.format(self.search_id))
+        self.metrics.increment('retries_total', reason='stale_search_id')
+
+        if self.search_id_cache is not None:
+            self.search_id_cache.invalidate(self.advanced_search_payload)
+        self.search_id = None
+        self.search_id_from_cache = False
+
+        return True
+
+    def _parse_search_id(self, response):
+        """ Extract the search id from the url we got
+            redirected to by the advanced search.
+
+            Args:
+                response: A requests.Response object.
+
+            Returns:
+                search_id: The id of the search.
+        """
 
         url = response.url
 
@@ -76,12 +384,17 @@ class Search:
 
         return search_id
 
-    def _make_request(self, url, payload=None):
+    def _make_request(self, url, payload=None, headers=None, stream=False):
         """ Make a request to a specific endpoint.
 
+            The transport's politeness scheduler makes sure
+            we are gentle with the requests.
+
             Args:
                 url: The endpoint url
                 payload: The payload in a dict format
+                headers: Any additional request headers
+                stream: Whether the body is left to be read later.
 
             Returns:
                 response: A requests.Response object.
@@ -90,36 +403,191 @@ class Search:
                 Raises stored HTTPError, if one occurred.
         """
 
-        session = requests.session()
-
-        response = session.get(url, params=payload)
+        with self.metrics.timer('stage_seconds', stage='request'):
+            response = self.transport.get(url, payload, headers=headers, stream=stream)
 
         # Raise any HTTP status errors
+        if not response.ok:
+            response.close()
         response.raise_for_status()
 
-        # Be gentle with the requests!
-        time.sleep(5)
-
         return response
 
+    def _stream_page(self, response):
+        """ Wrap the streamed response of a page of results. """
+
+        return PageStream(response, self.selector_monitor.chain(ADVERT_URLS).streamable,
+                          RESULTS_CONTAINER_SELECTOR, metrics=self.metrics)
+
+    def _request_page(self, offset, read=False):
+        """ Request a page of results.
+
+            Args:
+                offset: The offset of the first result of the page.
+                read: Whether a streamed page is read straight away,
+                      e.g. when it is prefetched in another thread.
+
+            Returns:
+                response: A requests.Response object, or a PageStream
+                          if the pages are streamed.
+        """
+
+        response = self._make_request(self.search_endpoint, self._page_payload(offset),
+                                      stream=self.stream_pages)
+
+        if not self.stream_pages:
+            return response
+
+        page = self._stream_page(response)
+
+        return page.read() if read else page
+
+    def _page_offsets(self):
+        """ Get the offsets of the pages to pull.
+
+            Returns:
+                A range of offsets, one for each page.
+        """
+
+        return range(self.start_offset, self.number_of_pages*self.offset, self.offset)
+
+    def _page_payload(self, offset):
+        """ Set up the payload for a single page of results.
+
+            Args:
+                offset: The offset of the first result of the page.
+
+            Returns:
+                The payload in a dictionary format.
+        """
+
+        return {'offset': offset,
+                'search_id': self.search_id,
+                'sort_by': 'days_since_placed',
+                'mode': 'list'
+        }
+
+    def _get_results_count(self, response):
+        """ Get the total number of results from a page of results.
+
+            Args:
+                response: A requests.Response object
+
+            Returns:
+                The number of results, or None if it can't be found.
+        """
+
+        match = RESULTS_COUNT_PATTERN.search(response.text)
+
+        if match is None:
+            return None
+
+        return int(match.group(1).replace(',', ''))
+
+    def _remaining_offsets(self, first_page):
+        """ Get the offsets of the pages left to pull after the first one.
+
+            Args:
+                first_page: The requests.Response object of the first page.
+
+            Returns:
+                A list of offsets, or None if the number of results is
+                unknown and the pages have to be pulled one by one.
+        """
+
+        results_count = self.results_count = self._get_results_count(first_page)
+
+        if results_count is None:
+            return None
+
+        return [i for i in list(self._page_offsets())[1:] if i < results_count]
+
+    def covers_all_results(self):
+        """ Check whether the pages we pull hold every result of the search.
+
+            Returns:
+                True if spareroom has no results beyond the pages we pull.
+        """
+
+        return (self.results_count is not None and
+                self.results_count <= self.number_of_pages*self.offset)
+
     def _pull_pages(self):
         """ Pull a number of pages from the results of the search.
 
+            The first page tells us how many results there are,
+            so the pages that exist are then prefetched in parallel.
+            They are still yielded in order.
+
+            When only new adverts are wanted, we expect to stop after
+            a page or two, so the pages are pulled one by one instead.
+
             Yields:
                 response: A requests.Response object
         """
 
-        previous_url = ''
+        offsets = list(self._page_offsets())
+
+        if not offsets:
+            return
+
+        first_page = self._request_page(offsets[0])
+
+        if self._drop_stale_search_id(first_page):
+            self.search_id = self._get_search_id()
+            first_page = self._request_page(offsets[0])
+
+        yield first_page
+
+        remaining_offsets = self._remaining_offsets(first_page)
 
-        for i in range(0, self.number_of_pages*self.offset, self.offset):
-            # Set up additional payload attributes.
-            payload = {'offset': i,
-                       'search_id': self.search_id,
-                       'sort_by': 'days_since_placed',
-                       'mode': 'list'
-            }
+        if remaining_offsets is None:
+            # We don't know where the results end. Pull the
+            # pages one after another until they start repeating.
+            yield from self._pull_pages_serially(offsets[1:], first_page.url)
+            return
 
-            response = self._make_request(SEARCH_ENDPOINT, payload)
+        if self.seen_adverts is not None:
+            yield from self._pull_pages_serially(remaining_offsets, first_page.url)
+            return
+
+        previous_url = first_page.url
+
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers) as executor:
+            # Streamed pages are read where they are fetched,
+            # so that no connection is held while they wait
+            futures = [executor.submit(self._request_page, i, True)
+                       for i in remaining_offsets]
+
+            try:
+                for future in futures:
+                    response = future.result()
+
+                    # Stop early if the results ended sooner than expected
+                    if previous_url == response.url:
+                        break
+                    else:
+                        previous_url = response.url
+
+                    yield response
+            finally:
+                # Don't send the requests we no longer need
+                for future in futures:
+                    future.cancel()
+
+    def _pull_pages_serially(self, offsets, previous_url=''):
+        """ Pull pages one after another.
+
+            Args:
+                offsets: The offsets of the pages to pull.
+                previous_url: The url of the page pulled before these.
+
+            Yields:
+                response: A requests.Response object
+        """
+
+        for i in offsets:
+            response = self._request_page(i)
 
             # If response.url is the same as the url of the
             # previous request, then there are no more pages.
@@ -141,19 +609,174 @@ class Search:
                 The url of each page returned by the search.
 
             Raises:
-                BadSelector: If the CSS selector doesn't return any results.
+                BadSelector: If no selector returns any results,
+                             in strict mode.
         """
 
-        page = BeautifulSoup(response.content, 'html.parser')
+        if isinstance(response, PageStream):
+            yield from self._get_streamed_adverts_urls(response)
+            return
 
-        adverts_urls = page.select(ADVERTS_URLS_SELECTOR)
+        with self.metrics.timer('stage_seconds', stage='parse_page'):
+            adverts_urls = self.selector_monitor.select_links(ADVERT_URLS, self.parser,
+                                                              response.content)
+
+        self.metrics.increment('adverts_found_total', len(adverts_urls))
 
         if not adverts_urls:
-            raise BadSelector('The CSS selector for the urls might have changed!')
+            self._report_missing_adverts(response, response.content)
+
+        for advert_url in adverts_urls:
+            yield self.domain + advert_url
+
+    def _get_streamed_adverts_urls(self, page):
+        """ Get the advert results of a streamed page, as they are read.
+
+            Args:
+                page: A PageStream
+
+            Yields:
+                The url of each page returned by the search.
+
+            Raises:
+                BadSelector: If no selector returns any results,
+                             in strict mode.
+        """
+
+        adverts_found = 0
+
+        for advert_url in page.links():
+            adverts_found += 1
+            yield self.domain + advert_url
+
+        if adverts_found:
+            self.selector_monitor.record_match(ADVERT_URLS, page.selector)
+        else:
+            # The page was kept whole, the other selectors get a go at it
+            with self.metrics.timer('stage_seconds', stage='parse_page'):
+                adverts_urls = self.selector_monitor.select_links(ADVERT_URLS, self.parser,
+                                                                  page.text)
+
+            if not adverts_urls:
+                self._report_missing_adverts(page, page.text)
+
+            for advert_url in adverts_urls:
+                adverts_found += 1
+                yield self.domain + advert_url
+
+        self.metrics.increment('adverts_found_total', adverts_found)
+
+    def _report_missing_adverts(self, response, content):
+        """ Deal with a page of results without any advert links.
+
+            A search without results is fine. Otherwise spareroom
+            has most likely changed its markup: the monitor warns
+            and saves the page, and the search stops, rather than
+            pulling more pages we can't read.
+
+            Args:
+                response: A requests.Response object, or a PageStream.
+                content: The page.
+
+            Raises:
+                BadSelector: In strict mode.
+        """
+
+        if self._get_results_count(response) == 0:
+            return
+
+        self.markup_changed = True
+        self.selector_monitor.miss(ADVERT_URLS, content, response.url)
+
+    def _get_page_adverts_urls(self, response):
+        """ Get the advert urls of a single page, leaving out
+            the ones this search has already reported, if we
+            are keeping track of them.
+
+            Args:
+                response: A requests.Response object
+
+            Returns:
+                The advert urls, or None if every advert on the page
+                has been seen before. The results are sorted by
+                days_since_placed, so there is nothing new after it.
+                Without any to leave out, the urls are an iterator
+                that streamed pages are read through.
+        """
+
+        if self.seen_adverts is None:
+            return self._get_all_adverts_urls(response)
+
+        adverts_urls = list(self._get_all_adverts_urls(response))
+
+        advert_ids = [get_advert_id(advert_url) for advert_url in adverts_urls]
+        new_advert_ids = self.seen_adverts.unseen(self.search_key, advert_ids)
+
+        self.page_advert_ids = advert_ids
+        self.seen_advert_ids.update(advert_ids)
+
+        if not new_advert_ids and None not in advert_ids:
+            return None
 
-        for advert_url in adverts_urls: 
-            # This is a bs4 object
-            yield DOMAIN + advert_url['href']
+        return [advert_url for advert_url, advert_id in zip(adverts_urls, advert_ids)
+                if advert_id is None or advert_id in new_advert_ids]
+
+    def _mark_adverts_seen(self):
+        """ Remember the adverts on the pages we pulled,
+            once their results have been delivered.
+        """
+
+        if self.seen_adverts is not None:
+            self.seen_adverts.add(self.search_key, self.seen_advert_ids)
+
+    def _get_advert_details(self, url):
+        """ Get the parsed details of an advert.
+
+            The details cache is checked first. Recent entries are
+            used as they are, older ones are revalidated with a
+            conditional request, so an unchanged page is never
+            downloaded twice.
+
+            Args:
+                url: The url of the advert.
+
+            Returns:
+                The dictionary returned by parse_advert_details.
+        """
+
+        advert_id = get_advert_id(url)
+        cached = None
+        headers = None
+
+        if self.details_cache is not None and advert_id is not None:
+            cached = self.details_cache.get(advert_id)
+
+        if cached is not None:
+            details, last_modified, fresh = cached
+
+            if fresh:
+                self.metrics.increment('advert_details_total', source='cache')
+                return details
+
+            if last_modified:
+                headers = {'If-Modified-Since': last_modified}
+
+        response = self._make_request(url, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            self.metrics.increment('advert_details_total', source='revalidated')
+            details = cached[0]
+            last_modified = response.headers.get('Last-Modified', cached[1])
+        else:
+            self.metrics.increment('advert_details_total', source='spareroom')
+            with self.metrics.timer('stage_seconds', stage='parse_advert'):
+                details = parse_advert_details(response.content)
+            last_modified = response.headers.get('Last-Modified')
+
+        if self.details_cache is not None and advert_id is not None:
+            self.details_cache.set(advert_id, details, last_modified)
+
+        return details
 
     def _filter_advert(self, url):
         """ Filter the results further more.
@@ -164,29 +787,163 @@ class Search:
 
             Args:
                 url: The url of the source to scrape.
+
+            Returns:
+                True if the advert matches the search criteria.
         """
 
-        # -- TODO --
-        # For now just return True until this is implemented
-        # request = self._make_request(url)
+        if self.advert_filter is None:
+            return True
+
+        advert = Advert(self.name, get_advert_id(url), url, **self._get_advert_details(url))
+        self.adverts[url] = advert
+
+        return self.advert_filter.matches(advert)
+
+    def _filter_adverts(self, adverts_urls):
+        """ Filter the adverts of a page, fetching their
+            pages in parallel.
+
+            Args:
+                adverts_urls: The urls of the adverts.
+
+            Returns:
+                The urls of the adverts that match, in the same order.
+                Without a filter, adverts_urls itself.
+        """
+
+        if self.advert_filter is None:
+            return adverts_urls
+
+        adverts_urls = list(adverts_urls)
+
+        if not adverts_urls:
+            return adverts_urls
+
+        with self.metrics.timer('stage_seconds', stage='filter_adverts'), \
+                ThreadPoolExecutor(max_workers=self.detail_workers) as executor:
+            matches = list(executor.map(self._filter_advert, adverts_urls))
+
+        return [advert_url for advert_url, match in zip(adverts_urls, matches) if match]
+
+    def _make_result(self, advert_url):
+        """ Put together the result for an advert.
+
+            Args:
+                advert_url: The url of the advert.
+
+            Returns:
+                An Advert with the search, the advert id and url
+                and any details we parsed from the advert page.
+        """
+
+        advert = self.adverts.pop(advert_url, None)
+
+        if advert is None:
+            advert = Advert(self.name, get_advert_id(advert_url), advert_url)
+
+        return advert
+
+    def _is_duplicate(self, result):
+        """ Check whether another search of the run has already
+            delivered the advert of a result.
+
+            Args:
+                result: An Advert.
+
+            Returns:
+                True if the result should be left out.
+        """
+
+        if self.deduplicator is None or self.deduplicator.claim(result):
+            return False
+
+        self.metrics.increment('duplicate_adverts_total')
+
         return True
 
-    def search(self):
-        """ Perform a search
+    def results(self):
+        """ Perform the search.
 
             Yields:
-                advert_url: The urls for the pages that match
-                            the search criteria.
+                result: An Advert for every advert that matches
+                        the search criteria, as soon as it is found.
         """
 
-        search_results = []
+        for result in self._resumed_results():
+            if not self._is_duplicate(result):
+                self.metrics.increment('results_total')
+                yield result
+
+        pages = self.metrics.timed(self._pull_pages(), 'stage_seconds', stage='pull_pages')
+        page_number = 0
+
+        for page_number, response in enumerate(pages, 1):
+            self.page_advert_ids = []
+            page_adverts_urls = self._get_page_adverts_urls(response)
+
+            # Nothing new from here on
+            if page_adverts_urls is None:
+                break
 
-        for response in self._pull_pages():
-            for advert_url in self._get_all_adverts_urls(response):
+            page_results = []
+
+            for advert_url in self._filter_adverts(page_adverts_urls):
+                result = self._make_result(advert_url)
+                page_results.append(result)
+
+                if not self._is_duplicate(result):
+                    self.metrics.increment('results_total')
+                    yield result
+
+            # The rest of the pages can't be read either
+            if self.markup_changed:
+                break
 
-                if self._filter_advert(advert_url):
-                    search_results.append('<h4>' + advert_url + '</h4>')
+            self._save_checkpoint(self.start_offset + page_number*self.offset, page_results,
+                                  self.page_advert_ids)
 
-        # Send an email with the results
-        emailer = Emailer('emailer_config.ini')
-        emailer.send_gmail(''.join(search_results))
+        # Every page has been handled, a rerun only has to deliver the
+        # results. A resume that pulled nothing leaves the checkpoint
+        # as it was, so that it still expires.
+        if page_number:
+            self._save_checkpoint(self.number_of_pages*self.offset, [], [])
+
+    def search(self, sinks=None):
+        """ Perform a search and send every result to the sinks
+            as soon as it is found.
+
+            Args:
+                sinks: A list of Sink objects. They are flushed once
+                       the search is done, but not closed. If not
+                       provided, the results are emailed.
+        """
+
+        dispatcher = None
+
+        if sinks is None:
+            dispatcher = MailDispatcher.from_config(EMAILER_CONFIG, metrics=self.metrics)
+            # Don't bother sending an empty email when only new adverts are wanted
+            sinks = [EmailDigestSink(dispatcher, send_empty=self.seen_adverts is None,
+                                     ranker=AdvertRanker.from_config(
+                                         SCRAPER_CONFIG, self.advanced_search_payload))]
+
+        try:
+            try:
+                for result in self.results():
+                    with self.metrics.timer('stage_seconds', stage='sinks'):
+                        for sink in sinks:
+                            sink.write(result)
+            finally:
+                with self.metrics.timer('stage_seconds', stage='sinks'):
+                    for sink in sinks:
+                        sink.flush()
+
+            if dispatcher is not None:
+                dispatcher.dispatch()
+        finally:
+            if dispatcher is not None:
+                dispatcher.close()
+
+        self._mark_adverts_seen()
+        self._complete_run()
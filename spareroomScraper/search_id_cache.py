@@ -0,0 +1,121 @@
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.payload import payload_key
+
+
+DEFAULT_TTL = 6 * 60 * 60
+
+
+class SearchIdCache:
+    """ A class that remembers the search_id spareroom gave us
+        for a payload, in a small SQLite database.
+
+        Repeated runs of the same search can then skip the
+        request to the ADVANCED_SEARCH_ENDPOINT altogether.
+        Entries expire after ttl seconds, or as soon as a page
+        request shows that spareroom no longer knows the id.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        """ Open (or create) the cache database.
+
+            Args:
+                path: The path to the SQLite file.
+                ttl: The number of seconds a search_id is trusted for.
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The shards of a sweep share the file, wait for each other's writes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS search_ids ('
+                '    payload_key TEXT PRIMARY KEY,'
+                '    search_id TEXT NOT NULL,'
+                '    created_at REAL NOT NULL'
+                ')')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a SearchIdCache from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A SearchIdCache object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('search_id_cache'),
+                   ttl=config_loader.get_int('search_id_ttl'))
+
+    def get(self, payload):
+        """ Look up the search_id of a payload.
+
+            Args:
+                payload: The payload in a dictionary format.
+
+            Returns:
+                The search_id, or None if it is unknown or expired.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT search_id, created_at FROM search_ids WHERE payload_key = ?',
+                (payload_key(payload),)).fetchone()
+
+        if row is None:
+            return None
+
+        search_id, created_at = row
+
+        if time.time() - created_at > self.ttl:
+            self.invalidate(payload)
+            return None
+
+        return search_id
+
+    def set(self, payload, search_id):
+        """ Remember the search_id of a payload.
+
+            Args:
+                payload: The payload in a dictionary format.
+                search_id: The id of the search.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO search_ids (payload_key, search_id, created_at) '
+                'VALUES (?, ?, ?)',
+                (payload_key(payload), search_id, time.time()))
+
+    def invalidate(self, payload):
+        """ Forget the search_id of a payload.
+
+            Args:
+                payload: The payload in a dictionary format.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM search_ids WHERE payload_key = ?', (payload_key(payload),))
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,107 @@
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+
+
+class SeenAdverts:
+    """ A class that remembers which adverts each search
+        has already reported, in a small SQLite database.
+
+        Adverts are keyed by their id and by the search
+        (the payload key) that found them, so two clients
+        with different searches don't hide adverts from
+        each other.
+    """
+
+    def __init__(self, path):
+        """ Open (or create) the database.
+
+            Args:
+                path: The path to the SQLite file.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The shards of a sweep share the file, wait for each other's writes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS seen_adverts ('
+                '    search_key TEXT NOT NULL,'
+                '    advert_id INTEGER NOT NULL,'
+                '    first_seen REAL NOT NULL,'
+                '    PRIMARY KEY (search_key, advert_id)'
+                ') WITHOUT ROWID')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a SeenAdverts store from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A SeenAdverts object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('seen_adverts'))
+
+    def unseen(self, search_key, advert_ids):
+        """ Find out which adverts a search hasn't reported yet.
+
+            Args:
+                search_key: The payload key of the search.
+                advert_ids: An iterable of advert ids.
+
+            Returns:
+                The set of advert ids that are new to this search.
+        """
+
+        advert_ids = set(advert_id for advert_id in advert_ids if advert_id is not None)
+
+        if not advert_ids:
+            return set()
+
+        placeholders = ','.join('?' * len(advert_ids))
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT advert_id FROM seen_adverts '
+                'WHERE search_key = ? AND advert_id IN ({})'.format(placeholders),
+                [search_key] + list(advert_ids)).fetchall()
+
+        return advert_ids - set(row[0] for row in rows)
+
+    def add(self, search_key, advert_ids):
+        """ Remember that a search has reported some adverts.
+
+            Args:
+                search_key: The payload key of the search.
+                advert_ids: An iterable of advert ids.
+        """
+
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO seen_adverts (search_key, advert_id, first_seen) '
+                'VALUES (?, ?, ?)',
+                [(search_key, advert_id, now) for advert_id in advert_ids
+                 if advert_id is not None])
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,336 @@
+# Standard library imports
+from functools import lru_cache
+import glob
+import itertools
+import os
+import threading
+import time
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.custom_exceptions import BadSelector
+from spareroomScraper.parsers import compile_simple_selector
+
+
+# The links to the adverts on a page of results
+ADVERT_URLS = 'advert_urls'
+
+# The selectors of every field, tried in order until one matches.
+# The first one is what spareroom uses today, the rest are looser
+# guesses that should survive small changes to the markup.
+DEFAULT_SELECTORS = {
+    ADVERT_URLS: ('.listing-results-content.desktop > a',
+                  'a.listing-results-link',
+                  'ul.listing-results a[href*="flatshare_detail"]'),
+}
+
+DUMP_EXTENSION = '.html'
+
+# Numbers the pages saved by this process, so that their names never clash
+_dump_numbers = itertools.count(1)
+
+
+class SelectorChain:
+    """ The selectors of a field, in the order they are tried. """
+
+    def __init__(self, field, selectors):
+        """ Args:
+                field: The name of the field, e.g. advert_urls.
+                selectors: The CSS selectors, best first.
+
+            Raises:
+                ValueError: If there are no selectors.
+        """
+
+        if not selectors:
+            raise ValueError('No selectors for ' + field)
+
+        self.field = field
+        self.selectors = tuple(selectors)
+
+        # The first selector that can be matched while a page is still
+        # being read. Every backend parser keeps its own compiled ones.
+        self.streamable = None
+        for selector in self.selectors:
+            try:
+                compile_simple_selector(selector)
+            except ValueError:
+                continue
+
+            self.streamable = selector
+            break
+
+    @property
+    def primary(self):
+        return self.selectors[0]
+
+    def select_links(self, parser, content):
+        """ Get the links of the first selector that matches anything.
+
+            Args:
+                parser: The HTML parser backend (see parsers.get_parser).
+                content: The HTML document, as bytes or text.
+
+            Returns:
+                A tuple of the links and the selector that matched them,
+                or of an empty list and None if none of them did.
+        """
+
+        for selector in self.selectors:
+            links = parser.select_links(content, selector)
+
+            if links:
+                # Looser selectors can pick up an advert's link more than once
+                return list(dict.fromkeys(links)), selector
+
+        return [], None
+
+
+@lru_cache(maxsize=None)
+def compile_selector_chain(field, selectors):
+    """ Compile the selectors of a field, once per process.
+
+        Args:
+            field: The name of the field.
+            selectors: A tuple of CSS selectors, best first.
+
+        Returns:
+            A SelectorChain object.
+    """
+
+    return SelectorChain(field, selectors)
+
+
+class SelectorMonitor:
+    """ A class that keeps an eye on the selectors we pick things
+        out of spareroom's pages with.
+
+        Each field has a chain of selectors, tried in order until
+        one matches. Which one matched is counted, so that a drop
+        in the hit rate of the first one shows up before the
+        fallbacks run out too.
+
+        When no selector of a field matches, the page is saved to
+        the dump directory, to be replayed offline (see replay)
+        against new selectors. The search is then told to stop,
+        with a warning, instead of failing the whole run. In strict
+        mode BadSelector is raised instead.
+
+        Safe to share between threads.
+    """
+
+    def __init__(self, selectors=None, dump_directory=None, strict=False, metrics=None):
+        """ Args:
+                selectors: A dictionary mapping fields to their selectors,
+                           best first. The fields left out use
+                           DEFAULT_SELECTORS.
+                dump_directory: The directory pages no selector matched
+                                are saved to. Pages are not saved if not
+                                provided.
+                strict: Whether BadSelector is raised when no selector matches.
+                metrics: The Metrics to count the matches in.
+        """
+
+        selectors = dict(DEFAULT_SELECTORS, **(selectors or {}))
+
+        self.chains = dict((field, compile_selector_chain(field, tuple(field_selectors)))
+                           for field, field_selectors in selectors.items())
+        self.dump_directory = dump_directory
+        self.strict = strict
+        self.metrics = metrics
+        self._matches = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file, metrics=None):
+        """ Create a SelectorMonitor from the scraper configuration file.
+
+            The selectors of a field are given one per line, in
+            the <field>_selectors item, e.g. advert_urls_selectors.
+
+            Args:
+                config_file: The path to the config file.
+                metrics: See __init__.
+
+            Returns:
+                A SelectorMonitor object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        selectors = {}
+        for field in DEFAULT_SELECTORS:
+            option = field + '_selectors'
+
+            if config_loader.config.has_option('parameters', option):
+                lines = config_loader.config.get('parameters', option).splitlines()
+                selectors[field] = [line.strip() for line in lines if line.strip()]
+
+        return cls(selectors,
+                   dump_directory=config_loader.get_item('page_dumps') or None,
+                   strict=config_loader.get_boolean('strict_selectors'),
+                   metrics=metrics)
+
+    def chain(self, field):
+        return self.chains[field]
+
+    def record_match(self, field, selector):
+        """ Count a page a selector of a field matched. """
+
+        with self._lock:
+            key = (field, selector)
+            self._matches[key] = self._matches.get(key, 0) + 1
+
+        if self.metrics is not None:
+            self.metrics.increment('selector_matches_total', field=field, selector=selector)
+
+            if selector != self.chains[field].primary:
+                self.metrics.increment('selector_fallbacks_total', field=field)
+
+    def select_links(self, field, parser, content):
+        """ Get the links of a field, trying its selectors in order.
+
+            Args:
+                field: The name of the field.
+                parser: The HTML parser backend.
+                content: The HTML document, as bytes or text.
+
+            Returns:
+                The links, or an empty list if no selector matched.
+                Misses are left to the caller, see miss.
+        """
+
+        links, selector = self.chains[field].select_links(parser, content)
+
+        if selector is not None:
+            self.record_match(field, selector)
+
+        return links
+
+    def miss(self, field, content, url=None):
+        """ Report a page none of the selectors of a field matched.
+            The page is saved, if there is a dump directory.
+
+            Args:
+                field: The name of the field.
+                content: The HTML document, as bytes or text.
+                url: The url of the page.
+
+            Raises:
+                BadSelector: In strict mode.
+        """
+
+        with self._lock:
+            self._misses[field] = self._misses.get(field, 0) + 1
+
+        if self.metrics is not None:
+            self.metrics.increment('selector_misses_total', field=field)
+
+        path = self.dump(field, content)
+
+        message = 'None of the {} selectors matched {}. The markup might have changed'.format(
+            field, url or 'the page')
+
+        if path is not None:
+            message += ', the page is saved in ' + path
+
+        if self.strict:
+            raise BadSelector(message)
+
+        print('Warning: ' + message)
+
+    def dump(self, field, content):
+        """ Save a page, to be replayed later.
+
+            Returns:
+                The path of the saved page, or None if pages are not saved.
+        """
+
+        if self.dump_directory is None:
+            return None
+
+        os.makedirs(self.dump_directory, exist_ok=True)
+
+        name = '{}.{}.{}.{}{}'.format(field, time.strftime('%Y%m%d-%H%M%S'), os.getpid(),
+                                      next(_dump_numbers), DUMP_EXTENSION)
+
+        path = os.path.join(self.dump_directory, name)
+
+        with open(path, 'wb') as dump_file:
+            dump_file.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+
+        return path
+
+    def hit_rates(self):
+        """ Get the share of the pages each selector matched.
+
+            Returns:
+                A dictionary mapping every field that was looked
+                for to a list of (selector, share) tuples, in the
+                order they are tried, with (None, share) last for
+                the pages none of them matched.
+        """
+
+        with self._lock:
+            matches, misses = dict(self._matches), dict(self._misses)
+
+        rates = {}
+
+        for field, chain in self.chains.items():
+            counts = [(selector, matches.get((field, selector), 0))
+                      for selector in chain.selectors]
+            counts.append((None, misses.get(field, 0)))
+
+            total = sum(count for _, count in counts)
+
+            if total:
+                rates[field] = [(selector, count / total) for selector, count in counts]
+
+        return rates
+
+    def summary(self):
+        """ Describe the hit rates, for the end of a run. """
+
+        lines = []
+
+        for field, rates in sorted(self.hit_rates().items()):
+            lines.append('{} selectors: {}'.format(field, ', '.join(
+                '{} {:.0%}'.format(selector if selector is not None else 'no match', share)
+                for selector, share in rates if share)))
+
+        return '\n'.join(lines)
+
+    def replay(self, parser, paths=None):
+        """ Try the selectors on saved pages again, e.g. after
+            changing them in the config file.
+
+            Args:
+                parser: The HTML parser backend.
+                paths: The saved pages. Defaults to every page
+                       in the dump directory.
+
+            Yields:
+                A (path, field, selector, links) tuple for every
+                page, with the selector that matched and the
+                number of links it found, or None and 0.
+        """
+
+        if paths is None:
+            if self.dump_directory is None:
+                return
+            paths = sorted(glob.glob(os.path.join(self.dump_directory, '*' + DUMP_EXTENSION)))
+
+        for path in paths:
+            field = os.path.basename(path).split('.', 1)[0]
+
+            # Pages of a field we no longer look for
+            if field not in self.chains:
+                continue
+
+            with open(path, 'rb') as dump_file:
+                content = dump_file.read()
+
+            links, selector = self.chains[field].select_links(parser, content)
+
+            yield path, field, selector, len(links)
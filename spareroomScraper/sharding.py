@@ -0,0 +1,174 @@
+# Standard library imports
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import socket
+
+# Local imports
+from spareroomScraper.advert_details import AdvertDetailsCache
+from spareroomScraper.async_search import AsyncSearchEngine, DEFAULT_CONCURRENCY
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.custom_exceptions import ShardFailed
+from spareroomScraper.metrics import Metrics
+from spareroomScraper.parsers import get_parser
+from spareroomScraper.payload_cache import PayloadCache
+from spareroomScraper.politeness import SharedPolitenessScheduler
+from spareroomScraper.run_journal import RunJournal
+from spareroomScraper.search_id_cache import SearchIdCache
+from spareroomScraper.selector_monitor import SelectorMonitor
+from spareroomScraper.seen_adverts import SeenAdverts
+from spareroomScraper.sinks import WorkQueueSink
+from spareroomScraper.transport import Transport
+from spareroomScraper.work_queue import DONE, FAILED, WorkQueue
+
+
+def run_shard(scraper_config, queue_path, number_of_pages, offset,
+              concurrency=DEFAULT_CONCURRENCY, filter_adverts=False, new_only=False):
+    """ Run searches from a WorkQueue until there are none left.
+        This is the work of a single shard, in its own process.
+
+        The shard claims as many config files as it runs at once
+        and searches with them in an AsyncSearchEngine. Requests
+        wait for the politeness budget shared by all the shards,
+        and the results go back to the queue.
+
+        Args:
+            scraper_config: The path to the scraper config file.
+            queue_path: The path to the SQLite file of the WorkQueue.
+            number_of_pages: The number of pages to scrape per search.
+            offset: The number of results per page.
+            concurrency: The most requests in flight in this shard.
+            filter_adverts: See Search.
+            new_only: Only report the adverts not reported before.
+
+        Returns:
+            The metrics of the shard, as a dictionary (see Metrics.as_dict).
+    """
+
+    config_loader = ConfigLoader(scraper_config)
+    metrics = Metrics()
+    queue = WorkQueue(queue_path)
+    scheduler = SharedPolitenessScheduler.from_config(scraper_config)
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    try:
+        with Transport.from_config(scraper_config, metrics=metrics,
+                                   scheduler=scheduler) as transport:
+            engine = AsyncSearchEngine(
+                transport, concurrency=concurrency,
+                search_id_cache=SearchIdCache.from_config(scraper_config),
+                seen_adverts=SeenAdverts.from_config(scraper_config) if new_only else None,
+                parser=get_parser(config_loader.get_item('parser_backend')),
+                filter_adverts=filter_adverts,
+                details_cache=AdvertDetailsCache.from_config(scraper_config),
+                payload_cache=PayloadCache.from_config(scraper_config),
+                domain=config_loader.get_item('domain'),
+                journal=RunJournal.from_config(scraper_config),
+                stream_pages=config_loader.get_boolean('stream_pages'),
+                selector_monitor=SelectorMonitor.from_config(scraper_config, metrics=metrics),
+                max_sweep_variants=config_loader.get_int('max_sweep_variants'))
+
+            while True:
+                config_files = queue.claim(worker, concurrency)
+
+                if not config_files:
+                    break
+
+                outcomes = engine.run(config_files, number_of_pages, offset,
+                                      sinks_factory=lambda search: [WorkQueueSink(queue)])
+
+                for config_file, outcome in outcomes.items():
+                    queue.finish(config_file, outcome)
+    finally:
+        scheduler.close()
+        queue.close()
+
+    return metrics.as_dict()
+
+
+class ShardedSweep:
+    """ A class that splits the searches of many config files
+        across a pool of processes, so that parsing and payload
+        building are not held back by a single interpreter.
+
+        The config files are handed out through a WorkQueue.
+        The shards share one politeness budget per host (see
+        SharedPolitenessScheduler), so the whole sweep is
+        exactly as gentle with spareroom as a single process.
+        Their results are deduplicated by advert in the queue,
+        before anything is delivered.
+    """
+
+    def __init__(self, scraper_config, queue, shards, concurrency=DEFAULT_CONCURRENCY,
+                 filter_adverts=False, new_only=False, metrics=None):
+        """ Args:
+                scraper_config: The path to the scraper config file.
+                                Every shard sets itself up from it.
+                queue: The WorkQueue of the sweep.
+                shards: The number of processes.
+                concurrency: The most requests in flight per shard.
+                filter_adverts: See Search.
+                new_only: Only report the adverts not reported before.
+                metrics: The Metrics the shards' metrics are added to.
+        """
+
+        self.scraper_config = scraper_config
+        self.queue = queue
+        self.shards = shards
+        self.concurrency = concurrency
+        self.filter_adverts = filter_adverts
+        self.new_only = new_only
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def run(self, config_files, number_of_pages, offset):
+        """ Search with every config file, across the shards.
+
+            Args:
+                config_files: The paths to the payload config files.
+                number_of_pages: The number of pages to scrape per search.
+                offset: The number of results per page.
+
+            Returns:
+                A dictionary mapping each config file to either its
+                number of results, or a ShardFailed exception.
+        """
+
+        self.queue.reset(config_files)
+
+        # Start the shards afresh, rather than as copies of this
+        # process with its open connections and threads
+        context = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(max_workers=self.shards, mp_context=context) as executor:
+            futures = [executor.submit(run_shard, self.scraper_config, self.queue.path,
+                                       number_of_pages, offset, self.concurrency,
+                                       self.filter_adverts, self.new_only)
+                       for _ in range(self.shards)]
+
+            for future in futures:
+                try:
+                    self.metrics.merge(future.result())
+                except Exception as error:
+                    print('A shard failed with {!r}'.format(error))
+
+        outcomes = {}
+
+        for config_file, state, results, error in self.queue.tasks():
+            if state == DONE:
+                outcomes[config_file] = results
+            elif state == FAILED:
+                outcomes[config_file] = ShardFailed(error)
+            else:
+                outcomes[config_file] = ShardFailed('Its shard stopped before searching with it')
+
+        return outcomes
+
+    def results(self):
+        """ Get the results of the sweep, one per advert.
+
+            Yields:
+                result: An Advert, as found by the first
+                        search that reported the advert.
+        """
+
+        return self.queue.results()
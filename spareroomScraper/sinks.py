@@ -0,0 +1,267 @@
+# Standard library imports
+import csv
+import json
+import sys
+import threading
+import time
+
+# Third party imports
+import requests
+
+# Local imports
+from spareroomScraper.advert import ADVERT_FIELDS
+
+
+class Sink:
+    """ The base class of the places search results are sent to.
+
+        Results (Advert objects) are written one at a time, as
+        soon as the search finds them. flush() is called once
+        a search is done, and close() once the sink is no
+        longer needed.
+    """
+
+    def write(self, result):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class BufferedSink(Sink):
+    """ A sink that delivers results in batches.
+
+        A batch goes out as soon as it holds batch_size results,
+        or when a result arrives flush_interval seconds or more
+        after the previous batch went out. Whatever is left is
+        delivered on flush(). Either threshold can be None.
+
+        Safe to share between threads.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        """ Args:
+                batch_size: The number of results per batch.
+                flush_interval: The maximum number of seconds
+                                results are held back for.
+        """
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+    def write(self, result):
+        with self._lock:
+            self._buffer.append(result)
+
+            if self.batch_size is not None and len(self._buffer) >= self.batch_size:
+                self.flush()
+            elif (self.flush_interval is not None and
+                  time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            results, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+
+            self._write_batch(results)
+
+    def _write_batch(self, results):
+        """ Deliver a batch of results. The batch may be empty. """
+
+        raise NotImplementedError
+
+
+class EmailDigestSink(BufferedSink):
+    """ Adds the results of a search to the email digests
+        of a MailDispatcher, as a list of advert links.
+
+        The digests go out when the dispatcher dispatches,
+        so the results of many searches reach each recipient
+        in a single email. With a ranker, the best matches
+        come first.
+    """
+
+    def __init__(self, dispatcher, title=None, receivers=None, send_empty=True,
+                 batch_size=None, flush_interval=None, ranker=None):
+        """ Args:
+                dispatcher: The MailDispatcher to queue the results with.
+                title: A heading for the results of this search.
+                receivers: The recipients. Defaults to the ones
+                           the dispatcher was created with.
+                send_empty: Whether to add the search to the digest
+                            when it found nothing at all.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+                ranker: An AdvertRanker to sort the results of a batch with.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.dispatcher = dispatcher
+        self.ranker = ranker
+        self.title = title
+        self.receivers = receivers
+        self.send_empty = send_empty
+        self._queued = False
+
+    def _write_batch(self, results):
+        if not results and (self._queued or not self.send_empty):
+            return
+
+        if self.ranker is not None:
+            results = self.ranker.rank(results)
+
+        search_results = ['<h4>' + result.url + '</h4>' for result in results]
+
+        if self.title is not None and not self._queued:
+            search_results.insert(0, '<h3>' + self.title + '</h3>')
+
+        self.dispatcher.queue(''.join(search_results), self.receivers)
+        self._queued = True
+
+
+class JsonLinesSink(BufferedSink):
+    """ Writes one JSON object per result to a stream. """
+
+    def __init__(self, stream=None, batch_size=1, flush_interval=None):
+        """ Args:
+                stream: A text stream. Defaults to stdout.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.stream = stream if stream is not None else sys.stdout
+
+    def _write_batch(self, results):
+        if not results:
+            return
+
+        self.stream.write(''.join(json.dumps(result.as_dict()) + '\n' for result in results))
+        self.stream.flush()
+
+
+class CsvSink(BufferedSink):
+    """ Writes one CSV row per result to a stream, after a header row. """
+
+    def __init__(self, stream=None, batch_size=1, flush_interval=None):
+        """ Args:
+                stream: A text stream. Defaults to stdout.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.stream = stream if stream is not None else sys.stdout
+        self._writer = csv.writer(self.stream)
+
+        # Don't repeat the header when appending to a file
+        try:
+            empty = self.stream.tell() == 0
+        except (AttributeError, OSError):
+            empty = True
+
+        if empty:
+            self._writer.writerow(ADVERT_FIELDS)
+
+    def _write_batch(self, results):
+        if not results:
+            return
+
+        self._writer.writerows(result.as_tuple() for result in results)
+        self.stream.flush()
+
+
+class WebhookSink(BufferedSink):
+    """ POSTs batches of results as JSON to a local webhook. """
+
+    def __init__(self, url, batch_size=20, flush_interval=5, timeout=10):
+        """ Args:
+                url: The url of the webhook.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+                timeout: Seconds to wait for the webhook to answer.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _write_batch(self, results):
+        if not results:
+            return
+
+        adverts = [result.as_dict() for result in results]
+        response = self._session.post(self.url, json={'results': adverts}, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        super().close()
+        self._session.close()
+
+
+class AdvertStoreSink(BufferedSink):
+    """ Records the results in an AdvertStore, a batch per transaction. """
+
+    def __init__(self, store, batch_size=500, flush_interval=5):
+        """ Args:
+                store: The AdvertStore to record the results in.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.store = store
+
+    def _write_batch(self, results):
+        self.store.add(results)
+
+
+class WorkQueueSink(BufferedSink):
+    """ Puts the results of a shard back in the WorkQueue of its
+        sweep, where they are deduplicated and then delivered.
+    """
+
+    def __init__(self, queue, batch_size=100, flush_interval=5):
+        """ Args:
+                queue: The WorkQueue of the sweep.
+                batch_size: See BufferedSink.
+                flush_interval: See BufferedSink.
+        """
+
+        super().__init__(batch_size, flush_interval)
+
+        self.queue = queue
+
+    def _write_batch(self, results):
+        self.queue.add_results(results)
+
+
+class FileSink(Sink):
+    """ Wraps a sink writing to a file it owns, closing the file with it. """
+
+    def __init__(self, sink_class, path, **kwargs):
+        self._file = open(path, 'a', newline='')
+        self.sink = sink_class(self._file, **kwargs)
+
+    def write(self, result):
+        self.sink.write(result)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+        self._file.close()
@@ -0,0 +1,266 @@
+# Standard library imports
+import configparser
+import itertools
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.custom_exceptions import InvalidPayload
+from spareroomScraper.payload import PayloadCompiler
+
+
+# The optional section of a payload config file that turns it into a sweep
+SWEEP_SECTION = 'sweep'
+
+# The most combinations a sweep can go through, unless told otherwise
+DEFAULT_MAX_VARIANTS = 500
+
+
+def _parse_range(value):
+    """ Expand a range like 400..1000 step 200, both ends included.
+
+        Returns:
+            A list of the values as strings, or None if value is not a range.
+    """
+
+    bounds, _, step = value.partition(' step ')
+    start, separator, stop = bounds.partition('..')
+
+    if not separator:
+        return None
+
+    try:
+        start, stop = int(start), int(stop)
+        step = int(step) if step.strip() else 1
+    except ValueError:
+        raise ValueError('{!r} is not a range like 400..1000 step 100'.format(value))
+
+    if step <= 0 or stop < start:
+        raise ValueError('{!r} is an empty range'.format(value))
+
+    return [str(number) for number in range(start, stop + 1, step)]
+
+
+def parse_sweep_values(names, value):
+    """ Get the values a sweep item goes through.
+
+        Values are separated by commas. A value can be a range
+        of numbers, like 400..1000 step 200. An item naming
+        several payload items (min_rent/max_rent) takes values
+        for all of them at once, like 400/600.
+
+        Args:
+            names: The payload items the sweep item sets.
+            value: The value of the sweep item in the config file.
+
+        Returns:
+            A list of tuples, with a value for each one of names.
+
+        Raises:
+            ValueError: If value can't be used.
+    """
+
+    values = []
+
+    for part in value.split(','):
+        part = part.strip()
+
+        if not part:
+            continue
+
+        parts = [item.strip() for item in part.split('/')]
+
+        if len(parts) != len(names):
+            raise ValueError('{!r} does not have a value for each of {}'.format(
+                part, '/'.join(names)))
+
+        if len(parts) == 1:
+            expanded = _parse_range(part)
+            if expanded is not None:
+                values.extend((number,) for number in expanded)
+                continue
+
+        values.append(tuple(parts))
+
+    if not values:
+        raise ValueError('no values to sweep through')
+
+    return values
+
+
+def _label(overrides):
+    return ', '.join('{}={}'.format(name, value) for name, value in overrides)
+
+
+class SweepVariant:
+    """ One combination of the values of a sweep, compiled. """
+
+    __slots__ = ('index', 'overrides', 'compiled')
+
+    def __init__(self, index, overrides, compiled):
+        """ Args:
+                index: The position of the variant in the sweep, from 0.
+                overrides: The (name, value) pairs it sets, in order.
+                compiled: Its CompiledPayload.
+        """
+
+        self.index = index
+        self.overrides = overrides
+        self.compiled = compiled
+
+    @property
+    def label(self):
+        return _label(self.overrides)
+
+
+class PayloadSweep:
+    """ A class that expands a payload config file with a [sweep]
+        section into one payload per combination of its values,
+        so that one file can cover a whole city.
+
+            [sweep]
+            search = E1, E2, N1
+            min_rent/max_rent = 400/600, 600/800
+            miles_from_max = 1..5 step 2
+
+        The file is read once. The variants are compiled one at
+        a time, as they are asked for, from the items of the file
+        with the swept ones replaced, and go through the same
+        validation as a single payload. Variants that can't be
+        used are reported and left out.
+
+        Every item added to a sweep multiplies its size, so a
+        sweep with more combinations than max_variants is turned
+        down before any of them is compiled.
+    """
+
+    def __init__(self, config_file, today=None, max_variants=None):
+        """ Read the config file and its sweep.
+
+            Args:
+                config_file: The path to the payload config file.
+                today: The date the availability defaults stand for.
+                max_variants: The most combinations the sweep can go
+                              through. Not capped if not provided.
+
+            Raises:
+                InvalidPayload: If the sweep section can't be used,
+                                or has too many combinations.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        self.config_file = config_file
+        self.today = today
+        self.items = config_loader.get_items()
+        self.dimensions = []
+
+        if not config_loader.config.has_section(SWEEP_SECTION):
+            return
+
+        errors = []
+
+        for option, value in config_loader.config.items(SWEEP_SECTION):
+            names = tuple(name.strip() for name in option.split('/'))
+
+            unknown = [name for name in names if name not in self.items]
+            if unknown:
+                errors.append('{} is not a payload item'.format(', '.join(unknown)))
+                continue
+
+            try:
+                self.dimensions.append((names, parse_sweep_values(names, value)))
+            except ValueError as error:
+                errors.append('{}: {}'.format(option, error))
+
+        if errors:
+            raise InvalidPayload(config_file, errors)
+
+        if max_variants is not None and len(self) > max_variants:
+            raise InvalidPayload(config_file, [
+                'the sweep goes through {} combinations, more than max_sweep_variants '
+                '({})'.format(len(self), max_variants)])
+
+    def __bool__(self):
+        return bool(self.dimensions)
+
+    def __len__(self):
+        """ The number of combinations, including any that turn out invalid. """
+
+        count = 1
+
+        for _, values in self.dimensions:
+            count *= len(values)
+
+        return count
+
+    def variants(self):
+        """ Compile the combinations of the sweep, one at a time.
+
+            Yields:
+                variant: A SweepVariant for every valid combination.
+        """
+
+        names = [names for names, _ in self.dimensions]
+
+        for index, combination in enumerate(itertools.product(
+                *[values for _, values in self.dimensions])):
+            overrides = tuple(itertools.chain.from_iterable(
+                zip(dimension, values) for dimension, values in zip(names, combination)))
+
+            variant = self._compile(index, overrides)
+
+            if variant is not None:
+                yield variant
+
+    def _compile(self, index, overrides):
+        """ Compile a single combination.
+
+            Returns:
+                A SweepVariant, or None if the combination can't be used.
+        """
+
+        items = dict(self.items)
+        items.update(overrides)
+
+        label = _label(overrides)
+
+        try:
+            compiled = PayloadCompiler(self.config_file, self.today, items=items).compile()
+        except InvalidPayload as error:
+            print('{} [{}]: skipped, {}'.format(self.config_file, label, '; '.join(error.errors)))
+            return None
+
+        if compiled.warnings:
+            print('{} [{}]:\n    {}'.format(self.config_file, label,
+                                            '\n    '.join(compiled.warnings)))
+
+        payload = compiled.as_dict()
+
+        # Bands crossing over find nothing
+        for low, high in (('min_rent', 'max_rent'), ('min_zone', 'max_zone')):
+            try:
+                crossed = int(payload[low]) > int(payload[high])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            if crossed:
+                print('{} [{}]: skipped, {} is above {}'.format(self.config_file, label, low, high))
+                return None
+
+        return SweepVariant(index, overrides, compiled)
+
+
+def has_sweep(config_file):
+    """ Check whether a payload config file has a [sweep] section.
+
+        Args:
+            config_file: The path to the payload config file.
+
+        Returns:
+            True if the config file describes a sweep.
+    """
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    return config.has_section(SWEEP_SECTION)
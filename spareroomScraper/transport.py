@@ -0,0 +1,397 @@
+# Standard library imports
+import threading
+import time
+import urllib.parse as urlparse
+
+# Third party imports
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Local imports
+from spareroomScraper.config_loader import ConfigLoader
+from spareroomScraper.http_cache import HttpCache
+from spareroomScraper.metrics import Metrics
+from spareroomScraper.politeness import PolitenessScheduler
+from spareroomScraper.resilience import (CircuitBreaker, FAILURE_STATUS_CODES,
+                                         RETRY_STATUS_CODES, RetryPolicy)
+
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 4
+DEFAULT_POOL_BLOCK = True
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 30
+
+
+def _endpoint_of(url):
+    """ Get the last part of the path of a url, e.g. search.pl,
+        so that the requests can be timed per endpoint.
+    """
+
+    path = urlparse.urlparse(url).path.rstrip('/')
+
+    return path.rsplit('/', 1)[-1] or '/'
+
+
+class TransportStats:
+    """ A thread safe collection of counters that keeps track
+        of how many requests were sent and how many new
+        connections had to be opened for them, per host.
+
+        Every request that did not need a new connection
+        was served by a pooled keep-alive connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._new_connections = {}
+
+    def record_request(self, host):
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def record_new_connection(self, host):
+        with self._lock:
+            self._new_connections[host] = self._new_connections.get(host, 0) + 1
+
+    def as_dict(self):
+        """ Get a snapshot of the counters.
+
+            Returns:
+                A dictionary with the totals and a breakdown per host.
+        """
+
+        with self._lock:
+            hosts = {}
+            for host in set(self._requests) | set(self._new_connections):
+                requests_sent = self._requests.get(host, 0)
+                new_connections = self._new_connections.get(host, 0)
+                hosts[host] = {
+                    'requests': requests_sent,
+                    'new_connections': new_connections,
+                    'reused_connections': max(requests_sent - new_connections, 0),
+                }
+
+        return {
+            'requests': sum(h['requests'] for h in hosts.values()),
+            'new_connections': sum(h['new_connections'] for h in hosts.values()),
+            'reused_connections': sum(h['reused_connections'] for h in hosts.values()),
+            'hosts': hosts,
+        }
+
+
+def _counting_pool_class(pool_class, stats):
+    """ Create a urllib3 connection pool class that reports
+        every new connection it opens to stats.
+    """
+
+    class CountingConnectionPool(pool_class):
+        def _new_conn(self):
+            stats.record_new_connection(self.host)
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """ An HTTPAdapter whose connection pools report
+        the connections they open to a TransportStats object.
+    """
+
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self._stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self._stats),
+        }
+
+    def send(self, request, *args, **kwargs):
+        # Count every request that goes over the wire,
+        # including the ones issued while following redirects.
+        self._stats.record_request(urlparse.urlparse(request.url).hostname)
+
+        return super().send(request, *args, **kwargs)
+
+
+class Transport:
+    """ A class that owns a pooled, keep-alive HTTP session.
+
+        A single Transport can be shared by any number of
+        Search instances, so that connections to spareroom
+        are opened once and then reused for every request.
+
+        Every request waits for its turn in the politeness
+        scheduler, which is shared along with the Transport.
+
+        With an HttpCache, fresh cached responses are served
+        without touching the network (or the scheduler), and
+        stale ones are revalidated with conditional requests.
+
+        Connection errors, timeouts and 429/5xx responses are
+        retried as the RetryPolicy says, each retry waiting for
+        the scheduler again. A CircuitBreaker per host makes a
+        host that keeps failing fail fast instead.
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=DEFAULT_POOL_BLOCK,
+                 scheduler=None, cache=None, metrics=None, retry_policy=None,
+                 circuit_breaker=None, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)):
+        """ Set up the session and mount the pooled adapter.
+
+            Args:
+                pool_connections: The number of per host pools to keep.
+                pool_maxsize: The maximum number of connections kept
+                              open to a single host.
+                pool_block: If True, never open more than pool_maxsize
+                            connections to a host. Wait for a free one instead.
+                scheduler: A PolitenessScheduler (or compatible object)
+                           deciding when each request may be sent.
+                           A new one with the default rate is created
+                           if not provided.
+                cache: An HttpCache for the responses, if any.
+                metrics: The Metrics to record the requests in. Searches
+                         using this Transport record their stages there
+                         too. A new one is created if not provided.
+                retry_policy: A RetryPolicy. One with the default
+                              settings is created if not provided.
+                circuit_breaker: A CircuitBreaker. One with the default
+                                 settings is created if not provided.
+                timeout: The (connect, read) timeouts of every request,
+                         in seconds. None waits forever.
+        """
+
+        self.stats = TransportStats()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else PolitenessScheduler()
+        self.cache = cache
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.timeout = timeout
+
+        adapter = _CountingHTTPAdapter(self.stats,
+                                       pool_connections=pool_connections,
+                                       pool_maxsize=pool_maxsize,
+                                       pool_block=pool_block)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_config(cls, config_file, metrics=None, scheduler=None):
+        """ Create a Transport from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+                metrics: See __init__.
+                scheduler: See __init__. A PolitenessScheduler is
+                           created from the config file if not provided.
+
+            Returns:
+                A Transport object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        if scheduler is None:
+            scheduler = PolitenessScheduler.from_config(config_file)
+
+        return cls(pool_connections=config_loader.get_int('pool_connections'),
+                   pool_maxsize=config_loader.get_int('pool_maxsize'),
+                   pool_block=config_loader.get_boolean('pool_block'),
+                   scheduler=scheduler,
+                   cache=HttpCache.from_config(config_file),
+                   metrics=metrics,
+                   retry_policy=RetryPolicy.from_config(config_file),
+                   circuit_breaker=CircuitBreaker.from_config(config_file),
+                   timeout=(config_loader.get_float('connect_timeout'),
+                            config_loader.get_float('read_timeout')))
+
+    def get(self, url, params=None, headers=None, stream=False):
+        """ Send a GET request over the pooled session,
+            once the politeness scheduler allows it.
+
+            Args:
+                url: The endpoint url
+                params: The query parameters in a dict format
+                headers: Any additional request headers
+                stream: See send.
+
+            Returns:
+                response: A requests.Response object.
+        """
+
+        response = self.cached(url, params, headers)
+
+        if response is not None:
+            return response
+
+        with self.metrics.timer('politeness_wait_seconds'):
+            self.scheduler.acquire(PolitenessScheduler.host_of(url))
+
+        return self.send(url, params, headers, stream)
+
+    def cached(self, url, params=None, headers=None):
+        """ Get a fresh response from the cache, if there is one.
+
+            Requests with their own headers (e.g. conditional ones)
+            always go to the server.
+
+            Args:
+                url: The endpoint url
+                params: The query parameters in a dict format
+                headers: Any additional request headers
+
+            Returns:
+                response: A requests.Response object, or None.
+        """
+
+        if self.cache is None or headers:
+            return None
+
+        response = self.cache.fresh(url, params)
+
+        if response is not None:
+            self.metrics.increment('http_cache_total', result='hit')
+
+        return response
+
+    def send(self, url, params=None, headers=None, stream=False):
+        """ Send a GET request over the pooled session straight away.
+
+            The caller is responsible for reserving a slot in the
+            politeness scheduler first (see AsyncSearch).
+
+            Args:
+                url: The endpoint url
+                params: The query parameters in a dict format
+                headers: Any additional request headers
+                stream: If True, the body is left to be read by the
+                        caller (see PageStream), who must close the
+                        response. Streamed responses are not cached.
+
+            Returns:
+                response: A requests.Response object. It may still
+                          have an error status, if retrying didn't help.
+
+            Raises:
+                CircuitOpen: If the host keeps failing.
+                requests.RequestException: If the request could not be
+                                           sent, even after retrying.
+        """
+
+        if stream:
+            return self._send_with_retries(url, params, headers, stream=True)
+
+        entry = None
+
+        if self.cache is not None and not headers:
+            entry = self.cache.entry(url, params)
+
+            # Revalidate what we already have
+            if entry is not None:
+                headers = entry.conditional_headers()
+
+        response = self._send_with_retries(url, params, headers)
+
+        if self.cache is not None and (entry is not None or not headers):
+            revalidated = response.status_code == 304
+            response = self.cache.update(url, params, response, entry)
+
+            # The cache lost what the server confirmed, ask for all of it
+            if response.status_code == 304 and entry is not None:
+                response.close()
+                revalidated = False
+
+                with self.metrics.timer('politeness_wait_seconds'):
+                    self.scheduler.acquire(PolitenessScheduler.host_of(url))
+
+                response = self.cache.update(url, params,
+                                             self._send_with_retries(url, params, None))
+
+            self.metrics.increment('http_cache_total',
+                                   result='revalidated' if revalidated else 'miss')
+
+        return response
+
+    def _send_with_retries(self, url, params, headers, stream=False):
+        host = PolitenessScheduler.host_of(url)
+        attempt = 0
+
+        while True:
+            probe = self.circuit_breaker.before_request(host)
+            # Whether the circuit has been told how the request went
+            settled = not probe
+
+            attempt += 1
+            error = None
+
+            try:
+                try:
+                    with self.metrics.timer('http_request_seconds', endpoint=_endpoint_of(url)):
+                        response = self.session.get(url, params=params, headers=headers,
+                                                    timeout=self.timeout, stream=stream)
+                except (requests.ConnectionError, requests.Timeout) as request_error:
+                    error = request_error
+                    reason = 'timeout' if isinstance(error, requests.Timeout) else 'connection'
+                    failed = True
+                else:
+                    self.metrics.increment('http_responses_total', status=response.status_code)
+                    # The reader of a streamed body counts what it reads
+                    if not stream:
+                        self.metrics.increment('http_response_bytes_total',
+                                               len(response.content))
+                    self.scheduler.feedback(host, response)
+
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        self.circuit_breaker.record_success(host)
+                        settled = True
+                        return response
+
+                    reason = 'http_{}'.format(response.status_code)
+                    # A 429 is no sign of a failing host, unless it
+                    # is the answer to the probe of a half open circuit
+                    failed = response.status_code in FAILURE_STATUS_CODES or probe
+
+                if failed and self.circuit_breaker.record_failure(host):
+                    self.metrics.increment('circuit_breaker_trips_total', host=host)
+                settled = True
+            finally:
+                # Anything else that went wrong with the probe opens the circuit again
+                if not settled and self.circuit_breaker.record_failure(host):
+                    self.metrics.increment('circuit_breaker_trips_total', host=host)
+
+            if attempt > self.retry_policy.retries or (
+                    self.circuit_breaker.state(host) != 'closed'):
+                if error is not None:
+                    raise error
+                return response
+
+            if error is None:
+                response.close()
+
+            self.metrics.increment('retries_total', reason=reason)
+            time.sleep(self.retry_policy.delay(attempt))
+
+            # A retry is a request like any other
+            with self.metrics.timer('politeness_wait_seconds'):
+                self.scheduler.acquire(host)
+
+    def close(self):
+        """ Close every pooled connection. """
+
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
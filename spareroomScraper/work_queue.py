@@ -0,0 +1,197 @@
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+
+# Local imports
+from spareroomScraper.advert import Advert
+from spareroomScraper.config_loader import ConfigLoader
+
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """ A class that hands out the config files of a sweep to
+        the processes running it, through a SQLite database.
+
+        Every config file is a task that is claimed by exactly
+        one worker. The workers put their results back in the
+        queue, where they are deduplicated by advert, so an
+        advert found by many searches is delivered once.
+    """
+
+    def __init__(self, path):
+        """ Open (or create) the database.
+
+            Args:
+                path: The path to the SQLite file.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Transactions are started by hand, see claim
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                           check_same_thread=False)
+
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            '    config_file TEXT PRIMARY KEY,'
+            '    state TEXT NOT NULL,'
+            '    worker TEXT,'
+            '    claimed_at REAL,'
+            '    results INTEGER,'
+            '    error TEXT'
+            ')')
+        # Keyed by advert id, or by url for the odd advert without one
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            '    advert_key TEXT PRIMARY KEY,'
+            '    result TEXT NOT NULL'
+            ')')
+
+    @classmethod
+    def from_config(cls, config_file):
+        """ Create a WorkQueue from the scraper configuration file.
+
+            Args:
+                config_file: The path to the config file.
+
+            Returns:
+                A WorkQueue object.
+        """
+
+        config_loader = ConfigLoader(config_file)
+
+        return cls(config_loader.get_item('work_queue'))
+
+    def _transaction(self, statements):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                value = statements(self._connection)
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+        return value
+
+    def reset(self, config_files):
+        """ Start a new sweep, dropping what is left of the previous one.
+
+            Args:
+                config_files: The config files to search with.
+        """
+
+        def statements(connection):
+            connection.execute('DELETE FROM tasks')
+            connection.execute('DELETE FROM results')
+            connection.executemany(
+                'INSERT OR IGNORE INTO tasks (config_file, state) VALUES (?, ?)',
+                [(config_file, PENDING) for config_file in config_files])
+
+        self._transaction(statements)
+
+    def claim(self, worker, count=1):
+        """ Take some of the pending config files.
+
+            Args:
+                worker: A name for the worker, e.g. its host and pid.
+                count: The most config files to take.
+
+            Returns:
+                A list of config files, empty once there are none left.
+        """
+
+        def statements(connection):
+            config_files = [row[0] for row in connection.execute(
+                'SELECT config_file FROM tasks WHERE state = ? ORDER BY rowid LIMIT ?',
+                (PENDING, count))]
+
+            connection.executemany(
+                'UPDATE tasks SET state = ?, worker = ?, claimed_at = ? WHERE config_file = ?',
+                [(CLAIMED, worker, time.time(), config_file) for config_file in config_files])
+
+            return config_files
+
+        return self._transaction(statements)
+
+    def finish(self, config_file, outcome):
+        """ Record how the search with a config file went.
+
+            Args:
+                config_file: The config file.
+                outcome: The number of results, or the exception
+                         that stopped the search.
+        """
+
+        if isinstance(outcome, Exception):
+            row = (FAILED, None, repr(outcome), config_file)
+        else:
+            row = (DONE, outcome, None, config_file)
+
+        self._transaction(lambda connection: connection.execute(
+            'UPDATE tasks SET state = ?, results = ?, error = ? WHERE config_file = ?', row))
+
+    def add_results(self, results):
+        """ Put some results in the queue. Adverts that are
+            already in it, from any search, are left out.
+
+            Args:
+                results: An iterable of Advert objects.
+
+            Returns:
+                The number of results that were new.
+        """
+
+        rows = [(str(result.key), result.to_json()) for result in results]
+
+        if not rows:
+            return 0
+
+        def statements(connection):
+            return connection.executemany(
+                'INSERT OR IGNORE INTO results (advert_key, result) VALUES (?, ?)',
+                rows).rowcount
+
+        return self._transaction(statements)
+
+    def results(self):
+        """ Get the results of the sweep, in the order they were found.
+
+            Yields:
+                result: An Advert for every distinct advert.
+        """
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT result FROM results ORDER BY rowid').fetchall()
+
+        for result, in rows:
+            yield Advert.from_json(result)
+
+    def tasks(self):
+        """ Get the state of every config file of the sweep.
+
+            Returns:
+                A list of (config_file, state, results, error) tuples.
+        """
+
+        with self._lock:
+            return self._connection.execute(
+                'SELECT config_file, state, results, error FROM tasks ORDER BY rowid').fetchall()
+
+    def close(self):
+        self._connection.close()
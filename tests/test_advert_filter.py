@@ -0,0 +1,43 @@
+# Standard library imports
+import unittest
+
+# Local imports
+from spareroomScraper.advert import Advert
+from spareroomScraper.advert_details import parse_advert_details
+from spareroomScraper.advert_filter import AdvertFilter
+
+
+ADVERT_PAGE = '''
+<ul class="room-list">
+  <li class="room-list__room">
+    <strong class="room-list__price">&pound;850 pcm</strong>
+    <small>({})</small>
+  </li>
+</ul>
+'''
+
+
+def advert(room_type):
+    details = parse_advert_details(ADVERT_PAGE.format(room_type))
+
+    return Advert('test', 1, 'https://www.spareroom.co.uk/1', **details)
+
+
+class RoomTypeTest(unittest.TestCase):
+
+    def test_ensuite_is_not_a_room_type(self):
+        self.assertEqual(advert('Ensuite double').room_type, 'double')
+        self.assertEqual(advert('en-suite single').room_type, 'single')
+        self.assertIsNone(advert('Ensuite').room_type)
+
+    def test_ensuite_double_matches_doubles(self):
+        doubles = AdvertFilter({'room_types': 'double'})
+
+        self.assertTrue(doubles.matches(advert('Ensuite double')))
+        self.assertTrue(doubles.matches(advert('Ensuite')))
+        self.assertFalse(doubles.matches(advert('Single')))
+
+    def test_cached_ensuite_is_not_ruled_out(self):
+        cached = Advert('test', 1, 'https://www.spareroom.co.uk/1', room_type='ensuite')
+
+        self.assertTrue(AdvertFilter({'room_types': 'single'}).matches(cached))
@@ -0,0 +1,129 @@
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+# Local imports
+from benchmarks.mock_server import MockSpareroom, PAGE_SIZE
+from benchmarks.run import PAYLOAD_CONFIG, CountingSink, _unlimited_transport
+from spareroomScraper.async_search import AsyncSearchEngine
+from spareroomScraper.run_journal import RunJournal
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FailingSink(CountingSink):
+    """ A sink whose deliveries never make it. """
+
+    def flush(self):
+        raise RuntimeError('delivery failed')
+
+
+class NoCountSpareroom(MockSpareroom):
+    """ A MockSpareroom whose pages don't say how many results there are. """
+
+    def render_page(self, offset):
+        return re.sub(r'of <strong>\d+</strong> results', '', super().render_page(offset))
+
+
+def quietly(function, *args, **kwargs):
+    # The payloads print every item they send
+    with redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+class AsyncSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def config(self, name, max_rent):
+        """ Write a payload config file with its own max_rent. """
+
+        with open(os.path.join(ROOT, PAYLOAD_CONFIG)) as config_file:
+            content = config_file.read()
+
+        path = os.path.join(self.directory, name)
+
+        with open(path, 'w') as config_file:
+            config_file.write(re.sub(r'(?m)^max_rent = .*$',
+                                     'max_rent = {}'.format(max_rent), content))
+
+        return path
+
+    def engine(self, mock, **kwargs):
+        return AsyncSearchEngine(transport=_unlimited_transport(), domain=mock.url, **kwargs)
+
+    def test_checkpoints_complete_per_search(self):
+        delivered, failing = self.config('delivered.ini', 800), self.config('failing.ini', 900)
+        journal = RunJournal(os.path.join(self.directory, 'journal.sqlite'))
+        self.addCleanup(journal.close)
+
+        def sinks_for(search):
+            return [FailingSink() if search.config_file == failing else CountingSink()]
+
+        with MockSpareroom(total_results=25) as mock:
+            # Both find the same adverts, keep them all
+            engine = self.engine(mock, journal=journal, coalesce=False)
+            outcomes = quietly(engine.run, [delivered, failing], 3, PAGE_SIZE, sinks_for)
+
+            self.assertEqual(outcomes[delivered], 25)
+            self.assertIsInstance(outcomes[failing], RuntimeError)
+
+            # Only the search whose results never arrived is kept
+            checkpoints = journal._connection.execute(
+                'SELECT config_file FROM checkpoints').fetchall()
+            self.assertEqual(checkpoints, [(failing,)])
+
+            pages = mock.requests.get('page', 0)
+            sink = CountingSink()
+            outcomes = quietly(engine.run, [failing], 3, PAGE_SIZE, lambda search: [sink])
+
+            # Delivered from the journal, without pulling a page
+            self.assertEqual(outcomes[failing], 25)
+            self.assertEqual(sink.results, 25)
+            self.assertEqual(mock.requests.get('page', 0), pages)
+            self.assertEqual(journal._connection.execute(
+                'SELECT COUNT(*) FROM checkpoints').fetchone(), (0,))
+
+    def test_resume_without_new_pages_keeps_the_checkpoint_age(self):
+        failing = self.config('failing.ini', 900)
+        journal = RunJournal(os.path.join(self.directory, 'journal.sqlite'))
+        self.addCleanup(journal.close)
+
+        def updated_at():
+            return journal._connection.execute('SELECT updated_at FROM checkpoints').fetchone()
+
+        with MockSpareroom(total_results=25) as mock:
+            engine = self.engine(mock, journal=journal)
+            quietly(engine.run, [failing], 3, PAGE_SIZE, lambda search: [FailingSink()])
+            first = updated_at()
+
+            quietly(engine.run, [failing], 3, PAGE_SIZE, lambda search: [FailingSink()])
+
+            self.assertIsNotNone(first)
+            self.assertEqual(updated_at(), first)
+
+    def test_unknown_results_count_pulls_pages_serially(self):
+        sink = CountingSink()
+
+        with NoCountSpareroom(total_results=25) as mock:
+            outcomes = quietly(self.engine(mock).run, [os.path.join(ROOT, PAYLOAD_CONFIG)], 10,
+                               PAGE_SIZE, lambda search: [sink])
+
+            self.assertEqual(list(outcomes.values()), [25])
+            self.assertEqual(sink.results, 25)
+            # The search.pl redirect, the three pages there are and the
+            # one past the end, rather than all ten at once
+            self.assertEqual(mock.requests.get('page'), 5)
+            self.assertEqual(mock.requests.get('past_the_end'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+# Local imports
+from benchmarks.mock_server import MockSpareroom, PAGE_SIZE
+from benchmarks.run import PAYLOAD_CONFIG, _unlimited_transport
+from spareroomScraper.async_search import AsyncSearchEngine
+from spareroomScraper.coalescer import plan_searches, subsumes
+from spareroomScraper.payload import payload_key
+from spareroomScraper.sinks import Sink
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAYLOAD = {'search': 'EC1M6HJ', 'miles_from_max': '1', 'min_rent': '1', 'max_rent': '800',
+           'bills_inc': '', 'room_types': ''}
+
+
+class PlannedSearch:
+    """ Only what plan_searches needs to know about a search. """
+
+    def __init__(self, name, **items):
+        self.name = name
+        self.advanced_search_payload = dict(PAYLOAD, **items)
+        self.search_key = payload_key(self.advanced_search_payload)
+
+
+class RecordingSink(Sink):
+
+    def __init__(self, results):
+        self.results = results
+
+    def write(self, result):
+        self.results.append(result)
+
+
+class PlanSearchesTest(unittest.TestCase):
+
+    def test_identical_pair(self):
+        first, second = PlannedSearch('first'), PlannedSearch('second')
+
+        groups = plan_searches([first, second])
+
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0].names, ['first', 'second'])
+        self.assertIsNone(groups[0].parent)
+
+    def test_subsumed_pair(self):
+        narrow, broad = PlannedSearch('narrow', max_rent='600'), PlannedSearch('broad')
+
+        narrow_group, broad_group = plan_searches([narrow, broad])
+
+        self.assertIs(narrow_group.parent, broad_group)
+        self.assertEqual(broad_group.children, [narrow_group])
+        self.assertIsNone(broad_group.parent)
+
+    def test_non_subsumable_pair(self):
+        pairs = [
+            # Looser on rent, but further away
+            (PlannedSearch('narrow', max_rent='600'), PlannedSearch('broad', miles_from_max='2')),
+            # Another area altogether
+            (PlannedSearch('narrow', max_rent='600'), PlannedSearch('broad', search='SE1')),
+            # Each one lets through something the other doesn't
+            (PlannedSearch('narrow', min_rent='500'), PlannedSearch('broad', max_rent='600')),
+        ]
+
+        for narrow, broad in pairs:
+            self.assertFalse(subsumes(broad.advanced_search_payload,
+                                      narrow.advanced_search_payload))
+
+            for group in plan_searches([narrow, broad]):
+                self.assertIsNone(group.parent)
+                self.assertEqual(group.children, [])
+
+    def test_subsumption_can_be_turned_off(self):
+        groups = plan_searches([PlannedSearch('narrow', max_rent='600'), PlannedSearch('broad')],
+                               allow_subsumption=False)
+
+        self.assertEqual([group.parent for group in groups], [None, None])
+
+
+class CoalescedRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def config(self, name, **items):
+        """ Write a payload config file with some of its items changed. """
+
+        with open(os.path.join(ROOT, PAYLOAD_CONFIG)) as config_file:
+            content = config_file.read()
+
+        for item, value in items.items():
+            content = re.sub(r'(?m)^{} = .*$'.format(item),
+                             '{} = {}'.format(item, value), content)
+
+        path = os.path.join(self.directory, name)
+
+        with open(path, 'w') as config_file:
+            config_file.write(content)
+
+        return path
+
+    def run_searches(self, mock, config_files):
+        """ Run the searches with their adverts filtered.
+
+            Returns:
+                The results delivered, per list of subscribers.
+        """
+
+        delivered = {}
+
+        def sinks_for(search):
+            return [RecordingSink(delivered.setdefault(tuple(search.subscribers), []))]
+
+        engine = AsyncSearchEngine(transport=_unlimited_transport(), domain=mock.url,
+                                   filter_adverts=True)
+
+        # The payloads print every item they send
+        with redirect_stdout(io.StringIO()):
+            engine.run(config_files, 3, PAGE_SIZE, sinks_for)
+
+        return delivered
+
+    def test_identical_pair_is_searched_once(self):
+        first, second = self.config('first.ini'), self.config('second.ini')
+
+        with MockSpareroom(total_results=25) as mock:
+            delivered = self.run_searches(mock, [first, second])
+
+            self.assertEqual(mock.requests['search'], 1)
+
+        self.assertEqual(list(delivered), [(first, second)])
+        self.assertTrue(delivered[first, second])
+
+    def test_subsumed_pair_gets_the_matching_results(self):
+        broad, narrow = self.config('broad.ini'), self.config('narrow.ini', max_rent=600)
+
+        with MockSpareroom(total_results=25) as mock:
+            delivered = self.run_searches(mock, [broad, narrow])
+
+            # The narrow search never ran
+            self.assertEqual(mock.requests['search'], 1)
+
+        broad_results, narrow_results = delivered[(broad,)], delivered[(narrow,)]
+
+        self.assertTrue(narrow_results)
+        self.assertTrue(all(result.rent <= 600 for result in narrow_results))
+        self.assertTrue(all(result.search == narrow for result in narrow_results))
+        self.assertEqual({result.key for result in narrow_results},
+                         {result.key for result in broad_results if result.rent <= 600})
+        self.assertTrue(any(result.rent > 600 for result in broad_results))
+
+    def test_non_subsumable_pair_is_searched_apart(self):
+        near, far = self.config('near.ini', max_rent=600), self.config('far.ini', miles_from_max=2)
+
+        with MockSpareroom(total_results=25) as mock:
+            delivered = self.run_searches(mock, [near, far])
+
+            self.assertEqual(mock.requests['search'], 2)
+
+        self.assertEqual(set(delivered), {(near,), (far,)})
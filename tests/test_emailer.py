@@ -0,0 +1,143 @@
+# Standard library imports
+import socketserver
+import threading
+import unittest
+
+# Local imports
+from spareroomScraper.emailer import MailDispatcher
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    """ A local SMTP server that keeps the messages it is sent.
+        The first `failures` messages are turned down with a 451.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, failures=0):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+
+        self.failures = failures
+        self.connections = 0
+        self.messages = []
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+
+        with server.lock:
+            server.connections += 1
+
+        self.reply('220 localhost ready')
+
+        while True:
+            line = self.rfile.readline()
+
+            if not line:
+                return
+
+            verb = line.decode('ascii').strip().split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.receive_message()
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def receive_message(self):
+        server = self.server
+        lines = []
+
+        while True:
+            line = self.rfile.readline()
+
+            if line in (b'.\r\n', b''):
+                break
+
+            lines.append(line)
+
+        with server.lock:
+            if server.failures:
+                server.failures -= 1
+                self.reply('451 Try again later')
+                return
+
+            server.messages.append(b''.join(lines))
+
+        self.reply('250 OK')
+
+
+class MailDispatcherTest(unittest.TestCase):
+
+    def start_server(self, failures=0):
+        server = SmtpStandIn(failures)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+
+        self.addCleanup(stop)
+
+        return server
+
+    def dispatcher(self, server):
+        dispatcher = MailDispatcher('127.0.0.1', server.port, 'scraper@localhost', '',
+                                    ['a@localhost'], security='none', retries=2,
+                                    retry_delay=0, timeout=5)
+        self.addCleanup(dispatcher.close)
+
+        return dispatcher
+
+    def test_digests_share_one_connection(self):
+        server = self.start_server()
+        dispatcher = self.dispatcher(server)
+
+        for receiver in ('a@localhost', 'b@localhost', 'c@localhost'):
+            dispatcher.queue('<p>{}</p>'.format(receiver), receiver)
+
+        self.assertEqual(dispatcher.dispatch(), 3)
+        self.assertEqual(len(server.messages), 3)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(dispatcher.as_dict(), {'sent': 3, 'retried': 0, 'connections': 1})
+
+    def test_temporary_failure_is_retried(self):
+        server = self.start_server(failures=1)
+        dispatcher = self.dispatcher(server)
+
+        dispatcher.queue('<p>results</p>')
+
+        self.assertEqual(dispatcher.dispatch(), 1)
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(dispatcher.retried, 1)
+        # The retry goes over a fresh connection
+        self.assertEqual(server.connections, 2)
+
+    def test_timeout_is_passed_on(self):
+        server = self.start_server()
+        dispatcher = self.dispatcher(server)
+
+        self.assertEqual(dispatcher._connect().timeout, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
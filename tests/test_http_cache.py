@@ -0,0 +1,97 @@
+# Standard library imports
+from contextlib import redirect_stdout
+import glob
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+# Local imports
+from benchmarks.mock_server import LAST_MODIFIED, MockSpareroom, PAGE_SIZE
+from benchmarks.run import PAYLOAD_CONFIG, CountingSink
+from spareroomScraper.http_cache import HttpCache
+from spareroomScraper.politeness import PolitenessScheduler
+from spareroomScraper.search import Search
+from spareroomScraper.transport import Transport
+
+
+class RevalidatingSpareroom(MockSpareroom):
+    """ A MockSpareroom whose result pages answer conditional
+        requests with a 304, like its advert pages do.
+    """
+
+    def _handler_class(self):
+        base = super()._handler_class()
+
+        class Handler(base):
+
+            def _results_page(self, query):
+                if ('search_id' in query and
+                        self.headers.get('If-Modified-Since') == LAST_MODIFIED):
+                    return self._send(304, '', [('Last-Modified', LAST_MODIFIED)])
+
+                super()._results_page(query)
+
+            def _send(self, status, body, headers=()):
+                if status == 200:
+                    headers = list(headers) + [('Last-Modified', LAST_MODIFIED)]
+
+                super()._send(status, body, headers)
+
+        return Handler
+
+
+class HttpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.mock = RevalidatingSpareroom(total_results=25).start()
+        self.addCleanup(self.mock.stop)
+
+        # Every response is revalidated
+        self.cache = HttpCache(self.directory)
+        self.addCleanup(self.cache.close)
+
+    def search(self):
+        transport = Transport(scheduler=PolitenessScheduler(rate=1e6, burst=1e6),
+                              cache=self.cache)
+        sink = CountingSink()
+
+        with redirect_stdout(io.StringIO()):
+            search = Search(PAYLOAD_CONFIG, 3, PAGE_SIZE, transport=transport,
+                            domain=self.mock.url)
+            search.search(sinks=[sink])
+
+        return search, sink.results
+
+    def test_revalidated_pages_come_from_the_cache(self):
+        self.search()
+        search, results = self.search()
+
+        self.assertEqual(results, 25)
+        self.assertGreater(self.cache.revalidations, 0)
+
+    def test_lost_body_is_fetched_again(self):
+        self.search()
+
+        for body in glob.glob(os.path.join(self.directory, '*.z')):
+            os.remove(body)
+
+        search, results = self.search()
+
+        self.assertEqual(results, 25)
+        self.assertFalse(search.markup_changed)
+        self.assertEqual(self.cache.revalidations, 0)
+
+        # The pages are cached again
+        search, results = self.search()
+
+        self.assertEqual(results, 25)
+        self.assertGreater(self.cache.revalidations, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+# Standard library imports
+import unittest
+
+# Local imports
+from spareroomScraper.metrics import Metrics
+
+
+class PrometheusExportTest(unittest.TestCase):
+
+    def test_families_are_not_interleaved(self):
+        metrics = Metrics()
+        metrics.observe('fetch_seconds', 0.5, route='page')
+        metrics.observe('fetch_seconds', 0.25, route='advert')
+        metrics.increment('requests', route='page')
+
+        self.assertEqual(metrics.to_prometheus().splitlines(), [
+            '# TYPE spareroom_fetch_seconds summary',
+            'spareroom_fetch_seconds_count{route="advert"} 1',
+            'spareroom_fetch_seconds_sum{route="advert"} 0.25',
+            'spareroom_fetch_seconds_count{route="page"} 1',
+            'spareroom_fetch_seconds_sum{route="page"} 0.5',
+            '# TYPE spareroom_fetch_seconds_max gauge',
+            'spareroom_fetch_seconds_max{route="advert"} 0.25',
+            'spareroom_fetch_seconds_max{route="page"} 0.5',
+            '# TYPE spareroom_requests counter',
+            'spareroom_requests{route="page"} 1',
+        ])
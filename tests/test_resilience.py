@@ -0,0 +1,210 @@
+# Standard library imports
+import unittest
+
+# Third party imports
+import requests
+
+# Local imports
+from benchmarks.mock_server import MockSpareroom
+from spareroomScraper.custom_exceptions import CircuitOpen
+from spareroomScraper.politeness import PolitenessScheduler
+from spareroomScraper.resilience import CircuitBreaker, RetryPolicy
+from spareroomScraper.transport import Transport
+
+
+HOST = 'spareroom.test'
+URL = 'http://{}/flatshare/'.format(HOST)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSession:
+    """ Answers every request with the next of a list of
+        status codes, or raises it if it is an exception.
+    """
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def get(self, url, **kwargs):
+        outcome = self.outcomes.pop(0)
+
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        response = requests.Response()
+        response.status_code = outcome
+        response.url = url
+        response.headers['Retry-After'] = '0'
+        response._content = b''
+
+        return response
+
+    def close(self):
+        pass
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=self.clock)
+
+    def trip(self):
+        self.breaker.record_failure(HOST)
+        self.breaker.record_failure(HOST)
+
+    def test_opens_after_threshold(self):
+        self.trip()
+
+        self.assertEqual(self.breaker.state(HOST), 'open')
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_request(HOST)
+
+    def test_lets_a_single_probe_through(self):
+        self.trip()
+        self.clock.now = 10
+
+        self.assertTrue(self.breaker.before_request(HOST))
+        self.assertEqual(self.breaker.state(HOST), 'half_open')
+
+        # Everyone else waits for the probe
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_request(HOST)
+
+    def test_probe_success_closes(self):
+        self.trip()
+        self.clock.now = 10
+        self.breaker.before_request(HOST)
+
+        self.breaker.record_success(HOST)
+
+        self.assertEqual(self.breaker.state(HOST), 'closed')
+        self.assertFalse(self.breaker.before_request(HOST))
+
+    def test_probe_failure_reopens(self):
+        self.trip()
+        self.clock.now = 10
+        self.breaker.before_request(HOST)
+
+        self.assertTrue(self.breaker.record_failure(HOST))
+
+        self.assertEqual(self.breaker.state(HOST), 'open')
+        self.assertEqual(self.breaker.trips, 2)
+
+        self.clock.now = 20
+        self.assertTrue(self.breaker.before_request(HOST))
+
+
+class TransportProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=self.clock)
+        self.transport = Transport(scheduler=PolitenessScheduler(rate=1e6, burst=1e6),
+                                   retry_policy=RetryPolicy(retries=0),
+                                   circuit_breaker=self.breaker)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def probe(self, outcome):
+        """ Trip the circuit, wait for the probe and send it. """
+
+        self.breaker.record_failure(HOST)
+        self.clock.now += 10
+        self.transport.session = FakeSession([outcome])
+
+        return self.transport._send_with_retries(URL, None, None)
+
+    def test_success_closes(self):
+        self.assertEqual(self.probe(200).status_code, 200)
+        self.assertEqual(self.breaker.state(HOST), 'closed')
+
+    def test_server_error_reopens(self):
+        self.assertEqual(self.probe(503).status_code, 503)
+        self.assertEqual(self.breaker.state(HOST), 'open')
+
+    def test_too_many_requests_reopens(self):
+        self.assertEqual(self.probe(429).status_code, 429)
+        self.assertEqual(self.breaker.state(HOST), 'open')
+
+    def test_connection_error_reopens(self):
+        with self.assertRaises(requests.ConnectionError):
+            self.probe(requests.ConnectionError())
+
+        self.assertEqual(self.breaker.state(HOST), 'open')
+
+    def test_any_other_exception_reopens(self):
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.probe(requests.exceptions.ChunkedEncodingError())
+
+        self.assertEqual(self.breaker.state(HOST), 'open')
+
+    def test_too_many_requests_does_not_count_when_closed(self):
+        self.transport.session = FakeSession([429])
+        self.transport._send_with_retries(URL, None, None)
+
+        self.assertEqual(self.breaker.state(HOST), 'closed')
+
+
+
+class MockSpareroomRecoveryTest(unittest.TestCase):
+    """ A host that fails, then recovers, against the mock server. """
+
+    def setUp(self):
+        self.mock = MockSpareroom(error_rate=1.0).start()
+        self.addCleanup(self.mock.stop)
+
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=self.clock)
+        self.transport = Transport(scheduler=PolitenessScheduler(rate=1e6, burst=1e6),
+                                   retry_policy=RetryPolicy(retries=0),
+                                   circuit_breaker=self.breaker)
+        self.addCleanup(self.transport.close)
+
+        self.url = self.mock.url + 'flatshare/'
+        self.host = PolitenessScheduler.host_of(self.url)
+
+    def get(self):
+        return self.transport.get(self.url)
+
+    def test_recovers_after_the_reset_timeout(self):
+        self.get()
+        self.get()
+
+        self.assertEqual(self.breaker.state(self.host), 'open')
+        with self.assertRaises(CircuitOpen):
+            self.get()
+
+        self.mock.error_rate = 0
+        self.clock.now = 10
+
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.breaker.state(self.host), 'closed')
+
+    def test_throttled_probe_waits_for_another_timeout(self):
+        self.get()
+        self.get()
+
+        self.mock.error_status = 429
+        self.clock.now = 10
+
+        self.assertEqual(self.get().status_code, 429)
+        self.assertEqual(self.breaker.state(self.host), 'open')
+
+        self.mock.error_rate = 0
+        self.clock.now = 20
+
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.breaker.state(self.host), 'closed')
+
+
+if __name__ == '__main__':
+    unittest.main()
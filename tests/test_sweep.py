@@ -0,0 +1,106 @@
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+# Local imports
+from benchmarks.mock_server import MockSpareroom, PAGE_SIZE
+from benchmarks.run import PAYLOAD_CONFIG, CountingSink, _unlimited_transport
+from spareroomScraper.async_search import AsyncSearchEngine
+from spareroomScraper.custom_exceptions import InvalidPayload
+from spareroomScraper.sweep import PayloadSweep, parse_sweep_values
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SWEEP = '''
+[sweep]
+search = E1, N1
+min_rent/max_rent = 400/600, 600/800
+miles_from_max = 1..5 step 2
+'''
+
+
+class ParseSweepValuesTest(unittest.TestCase):
+
+    def test_list(self):
+        self.assertEqual(parse_sweep_values(('search',), 'E1, N1,,SE1 '),
+                         [('E1',), ('N1',), ('SE1',)])
+
+    def test_range(self):
+        self.assertEqual(parse_sweep_values(('max_rent',), '400..1000 step 200'),
+                         [('400',), ('600',), ('800',), ('1000',)])
+        self.assertEqual(parse_sweep_values(('miles_from_max',), '1..3'),
+                         [('1',), ('2',), ('3',)])
+
+    def test_ranges_and_values_mix(self):
+        self.assertEqual(parse_sweep_values(('miles_from_max',), '0, 1..5 step 2, 10'),
+                         [('0',), ('1',), ('3',), ('5',), ('10',)])
+
+    def test_several_items(self):
+        self.assertEqual(parse_sweep_values(('min_rent', 'max_rent'), '400/600, 600 / 800'),
+                         [('400', '600'), ('600', '800')])
+
+    def test_unusable_values(self):
+        for names, value in [(('max_rent',), '400..1000 step many'),
+                             (('max_rent',), '1000..400'),
+                             (('max_rent',), '400..1000 step 0'),
+                             (('min_rent', 'max_rent'), '400/600, 800'),
+                             (('search',), ' , ')]:
+            with self.assertRaises(ValueError):
+                parse_sweep_values(names, value)
+
+
+class PayloadSweepTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.config_file = os.path.join(directory, 'sweep.ini')
+        shutil.copy(os.path.join(ROOT, PAYLOAD_CONFIG), self.config_file)
+
+        with open(self.config_file, 'a') as config_file:
+            config_file.write(SWEEP)
+
+    def test_variants_in_product_order(self):
+        sweep = PayloadSweep(self.config_file)
+
+        # The compiled payloads print their warnings
+        with redirect_stdout(io.StringIO()):
+            variants = list(sweep.variants())
+
+        self.assertEqual(len(sweep), 12)
+        self.assertEqual([variant.index for variant in variants], list(range(12)))
+        self.assertEqual(
+            [(payload['search'], payload['min_rent'], payload['max_rent'], payload['miles_from_max'])
+             for payload in (variant.compiled.as_dict() for variant in variants)],
+            [(search, min_rent, max_rent, miles)
+             for search in ('E1', 'N1')
+             for min_rent, max_rent in (('400', '600'), ('600', '800'))
+             for miles in ('1', '3', '5')])
+        self.assertEqual(variants[0].label,
+                         'search=E1, min_rent=400, max_rent=600, miles_from_max=1')
+
+    def test_max_variants(self):
+        self.assertEqual(len(PayloadSweep(self.config_file, max_variants=12)), 12)
+
+        with self.assertRaises(InvalidPayload) as raised:
+            PayloadSweep(self.config_file, max_variants=11)
+
+        self.assertIn('12 combinations', raised.exception.errors[0])
+
+    def test_engine_turns_down_big_sweeps(self):
+        with MockSpareroom(total_results=25) as mock:
+            engine = AsyncSearchEngine(transport=_unlimited_transport(), domain=mock.url,
+                                       max_sweep_variants=11)
+
+            with redirect_stdout(io.StringIO()):
+                outcomes = engine.run([self.config_file], 1, PAGE_SIZE,
+                                      lambda search: [CountingSink()])
+
+            self.assertIsInstance(outcomes[self.config_file], InvalidPayload)
+            self.assertEqual(mock.requests, {})